@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Backfill ccnotify.db from Claude Code transcripts and history.jsonl.
+
+The hooks only record turns from the moment they were installed, and events
+they lost are gone. This rebuilds prompt rows from what Claude Code keeps on
+disk:
+
+  ~/.claude/projects/*/*.jsonl  every real user prompt starts a job; the job
+                                stops at the last entry before the next prompt,
+                                and is marked as waiting on the user when the
+                                next prompt came more than IDLE_SECONDS later
+                                (when Claude Code sends its idle notification)
+  ~/.claude/history.jsonl       prompts of sessions whose transcript is gone;
+                                their duration is unknown, so they are closed
+                                the moment they start and recorded in prompt_end
+                                ('unknown'), which keeps them out of the rollups
+                                and duration sketches
+
+Files are parsed in a process pool and staged with large executemany batches.
+One transaction then inserts every staged prompt that doesn't already exist.
+The natural key is (session_id, created_at), matched within MATCH_SECONDS of
+hook-recorded and archived rows, so re-runs and sessions the hooks saw insert
+nothing twice. Sequence numbers, rollups and duration sketches are recomputed
+for what changed.
+
+Usage: ccnotify.py backfill [--dir PATH] [--history PATH] [--workers N] [--dry-run]
+"""
+
+import argparse
+import calendar
+import glob
+import os
+import sys
+import time
+
+import ccnotify
+import durations
+import history
+import retention
+import rollups
+import transcripts
+
+IDLE_SECONDS = 60
+# Hook rows are stamped when the hook runs, a moment after the transcript entry
+MATCH_SECONDS = 5
+BATCH_SIZE = 20000
+
+
+def _epoch(at):
+    return calendar.timegm(time.strptime(at, "%Y-%m-%d %H:%M:%S"))
+
+
+def _stamp(epoch):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(epoch))
+
+
+def prompt_text(entry):
+    """Text of a prompt the user typed, or None for anything else (tool results,
+    meta and compaction entries, subagent turns)."""
+    if entry.get("isSidechain") or entry.get("isCompactSummary"):
+        return None
+    return transcripts._first_user_text(entry)
+
+
+def _close(job, next_at):
+    created_at, prompt, cwd, last_at = job
+    wait = None
+    if next_at is None or _epoch(next_at) - _epoch(last_at) > IDLE_SECONDS:
+        wait = _stamp(_epoch(last_at) + IDLE_SECONDS)
+    return created_at, prompt, cwd, last_at, wait
+
+
+def parse_transcript(path):
+    """(session_id, [(created_at, prompt, cwd, stoped_at, lastWaitUserAt), ...]) for one file."""
+    import json
+
+    session_id = os.path.splitext(os.path.basename(path))[0]
+    rows, job, cwd = [], None, None
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(entry, dict):
+                continue
+            cwd = entry.get("cwd") or cwd
+            at = transcripts._utc(entry.get("timestamp"))
+            if not at:
+                continue
+            text = prompt_text(entry)
+            if text is not None:
+                if job:
+                    rows.append(_close(job, at))
+                job = [at, text, cwd, at]
+            elif job and at > job[3]:
+                job[3] = at
+    if job:
+        rows.append(_close(job, None))
+    return session_id, rows
+
+
+def history_rows(path, skip_sessions):
+    """Prompt rows from history.jsonl for sessions without a transcript, ended as 'unknown'."""
+    if not os.path.exists(path):
+        return []
+    rows = []
+    with history.HistoryFile(path) as h:
+        for entry in h.entries():
+            session_id = entry.get("sessionId")
+            if not session_id or session_id in skip_sessions or "timestamp" not in entry:
+                continue
+            at = _stamp(entry["timestamp"] / 1000)
+            rows.append((session_id, at, entry.get("display") or "", entry.get("project"), at, None,
+                         "unknown"))
+    return rows
+
+
+class Backfill:
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.execute("DROP TABLE IF EXISTS temp.backfill_rows")
+        self.conn.execute(
+            """CREATE TEMP TABLE backfill_rows (
+                   session_id TEXT NOT NULL,
+                   created_at DATETIME NOT NULL,
+                   prompt TEXT,
+                   cwd TEXT,
+                   stoped_at DATETIME,
+                   lastWaitUserAt DATETIME,
+                   reason TEXT  -- prompt_end reason of jobs without a real duration
+               )"""
+        )
+        self.staged = 0
+        self._batch = []
+
+    def stage(self, rows):
+        self._batch.extend(rows)
+        if len(self._batch) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._batch:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO temp.backfill_rows VALUES (?, ?, ?, ?, ?, ?, ?)", self._batch
+                )
+            self.staged += len(self._batch)
+            self._batch = []
+
+    def commit(self):
+        """Insert the staged prompts that aren't recorded yet; returns how many were added."""
+        self.flush()
+        rows = retention.prompt_rows_sql(self.conn)
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS temp.idx_backfill_rows ON backfill_rows (session_id, created_at)"
+            )
+            # Every existing row (hot or archived) of the sessions being backfilled
+            self.conn.execute("DROP TABLE IF EXISTS temp.backfill_known")
+            self.conn.execute(
+                f"""CREATE TEMP TABLE backfill_known AS
+                    SELECT session_id, julianday(created_at) AS jd FROM {rows}
+                    WHERE session_id IN (SELECT session_id FROM temp.backfill_rows)"""
+            )
+            self.conn.execute("CREATE INDEX temp.idx_backfill_known ON backfill_known (session_id, jd)")
+            # AUTOINCREMENT ids only grow, so everything above this is inserted below
+            (last_id,) = self.conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'prompt'"
+            ).fetchone()
+            added = self.conn.execute(
+                """INSERT INTO prompt (session_id, created_at, prompt, cwd, stoped_at, lastWaitUserAt)
+                   SELECT session_id, created_at, prompt, cwd, stoped_at, lastWaitUserAt
+                   FROM temp.backfill_rows AS s
+                   WHERE NOT EXISTS (
+                       SELECT 1 FROM temp.backfill_known AS k
+                       WHERE k.session_id = s.session_id
+                         AND k.jd BETWEEN julianday(s.created_at) - :tolerance
+                                      AND julianday(s.created_at) + :tolerance
+                   )
+                   GROUP BY session_id, created_at
+                   ORDER BY created_at""",
+                {"tolerance": MATCH_SECONDS / 86400},
+            ).rowcount
+            if added:
+                self.conn.execute(
+                    """INSERT OR REPLACE INTO prompt_end (prompt_id, reason)
+                       SELECT p.id, s.reason FROM prompt AS p
+                       JOIN temp.backfill_rows AS s USING (session_id, created_at)
+                       WHERE p.id > ? AND s.reason IS NOT NULL""",
+                    (last_id,),
+                )
+                self._renumber()
+            self.conn.execute("DROP TABLE temp.backfill_known")
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        if added:
+            self._refresh_status()
+        return added
+
+    def _refresh_status(self):
+        """Rewrite the status-line cache of renumbered sessions, which still shows the old job#."""
+        import statusline
+
+        for session_id, seq in self.conn.execute(
+            """SELECT session_id, seq FROM session_seq
+               WHERE session_id IN (SELECT session_id FROM temp.backfill_rows)"""
+        ):
+            job = statusline.load(session_id)
+            if job and job[0] != seq:
+                statusline.save(session_id, seq, *job[1:])
+
+    def _renumber(self):
+        """Recompute seq in time order for the sessions that gained rows.
+
+        Numbering runs over archived rows too, so they are renumbered with the hot ones.
+        """
+        rows = retention.prompt_rows_sql(self.conn)
+        self.conn.execute("DROP TABLE IF EXISTS temp.backfill_seq")
+        self.conn.execute(
+            f"""CREATE TEMP TABLE backfill_seq AS
+                SELECT id, session_id,
+                       ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY created_at, id) AS seq
+                FROM {rows}
+                WHERE session_id IN (SELECT session_id FROM temp.backfill_rows)"""
+        )
+        tables = ["prompt"] + [
+            retention.partition_table(month)
+            for (month,) in self.conn.execute("SELECT month FROM prompt_archive").fetchall()
+        ]
+        for table in tables:
+            self.conn.execute(
+                f"""UPDATE {table} SET seq = n.seq FROM temp.backfill_seq AS n
+                    WHERE {table}.id = n.id AND {table}.seq IS NOT n.seq"""
+            )
+        self.conn.execute(
+            """INSERT INTO session_seq (session_id, seq)
+               SELECT session_id, MAX(seq) FROM temp.backfill_seq GROUP BY session_id
+               ON CONFLICT (session_id) DO UPDATE SET seq = MAX(seq, excluded.seq)"""
+        )
+        self.conn.execute("DROP TABLE temp.backfill_seq")
+
+
+def _parse_all(paths, workers):
+    if workers == 0:
+        yield from map(parse_transcript, paths)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(parse_transcript, paths, chunksize=16)
+
+
+def backfill(conn, projects_dir=None, history_file=None, workers=None, dry_run=False):
+    """Backfill from transcripts and history.jsonl; returns a dict of counts."""
+    projects_dir = projects_dir or transcripts.projects_dir()
+    history_file = history_file or history.history_path()
+    paths = sorted(glob.glob(os.path.join(glob.escape(projects_dir), "*", "*.jsonl")))
+
+    loader = Backfill(conn)
+    sessions = set()
+    for session_id, rows in _parse_all(paths, workers):
+        sessions.add(session_id)
+        loader.stage((session_id, *row, None) for row in rows)
+    loader.stage(history_rows(history_file, sessions))
+    loader.flush()
+
+    counts = {"files": len(paths), "staged": loader.staged, "added": 0}
+    if not dry_run and loader.staged:
+        counts["added"] = loader.commit()
+        if counts["added"]:
+            rollups.rebuild(conn)
+            durations.rebuild(conn)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ccnotify.py backfill",
+                                     description="Rebuild prompt history from transcripts.")
+    parser.add_argument("--dir", default=transcripts.projects_dir(), help="default: %(default)s")
+    parser.add_argument("--history", default=history.history_path(), help="default: %(default)s")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="parser processes (0: parse in this process)")
+    parser.add_argument("--dry-run", action="store_true", help="parse and count, insert nothing")
+    args = parser.parse_args(argv)
+
+    tracker = ccnotify.ClaudePromptTracker()
+    started = time.perf_counter()
+    try:
+        counts = backfill(tracker._connect(), args.dir, args.history, args.workers, args.dry_run)
+    finally:
+        tracker.close()
+    seconds = round(time.perf_counter() - started, 2)
+    ccnotify.log.info("backfill_done", seconds=seconds, **counts)
+    print(f"{counts['files']} transcript(s), {counts['staged']} prompt(s) found, "
+          f"{counts['added']} added in {seconds}s", file=sys.stderr)
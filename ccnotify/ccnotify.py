@@ -4,151 +4,687 @@ Claude Code Notify
 https://github.com/dazuiba/CCNotify
 """
 
-import json
-import logging
+# Hooks start a fresh interpreter every turn, so anything heavier than os/sys/time
+# is imported where it's needed; test_ccnotify.TestImportBudget keeps it that way.
 import os
-import sqlite3
-import subprocess
 import sys
 import time
-from datetime import datetime
-from logging.handlers import TimedRotatingFileHandler
 
 FLASH_COLOR = "4a3a00"
 BG_COLOR = "2d2d3d"
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# Environment the hook forwards to the daemon so it can act on the right session
+FORWARDED_ENV = ("ITERM_SESSION_ID",)
+DAEMON_TIMEOUT = 0.5
 
-def _parse_iterm_session_id():
+# Seconds a writer waits on another hook's lock before giving up
+BUSY_TIMEOUT = 5.0
+# Attempts per event while the database stays locked past BUSY_TIMEOUT; after the
+# last one the event is spooled to disk and replayed later (see spool.py)
+WRITE_ATTEMPTS = 3
+WRITE_BACKOFF = 0.1
+
+# The daemon answers once the event is committed or spooled, which can take as long
+# as the write retries; it hands back events it hasn't started within DAEMON_TIMEOUT,
+# and cuts off lock waits notifyd.HANDLE_MARGIN before this runs out
+DAEMON_REPLY_TIMEOUT = DAEMON_TIMEOUT + BUSY_TIMEOUT * WRITE_ATTEMPTS
+
+# CCNOTIFY_TRACE=1 records where each invocation spends its time (see tracing.py)
+TRACING = bool(os.environ.get("CCNOTIFY_TRACE"))
+
+
+class _LazyEventLog:
+    """Forward log.<level>(event, **fields) to eventlog, importing it on first use.
+
+    The file set with to() is opened, and its writer thread started, on the first
+    record too, so a hook that never logs never imports eventlog or spawns a thread.
+    """
+
+    def __init__(self):
+        self._path = None
+
+    def to(self, path):
+        self._path = path
+
+    def __getattr__(self, level):
+        import eventlog
+        if self._path is not None:
+            path, self._path = self._path, None
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            eventlog.setup(path)
+        return getattr(eventlog, level)
+
+
+log = _LazyEventLog()
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, **attrs):
+    """Time a stage as a nested span when tracing is on; a shared no-op otherwise."""
+    if not TRACING:
+        return _NO_SPAN
+    import tracing
+    return tracing.span(name, **attrs)
+
+
+def _parse_iterm_session_id(environ=None):
     """Extract the session UUID from ITERM_SESSION_ID (format: 'w0t0p0:UUID')."""
-    raw = os.environ.get("ITERM_SESSION_ID", "")
+    if environ is None:
+        environ = os.environ
+    raw = environ.get("ITERM_SESSION_ID", "")
     if not raw:
         return "", ""
     uuid = raw.split(":")[-1] if ":" in raw else raw
     return raw, uuid
 
 
+# Schema history. Entry N upgrades PRAGMA user_version N -> N+1; only ever append.
+MIGRATIONS = [
+    [
+        """CREATE TABLE IF NOT EXISTS prompt (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            prompt TEXT,
+            cwd TEXT,
+            seq INTEGER,
+            stoped_at DATETIME,
+            lastWaitUserAt DATETIME
+        )""",
+    ],
+    [
+        # The MAX(seq) trigger scanned the whole session on every insert
+        "DROP TRIGGER IF EXISTS auto_increment_seq",
+        """CREATE TABLE session_seq (
+            session_id TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL
+        ) WITHOUT ROWID""",
+        """INSERT INTO session_seq (session_id, seq)
+           SELECT session_id, COALESCE(MAX(seq), 0) FROM prompt GROUP BY session_id""",
+        "CREATE INDEX idx_prompt_session_created ON prompt (session_id, created_at)",
+        """CREATE INDEX idx_prompt_open ON prompt (session_id, created_at)
+           WHERE stoped_at IS NULL""",
+    ],
+    [
+        # Notifications are committed here by the hook and delivered by outbox.py
+        """CREATE TABLE notification_outbox (
+            id INTEGER PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            iterm_session TEXT,
+            dedupe_key TEXT NOT NULL,
+            title TEXT NOT NULL,
+            subtitle TEXT NOT NULL,
+            cwd TEXT,
+            state TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            next_attempt_at REAL NOT NULL,
+            lease_until REAL,
+            delivered_at REAL,
+            last_error TEXT
+        )""",
+        """CREATE UNIQUE INDEX idx_outbox_dedupe ON notification_outbox (dedupe_key)
+           WHERE state = 'pending'""",
+        """CREATE INDEX idx_outbox_pending ON notification_outbox (session_id, id)
+           WHERE state = 'pending'""",
+    ],
+    [
+        # retention.py moves old prompts into per-month prompt_archive_YYYYMM tables
+        """CREATE TABLE cwd (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE
+        )""",
+        """CREATE TABLE prompt_archive (
+            month TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            row_count INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID""",
+    ],
+    [
+        # Usage rollups, kept current by the hooks (see rollups.py); stats never scans prompt
+        """CREATE TABLE rollup_daily (
+            project TEXT NOT NULL,
+            day TEXT NOT NULL,
+            jobs INTEGER NOT NULL DEFAULT 0,
+            agent_seconds INTEGER NOT NULL DEFAULT 0,
+            waits INTEGER NOT NULL DEFAULT 0,
+            wait_seconds INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (project, day)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX idx_rollup_daily_day ON rollup_daily (day)",
+        """CREATE TABLE rollup_session (
+            session_id TEXT PRIMARY KEY,
+            project TEXT,
+            first_at DATETIME,
+            last_at DATETIME,
+            jobs INTEGER NOT NULL DEFAULT 0,
+            agent_seconds INTEGER NOT NULL DEFAULT 0,
+            waits INTEGER NOT NULL DEFAULT 0,
+            wait_seconds INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID""",
+        "CREATE INDEX idx_rollup_session_last ON rollup_session (last_at)",
+    ],
+    [
+        # Contentless full-text index keyed by prompt.id. Archived rows keep their id,
+        # so retention.py can move them without reindexing; search.py joins back for text
+        "CREATE VIRTUAL TABLE prompt_fts USING fts5 (prompt, content='', tokenize='porter unicode61')",
+        """CREATE TRIGGER prompt_fts_insert AFTER INSERT ON prompt BEGIN
+               INSERT INTO prompt_fts (rowid, prompt) VALUES (new.id, new.prompt);
+           END""",
+        "INSERT INTO prompt_fts (rowid, prompt) SELECT id, prompt FROM prompt",
+        "CREATE INDEX idx_prompt_created ON prompt (created_at)",
+        "CREATE INDEX idx_prompt_cwd ON prompt (cwd, created_at)",
+    ],
+    [
+        # Transcript index maintained by transcripts.py; files are read from their last offset
+        """CREATE TABLE transcript_file (
+            path TEXT PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            inode INTEGER,
+            size INTEGER NOT NULL DEFAULT 0,
+            mtime_ns INTEGER NOT NULL DEFAULT 0,
+            offset INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID""",
+        """CREATE TABLE transcript_session (
+            session_id TEXT PRIMARY KEY,
+            project_dir TEXT,
+            cwd TEXT,
+            first_msg TEXT,
+            first_at DATETIME,
+            last_at DATETIME,
+            lines INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID""",
+        "CREATE INDEX idx_transcript_session_last ON transcript_session (last_at)",
+        """CREATE TABLE transcript_chunk (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,  -- never reused: stale postings must not match a new chunk
+            session_id TEXT NOT NULL,
+            path TEXT NOT NULL,
+            start_offset INTEGER NOT NULL,
+            end_offset INTEGER NOT NULL
+        )""",
+        "CREATE INDEX idx_transcript_chunk_path ON transcript_chunk (path)",
+        "CREATE VIRTUAL TABLE transcript_fts USING fts5 (text, content='', tokenize='porter unicode61')",
+    ],
+    [
+        # Stop notifications carry a group and are held briefly so outbox.py can merge a
+        # burst into one summary; summary_of points every merged row at the row it rode on
+        "ALTER TABLE notification_outbox ADD COLUMN group_key TEXT",
+        "ALTER TABLE notification_outbox ADD COLUMN prompt_id INTEGER",
+        "ALTER TABLE notification_outbox ADD COLUMN seconds INTEGER",
+        "ALTER TABLE notification_outbox ADD COLUMN summary_of INTEGER",
+        """CREATE INDEX idx_outbox_group ON notification_outbox (group_key, created_at)
+           WHERE state = 'pending'""",
+        """CREATE INDEX idx_outbox_summary ON notification_outbox (summary_of)
+           WHERE summary_of IS NOT NULL""",
+    ],
+    [
+        # Counters and histograms each process adds to when it exits (see metrics.py)
+        """CREATE TABLE metric (
+            name TEXT NOT NULL,
+            labels TEXT NOT NULL,
+            sample TEXT NOT NULL,
+            le TEXT NOT NULL,
+            value REAL NOT NULL,
+            PRIMARY KEY (name, labels, sample, le)
+        ) WITHOUT ROWID""",
+    ],
+    [
+        # Spans recorded with CCNOTIFY_TRACE=1 (see tracing.py); times in microseconds
+        """CREATE TABLE trace_span (
+            trace_id TEXT NOT NULL,
+            span_id INTEGER NOT NULL,
+            parent_id INTEGER,
+            name TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            start_us INTEGER NOT NULL,
+            duration_us INTEGER NOT NULL,
+            attrs TEXT,
+            PRIMARY KEY (trace_id, span_id)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX idx_trace_span_root ON trace_span (started_at) WHERE parent_id IS NULL",
+    ],
+    [
+        # worktree-manager's registry and port pool (see worktrees.py); ports is a
+        # comma-separated list, worktree_export remembers the JSON view last written
+        """CREATE TABLE worktree (
+            id TEXT PRIMARY KEY,
+            project TEXT NOT NULL,
+            repo_path TEXT,
+            branch TEXT NOT NULL,
+            branch_slug TEXT,
+            worktree_path TEXT,
+            ports TEXT NOT NULL DEFAULT '',
+            created_at TEXT,
+            validated_at TEXT,
+            agent_launched_at TEXT,
+            task TEXT,
+            pr_number INTEGER,
+            status TEXT NOT NULL DEFAULT 'active',
+            UNIQUE (project, branch)
+        )""",
+        "CREATE INDEX idx_worktree_path ON worktree (worktree_path)",
+        """CREATE TABLE worktree_port (
+            port INTEGER PRIMARY KEY,
+            allocated_at REAL NOT NULL
+        )""",
+        """CREATE TABLE worktree_export (
+            path TEXT PRIMARY KEY,
+            stat TEXT
+        ) WITHOUT ROWID""",
+    ],
+    [
+        # The Linear poller's cache (see linear.py): issues with an @claude comment,
+        # their comments, and the updatedAt each sync resumes from; labels is JSON
+        """CREATE TABLE linear_issue (
+            id TEXT PRIMARY KEY,
+            identifier TEXT NOT NULL,
+            title TEXT,
+            description TEXT,
+            state_name TEXT,
+            state_type TEXT,
+            labels TEXT NOT NULL DEFAULT '[]',
+            updated_at TEXT NOT NULL
+        )""",
+        """CREATE TABLE linear_comment (
+            id TEXT PRIMARY KEY,
+            issue_id TEXT NOT NULL,
+            body TEXT,
+            user_name TEXT,
+            created_at TEXT,
+            updated_at TEXT
+        )""",
+        "CREATE INDEX idx_linear_comment_issue ON linear_comment (issue_id, created_at)",
+        """CREATE TABLE linear_sync (
+            api_url TEXT PRIMARY KEY,
+            updated_at TEXT NOT NULL
+        ) WITHOUT ROWID""",
+    ],
+    [
+        # Job-duration DDSketches per project and per session (see durations.py)
+        """CREATE TABLE duration_sketch (
+            scope TEXT NOT NULL,
+            key TEXT NOT NULL,
+            jobs INTEGER NOT NULL,
+            sketch BLOB NOT NULL,
+            updated_at REAL,
+            PRIMARY KEY (scope, key)
+        )""",
+    ],
+    [
+        # Jobs closed without a Stop: by SessionEnd (its reason) or the stale-job sweep
+        # ('abandoned'). Keyed by prompt id, which archiving keeps, so rebuilds can
+        # leave their made-up durations out
+        """CREATE TABLE prompt_end (
+            prompt_id INTEGER PRIMARY KEY,
+            reason TEXT NOT NULL
+        )""",
+    ],
+    [
+        # Small bits of state, e.g. when hooks last swept abandoned jobs (retention.py)
+        """CREATE TABLE meta (
+            key TEXT PRIMARY KEY,
+            value
+        ) WITHOUT ROWID""",
+    ],
+]
+
+
+def notification_group(cwd):
+    """Name Stop notifications are merged under: the repo for a worktree-manager
+    worktree (<worktree base>/<repo>/<branch>), otherwise the directory name."""
+    if not cwd:
+        return "Claude Task"
+    base = os.path.expanduser(os.environ.get("CCNOTIFY_WORKTREE_BASE", "~/worktrees-qz"))
+    relative = os.path.relpath(cwd, base)
+    if not relative.startswith(os.pardir) and os.sep in relative:
+        return relative.split(os.sep, 1)[0]
+    return os.path.basename(cwd.rstrip("/")) or cwd
+
+
+def state_dir(environ=None):
+    """Where the database, event log, spool and status cache live: CCNOTIFY_STATE_DIR,
+    else next to the scripts. ~/.claude is often on a slow or synced volume; /dev/shm
+    or $XDG_STATE_HOME/ccnotify keeps every hook's writes on fast local disk."""
+    environ = os.environ if environ is None else environ
+    return os.path.expanduser(os.path.expandvars(environ.get("CCNOTIFY_STATE_DIR") or SCRIPT_DIR))
+
+
+def spool_dir():
+    # Spooled events belong to one database, so each shard gets its own spool
+    shard = Storage.from_env().shard
+    return os.path.join(state_dir(), "spool", shard) if shard else os.path.join(state_dir(), "spool")
+
+
+def log_path():
+    return os.path.join(state_dir(), "ccnotify.jsonl")
+
+
+def _socket_path():
+    return os.environ.get("CCNOTIFY_SOCKET") or os.path.join(SCRIPT_DIR, "ccnotify.sock")
+
+
+class _WriteTransaction:
+    """`with tracker._write() as conn:` works like `with conn:` but takes the write lock first.
+
+    BEGIN IMMEDIATE makes a contended hook wait in SQLite's busy handler up front
+    instead of failing when it upgrades from reader to writer mid-transaction.
+    Time spent waiting for the lock is added to tracker.lock_wait. With
+    tracker.deadline set, the wait ends there and fails as if the lock timed out.
+    """
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.conn = None
+        self.span = span("db")
+
+    def __enter__(self):
+        self.span.__enter__()
+        conn = self.tracker._connect()
+        deadline = self.tracker.deadline
+        if deadline is not None:
+            remaining = min(BUSY_TIMEOUT, deadline - time.monotonic())
+            if remaining <= 0:
+                import sqlite3
+                raise sqlite3.OperationalError("database is locked (handling deadline passed)")
+            conn.execute(f"PRAGMA busy_timeout = {int(remaining * 1000)}")
+        started = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        finally:
+            if deadline is not None:
+                conn.execute(f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT * 1000)}")
+        self.tracker.lock_wait += time.perf_counter() - started
+        self.conn = conn
+        return conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        finally:
+            self.span.__exit__(exc_type, exc, tb)
+        return False
+
+
+def _shard_name(name):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name) or "_"
+
+
+class Storage:
+    """Where ccnotify.db lives and how it is opened.
+
+    The target is a file path or an SQLite file: URI, chosen with CCNOTIFY_DB
+    (default: ccnotify.db in state_dir()). file:NAME?mode=memory&cache=shared is a
+    database that lives as long as a connection to it is open, for tests and
+    benchmarks. {host} and {project} in the target shard the database per machine
+    or per repo; the project is the notification group of the working directory,
+    which for a hook is the session's project.
+    """
+
+    def __init__(self, target, shard=""):
+        self.target = target
+        self.shard = shard
+        self.uri = target.startswith("file:")
+
+    @classmethod
+    def from_env(cls, environ=None, project=None):
+        """The configured storage; `project` names the {project} shard instead of the cwd."""
+        environ = os.environ if environ is None else environ
+        target = environ.get("CCNOTIFY_DB") or os.path.join(state_dir(environ), "ccnotify.db")
+        shard = []
+        if "{host}" in target:
+            shard.append(_shard_name(os.uname().nodename.split(".")[0]))
+            target = target.replace("{host}", shard[-1])
+        if "{project}" in target:
+            shard.append(_shard_name(project or notification_group(os.getcwd())))
+            target = target.replace("{project}", shard[-1])
+        if not target.startswith("file:"):
+            target = os.path.expanduser(os.path.expandvars(target))
+        return cls(target, "-".join(shard))
+
+    @classmethod
+    def in_memory(cls):
+        """A fresh shared-cache in-memory database private to this process."""
+        return cls(f"file:ccnotify-{os.getpid()}-{os.urandom(6).hex()}?mode=memory&cache=shared")
+
+    @property
+    def memory(self):
+        return self.target == ":memory:" or (self.uri and "mode=memory" in self.target)
+
+    @property
+    def path(self):
+        """The database file, or None for an in-memory database."""
+        if self.memory:
+            return None
+        if not self.uri:
+            return self.target
+        from urllib.parse import unquote, urlsplit
+        return unquote(urlsplit(self.target).path)
+
+    def connect(self):
+        import sqlite3
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.target, timeout=BUSY_TIMEOUT, uri=self.uri)
+        # Only takes effect on a new file; retention.py converts older ones. Setting it
+        # on a file that already has it waits for the write lock, so only new ones do
+        if not conn.execute("PRAGMA page_count").fetchone()[0]:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # WAL makes each commit one sequential append; NORMAL skips the per-commit
+        # fsync, which only risks the last few events on power loss, not corruption.
+        # An in-memory database keeps its own journal mode.
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+
 class ClaudePromptTracker:
-    def __init__(self):
-        self.db_path = os.path.join(SCRIPT_DIR, "ccnotify.db")
+    def __init__(self, db_path=None, storage=None):
+        # db_path is a file or a file: URI; CCNOTIFY_DB and CCNOTIFY_STATE_DIR pick the default
+        self.storage = storage or (Storage(db_path) if db_path else Storage.from_env())
+        self.db_path = self.storage.path
+        # Per-request context; the daemon swaps these for each forwarded hook
+        self.environ = os.environ
+        self.tty_path = "/dev/tty"
+        # When the event happened, if not now: dispatch() sets it for replayed events
+        self.event_at = None
+        self.enqueued = 0
+        self.lock_wait = 0.0
+        # time.monotonic() by which a write must hold the lock; the daemon sets it so each
+        # event is committed or spooled before the hook stops waiting for the answer
+        self.deadline = None
+        self.focus = None
+        self._conn = None
         self._setup_logging()
-        self._init_database()
 
-    def _setup_logging(self):
-        log_path = os.path.join(SCRIPT_DIR, "ccnotify.log")
-
-        handler = TimedRotatingFileHandler(
-            log_path,
-            when="midnight",
-            interval=1,
-            backupCount=1,
-            encoding="utf-8",
-        )
-        handler.setFormatter(logging.Formatter(
-            "%(asctime)s - %(levelname)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
-        ))
+    def _connect(self):
+        """Return the tracker's connection, opening and migrating it on first use."""
+        if self._conn is None:
+            self._conn = self.storage.connect()
+            try:
+                self._init_database()
+            except Exception:
+                # Don't keep an unmigrated connection: the next call retries the migration
+                self.close()
+                raise
+        return self._conn
+
+    def _write(self):
+        return _WriteTransaction(self)
+
+    def _now(self):
+        return time.time() if self.event_at is None else self.event_at
 
-        logger = logging.getLogger()
-        logger.setLevel(logging.INFO)
-        logger.addHandler(handler)
+    def _stamp(self):
+        """The event time as a UTC 'YYYY-MM-DD HH:MM:SS', like CURRENT_TIMESTAMP."""
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(self._now()))
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _setup_logging(self):
+        log.to(log_path())
 
     def _init_database(self):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS prompt (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT NOT NULL,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    prompt TEXT,
-                    cwd TEXT,
-                    seq INTEGER,
-                    stoped_at DATETIME,
-                    lastWaitUserAt DATETIME
-                )
-            """)
-
-            conn.execute("""
-                CREATE TRIGGER IF NOT EXISTS auto_increment_seq
-                AFTER INSERT ON prompt
-                FOR EACH ROW
-                BEGIN
-                    UPDATE prompt
-                    SET seq = (
-                        SELECT COALESCE(MAX(seq), 0) + 1
-                        FROM prompt
-                        WHERE session_id = NEW.session_id
-                    )
-                    WHERE id = NEW.id;
-                END
-            """)
+        """Bring the schema up to date; a no-op beyond one PRAGMA once it is current."""
+        conn = self._connect()
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= len(MIGRATIONS):
+            return
 
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-read under the write lock in case another hook migrated first
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for statements in MIGRATIONS[version:]:
+                for statement in statements:
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
             conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
 
     def handle_user_prompt_submit(self, data):
         session_id = data.get("session_id")
 
         # User is back — dismiss any pending notification for this session
-        _, session_uuid = _parse_iterm_session_id()
+        _, session_uuid = _parse_iterm_session_id(self.environ)
         if session_uuid:
-            subprocess.run(
-                ["terminal-notifier", "-remove", session_uuid],
-                check=False, capture_output=True
-            )
+            import subprocess
+            with span("notifier_remove"):
+                subprocess.run(
+                    ["terminal-notifier", "-remove", session_uuid],
+                    check=False, capture_output=True
+                )
 
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
-                "INSERT INTO prompt (session_id, prompt, cwd) VALUES (?, ?, ?)",
-                (session_id, data.get("prompt", ""), data.get("cwd", "")),
-            )
-            conn.commit()
+        import rollups
 
-        logging.info(f"Recorded prompt for session {session_id}")
+        with self._write() as conn:
+            previous = conn.execute(
+                """SELECT cwd, created_at, lastWaitUserAt FROM prompt WHERE session_id = ?
+                   ORDER BY created_at DESC, id DESC LIMIT 1""",
+                (session_id,),
+            ).fetchone()
+            seq = conn.execute(
+                """INSERT INTO session_seq (session_id, seq) VALUES (?, 1)
+                   ON CONFLICT (session_id) DO UPDATE SET seq = seq + 1
+                   RETURNING seq""",
+                (session_id,),
+            ).fetchone()[0]
+            created_at = conn.execute(
+                """INSERT INTO prompt (session_id, prompt, cwd, seq, created_at)
+                   VALUES (?, ?, ?, ?, ?)
+                   RETURNING created_at""",
+                (session_id, data.get("prompt", ""), data.get("cwd", ""), seq, self._stamp()),
+            ).fetchone()[0]
+            # The wait on the previous job ends now that the user has answered
+            if previous and previous[2]:
+                rollups.record_wait(conn, session_id, previous[0], previous[1],
+                                    previous[2], created_at)
+
+        import statusline
+
+        statusline.save(session_id, seq, self._now())
+        log.info("prompt_recorded", session_id=session_id, seq=seq)
 
     def handle_stop(self, data):
+        import durations
+        import rollups
+
         session_id = data.get("session_id")
 
-        with sqlite3.connect(self.db_path) as conn:
+        # Close the latest open job and read back what the notification needs in one statement
+        with self._write() as conn:
             row = conn.execute(
-                """SELECT id, created_at, cwd FROM prompt
-                   WHERE session_id = ? AND stoped_at IS NULL
-                   ORDER BY created_at DESC LIMIT 1""",
-                (session_id,),
+                """UPDATE prompt SET stoped_at = ?
+                   WHERE id = (
+                       SELECT id FROM prompt
+                       WHERE session_id = ? AND stoped_at IS NULL
+                       ORDER BY created_at DESC LIMIT 1
+                   )
+                   RETURNING id, seq, created_at, stoped_at, cwd,
+                       CAST(round((julianday(stoped_at) - julianday(created_at)) * 86400)
+                            AS INTEGER)""",
+                (self._stamp(), session_id),
             ).fetchone()
 
             if not row:
                 return
 
-            record_id, created_at, cwd = row
-
-            conn.execute(
-                "UPDATE prompt SET stoped_at = CURRENT_TIMESTAMP WHERE id = ?",
-                (record_id,),
-            )
-            conn.commit()
-
-            seq_row = conn.execute(
-                "SELECT seq FROM prompt WHERE id = ?", (record_id,)
-            ).fetchone()
-            seq = seq_row[0] if seq_row else 1
+            record_id, seq, created_at, stoped_at, cwd, seconds = row
+            seq = seq or 1
+            duration = self._format_duration(created_at, stoped_at)
+            rollups.record_job(conn, session_id, cwd, created_at, stoped_at)
+            subtitle = f"job#{seq} done, duration: {duration}"
+            if seconds is not None:
+                comparison = durations.describe(durations.record(conn, session_id, cwd, seconds))
+                if comparison:
+                    subtitle += f", {comparison}"
 
-            duration = self._calculate_duration_from_db(record_id)
-            self.send_notification(
+            self._enqueue_notification(
+                conn,
+                dedupe_key=f"stop:{record_id}",
+                session_id=session_id,
                 title=os.path.basename(cwd) if cwd else "Claude Task",
-                subtitle=f"job#{seq} done, duration: {duration}",
+                subtitle=subtitle,
                 cwd=cwd,
+                group_key=notification_group(cwd),
+                prompt_id=record_id,
+                seconds=seconds,
             )
 
-            logging.info(
-                f"Task completed for session {session_id}, job#{seq}, duration: {duration}"
-            )
+        import statusline
+
+        now = self._now()
+        statusline.save(session_id, seq, now - (seconds or 0), now)
+        log.info("job_stopped", session_id=session_id, seq=seq, duration=duration)
+
+    def handle_session_end(self, data):
+        import retention
+        import statusline
+
+        session_id = data.get("session_id")
+        reason = data.get("reason") or "other"
+
+        # Jobs the session never sent a Stop for (Ctrl-C, a crash) would stay open forever
+        with self._write() as conn:
+            ended = conn.execute(
+                """UPDATE prompt SET stoped_at = ?
+                   WHERE session_id = ? AND stoped_at IS NULL
+                   RETURNING id""",
+                (self._stamp(), session_id),
+            ).fetchall()
+            conn.executemany("INSERT OR REPLACE INTO prompt_end (prompt_id, reason) VALUES (?, ?)",
+                             [(prompt_id, reason) for (prompt_id,) in ended])
+            # Without the daemon nothing else runs the abandoned-job sweep
+            swept = retention.sweep_if_due(conn)
+
+        statusline.clear(session_id)
+        log.info("session_ended", session_id=session_id, reason=reason, closed=len(ended),
+                 abandoned=swept)
 
     def handle_notification(self, data):
         session_id = data.get("session_id")
         message = data.get("message", "")
         cwd = data.get("cwd", "")
 
-        logging.info(f"[NOTIFICATION] session={session_id}, message='{message}'")
+        log.info("notification_received", session_id=session_id, message=message)
 
         message_lower = message.lower()
 
@@ -156,17 +692,16 @@ class ClaudePromptTracker:
         is_waiting = ("waiting for your input" in message_lower
                       or "waiting for input" in message_lower)
         if is_waiting:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._write() as conn:
                 conn.execute(
-                    """UPDATE prompt SET lastWaitUserAt = CURRENT_TIMESTAMP
+                    """UPDATE prompt SET lastWaitUserAt = ?
                        WHERE id = (
                            SELECT id FROM prompt WHERE session_id = ?
                            ORDER BY created_at DESC LIMIT 1
                        )""",
-                    (session_id,),
+                    (self._stamp(), session_id),
                 )
-                conn.commit()
-            logging.info(f"Updated lastWaitUserAt for session {session_id}")
+            log.info("wait_recorded", session_id=session_id)
             return
 
         if "permission" in message_lower:
@@ -176,27 +711,39 @@ class ClaudePromptTracker:
         else:
             subtitle = "Notification"
 
-        self.send_notification(
-            title=os.path.basename(cwd) if cwd else "Claude Task",
-            subtitle=subtitle,
-            cwd=cwd,
-        )
-        logging.info(f"Notification sent for session {session_id}: {subtitle}")
-
-    def _calculate_duration_from_db(self, record_id):
-        with sqlite3.connect(self.db_path) as conn:
-            row = conn.execute(
-                "SELECT created_at, stoped_at FROM prompt WHERE id = ?",
-                (record_id,),
-            ).fetchone()
+        with self._write() as conn:
+            self._enqueue_notification(
+                conn,
+                dedupe_key=f"notification:{session_id}:{message}",
+                session_id=session_id,
+                title=os.path.basename(cwd) if cwd else "Claude Task",
+                subtitle=subtitle,
+                cwd=cwd,
+            )
+        log.info("notification_queued", session_id=session_id, subtitle=subtitle)
 
-            if row and row[1]:
-                return self._format_duration(row[0], row[1])
+    def _enqueue_notification(self, conn, dedupe_key, session_id, title, subtitle, cwd,
+                              group_key=None, prompt_id=None, seconds=None):
+        """Queue a notification inside the caller's transaction; identical pending ones collapse.
 
-        return "Unknown"
+        Rows with a group_key are held and merged with the rest of their group by
+        outbox.py; rows without one (permission prompts) go out on the next drain.
+        """
+        now = time.time()
+        conn.execute(
+            """INSERT OR IGNORE INTO notification_outbox
+               (session_id, iterm_session, dedupe_key, title, subtitle, cwd,
+                created_at, next_attempt_at, group_key, prompt_id, seconds)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (session_id, self.environ.get("ITERM_SESSION_ID") or None, dedupe_key,
+             title, subtitle, cwd, now, now, group_key, prompt_id, seconds),
+        )
+        self.enqueued += 1
 
     @staticmethod
     def _format_duration(start_time, end_time):
+        from datetime import datetime
+
         try:
             start_dt = datetime.fromisoformat(start_time.replace("Z", "+00:00"))
             end_dt = datetime.fromisoformat(end_time.replace("Z", "+00:00"))
@@ -212,66 +759,63 @@ class ClaudePromptTracker:
                 return f"{hours}h{minutes}m" if minutes else f"{hours}h"
             return f"{minutes}m{seconds}s" if seconds else f"{minutes}m"
         except Exception as e:
-            logging.error(f"Error calculating duration: {e}")
+            log.error("duration_error", error=str(e))
             return "Unknown"
 
     def _is_session_focused(self):
         """Check if this iTerm2 session is the active one in the frontmost window."""
-        _, session_uuid = _parse_iterm_session_id()
+        _, session_uuid = _parse_iterm_session_id(self.environ)
         if not session_uuid:
             return False
 
-        applescript = '''
-            tell application "System Events"
-                set frontApp to name of first application process whose frontmost is true
-            end tell
-            if frontApp is not "iTerm2" then return "NOTFRONT:" & frontApp
-            tell application "iTerm2"
-                try
-                    return unique ID of current session of current tab of current window
-                on error errMsg
-                    return "ERROR:" & errMsg
-                end try
-            end tell
-        '''
+        import metrics
+
+        if self.focus is None:
+            import focus
+            self.focus = focus.default_provider()
+        started = time.perf_counter()
         try:
-            result = subprocess.run(
-                ["osascript", "-e", applescript],
-                capture_output=True, text=True, timeout=2
-            )
-            raw = result.stdout.strip()
-            if raw.startswith(("NOTFRONT:", "ERROR:")):
-                return False
-            return raw == session_uuid
-        except Exception as e:
-            logging.warning(f"Could not check session focus: {e}")
-            return False
+            return self.focus.frontmost_session() == session_uuid
+        finally:
+            metrics.observe("ccnotify_focus_check_seconds", time.perf_counter() - started)
 
     def _flash_bg(self):
         """Single 0.2s amber flash of the terminal background."""
+        if not self.tty_path:
+            return
         try:
-            with open("/dev/tty", "w") as tty:
+            with open(self.tty_path, "w") as tty:
                 tty.write(f"\033]1337;SetColors=bg={FLASH_COLOR}\007")
                 tty.flush()
                 time.sleep(0.2)
                 tty.write(f"\033]1337;SetColors=bg={BG_COLOR}\007")
                 tty.flush()
         except Exception as e:
-            logging.warning(f"Could not flash bg: {e}")
+            log.warning("flash_failed", error=str(e))
 
     def send_notification(self, title, subtitle, cwd=None):
         """Send macOS notification via terminal-notifier, or flash if session is focused."""
-        if self._is_session_focused():
-            subprocess.Popen(
-                ["afplay", "/System/Library/Sounds/Glass.aiff"],
-                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-            )
-            time.sleep(0.7)
-            self._flash_bg()
-            logging.info(f"Notification skipped (session focused): {title} - {subtitle}")
+        import subprocess
+        from datetime import datetime
+
+        import metrics
+
+        with span("focus_check"):
+            focused = self._is_session_focused()
+        if focused:
+            with span("afplay"):
+                subprocess.Popen(
+                    ["afplay", "/System/Library/Sounds/Glass.aiff"],
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                )
+                time.sleep(0.7)
+            with span("flash_bg"):
+                self._flash_bg()
+            log.info("notification_skipped_focused", title=title, subtitle=subtitle)
+            metrics.inc("ccnotify_notifications", outcome="skipped_focused")
             return
 
-        iterm_session, session_uuid = _parse_iterm_session_id()
+        iterm_session, session_uuid = _parse_iterm_session_id(self.environ)
         current_time = datetime.now().strftime("%B %d, %Y at %H:%M")
 
         try:
@@ -289,19 +833,22 @@ class ClaudePromptTracker:
             else:
                 cmd.extend(["-activate", "com.googlecode.iterm2"])
 
-            subprocess.run(cmd, check=False, capture_output=True)
-            self._flash_bg()
-            logging.info(f"Notification sent: {title} - {subtitle} (session: {iterm_session})")
+            with span("terminal_notifier"):
+                subprocess.run(cmd, check=False, capture_output=True)
+            with span("flash_bg"):
+                self._flash_bg()
+            log.info("notification_sent", title=title, subtitle=subtitle, iterm_session=iterm_session)
+            metrics.inc("ccnotify_notifications", outcome="sent")
         except FileNotFoundError:
-            logging.warning("terminal-notifier not found, notification skipped")
-        except Exception as e:
-            logging.error(f"Error sending notification: {e}")
+            log.warning("notifier_missing")
+            metrics.inc("ccnotify_notifications", outcome="failed")
 
 
 REQUIRED_FIELDS = {
     "UserPromptSubmit": ["session_id", "prompt", "cwd", "hook_event_name"],
     "Stop": ["session_id", "hook_event_name"],
     "Notification": ["session_id", "message", "hook_event_name"],
+    "SessionEnd": ["session_id", "hook_event_name"],
 }
 
 
@@ -327,41 +874,265 @@ EVENT_HANDLERS = {
     "UserPromptSubmit": ClaudePromptTracker.handle_user_prompt_submit,
     "Stop": ClaudePromptTracker.handle_stop,
     "Notification": ClaudePromptTracker.handle_notification,
+    "SessionEnd": ClaudePromptTracker.handle_session_end,
+}
+
+
+def _is_busy(error):
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+def dispatch(tracker, event_name, data, at=None):
+    """Run the event's handler, retrying with jittered backoff while the database is locked.
+
+    `at` is the epoch time the event happened, for events handled late (the
+    spool); handlers stamp rows with it instead of the current time.
+    Returns the number of attempts taken; the lock error is re-raised after WRITE_ATTEMPTS.
+    """
+    import random
+    import sqlite3
+
+    handler = EVENT_HANDLERS[event_name]
+    tracker.event_at = at
+    try:
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                handler(tracker, data)
+                return attempt
+            except sqlite3.OperationalError as e:
+                late = tracker.deadline is not None and time.monotonic() >= tracker.deadline
+                if attempt == WRITE_ATTEMPTS or late or not _is_busy(e):
+                    raise
+                log.warning("write_retry", hook=event_name, attempt=attempt, error=str(e))
+                delay = WRITE_BACKOFF * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                time.sleep(delay)
+                tracker.lock_wait += delay
+    finally:
+        tracker.event_at = None
+
+
+def _spooled():
+    try:
+        return any(name.endswith(".json") for name in os.listdir(spool_dir()))
+    except FileNotFoundError:
+        return False
+
+
+def handle_event(tracker, event_name, data):
+    """Handle a hook event without ever losing it to a locked database.
+
+    If the database is still locked after dispatch() gives up, the event goes to
+    the spool instead. While anything is spooled, it is replayed before the new
+    event, and the new event queues behind it if that doesn't get through, so
+    a session's events always land in order.
+
+    Its latency and outcome are recorded in metrics.py, and flushed along with
+    anything else this process measured unless the database was locked.
+    """
+    import metrics
+
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        outcome = _handle_event(tracker, event_name, data)
+    finally:
+        metrics.observe("ccnotify_handler_seconds", time.perf_counter() - started, hook=event_name)
+        metrics.inc("ccnotify_events", hook=event_name, outcome=outcome)
+        if outcome != "spooled" and tracker._conn is not None:
+            metrics.flush(tracker._conn)
+
+
+def _handle_event(tracker, event_name, data):
+    """handle_event() proper; returns "handled" or "spooled"."""
+    import sqlite3
+
+    tracker.lock_wait = 0.0
+    env = {k: tracker.environ[k] for k in FORWARDED_ENV if k in tracker.environ}
+    if _spooled():
+        import spool
+        with span("replay_spool"):
+            spool.replay(tracker)
+        if spool.pending():
+            spool.save(event_name, data, env)
+            log.warning("event_spooled", hook=event_name, reason="spool_not_empty")
+            return "spooled"
+
+    try:
+        attempts = dispatch(tracker, event_name, data)
+    except sqlite3.OperationalError as e:
+        if not _is_busy(e):
+            raise
+        import spool
+        spool.save(event_name, data, env)
+        log.warning("event_spooled", hook=event_name, error=str(e))
+        return "spooled"
+
+    if attempts > 1 or tracker.lock_wait >= 0.001:
+        log.info("write_contended", hook=event_name, attempts=attempts,
+                 lock_wait_ms=round(tracker.lock_wait * 1000, 1))
+    return "handled"
+
+
+# Subcommands, resolved lazily to a sibling module exposing main(argv)
+COMMANDS = {
+    "daemon": "notifyd",
+    "deliver": "outbox",
+    "focus-watch": "focus",
+    "events": "eventlog",
+    "compact": "retention",
+    "stats": "rollups",
+    "search": "search",
+    "transcripts": "transcripts",
+    "history": "history",
+    "replay": "spool",
+    "backfill": "backfill",
+    "metrics": "metrics",
+    "profile": "tracing",
+    "worktree": "worktrees",
+    "top": "top",
+    "linear": "linear",
+    "durations": "durations",
+    "statusline": "statusline",
 }
 
 
+def deliver_lock_path(iterm_session=None):
+    """Lock a `deliver` child holds while it drains: one per terminal, since each flashes
+    only its own tty, and one per shard, like the spool."""
+    name = (iterm_session or "default").replace("/", "_") + ".lock"
+    shard = Storage.from_env().shard
+    return os.path.join(state_dir(), "deliver", *([shard] if shard else []), name)
+
+
+def _deliverer_running(iterm_session):
+    # The drainer holds the lock exclusively, so a shared try-lock fails only while it runs
+    import fcntl
+
+    try:
+        fd = os.open(deliver_lock_path(iterm_session), os.O_RDONLY)
+    except OSError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        return False
+    except OSError:
+        return True
+    finally:
+        os.close(fd)
+
+
+def _spawn_deliverer():
+    """Drain the outbox in a child that outlives the hook but keeps its controlling tty.
+
+    Skipped while this terminal's drainer still holds its lock; it looks for new
+    rows before exiting, so it delivers this hook's row too.
+    """
+    if _deliverer_running(os.environ.get("ITERM_SESSION_ID") or None):
+        return
+    import subprocess
+
+    subprocess.Popen(
+        [sys.executable, os.path.join(SCRIPT_DIR, "ccnotify.py"), "deliver"],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        close_fds=True,
+    )
+
+
+def _forward_to_daemon(event_name, data):
+    """Hand the event to a running ccnotify daemon; False means handle it in-process."""
+    path = _socket_path()
+    if not os.path.exists(path):
+        return False
+
+    import json
+    import socket
+
+    request = json.dumps({
+        "event": event_name,
+        "data": data,
+        "env": {k: os.environ[k] for k in FORWARDED_ENV if k in os.environ},
+    }).encode("utf-8")
+
+    tty_fd = None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(DAEMON_TIMEOUT)
+            sock.connect(path)
+            # Pass our controlling terminal along so the daemon can flash it
+            try:
+                tty_fd = os.open("/dev/tty", os.O_WRONLY | os.O_NOCTTY)
+            except OSError:
+                tty_fd = None
+            if tty_fd is not None:
+                socket.send_fds(sock, [request[:1]], [tty_fd])
+                sock.sendall(request[1:])
+            else:
+                sock.sendall(request)
+            sock.shutdown(socket.SHUT_WR)
+            sock.settimeout(DAEMON_REPLY_TIMEOUT)
+            return sock.recv(16).startswith(b"ok")
+    except OSError:
+        return False
+    finally:
+        if tty_fd is not None:
+            os.close(tty_fd)
+
+
 def main():
+    if len(sys.argv) < 2:
+        print("ok")
+        return
+
+    import json
+
     try:
-        if len(sys.argv) < 2:
-            print("ok")
+        event_name = sys.argv[1]
+        if event_name in COMMANDS:
+            import importlib
+            importlib.import_module(COMMANDS[event_name]).main(sys.argv[2:])
             return
 
-        event_name = sys.argv[1]
         if event_name not in EVENT_HANDLERS:
-            logging.error(f"Invalid hook type: {event_name}")
+            log.error("invalid_hook", hook=event_name)
             sys.exit(1)
 
-        input_data = sys.stdin.read().strip()
-        if not input_data:
-            logging.warning("No input data received")
-            return
+        with span(f"hook:{event_name}"):
+            with span("read_input"):
+                input_data = sys.stdin.read().strip()
+                if not input_data:
+                    log.warning("no_input")
+                    return
+
+                data = json.loads(input_data)
+                validate_input_data(data, event_name)
 
-        data = json.loads(input_data)
-        validate_input_data(data, event_name)
+            # The daemon keeps one database open, so per-project shards stay in-process
+            with span("forward"):
+                if "{project}" not in os.environ.get("CCNOTIFY_DB", "") and \
+                        _forward_to_daemon(event_name, data):
+                    return
 
-        tracker = ClaudePromptTracker()
-        EVENT_HANDLERS[event_name](tracker, data)
+            tracker = ClaudePromptTracker()
+            with span("handle"):
+                handle_event(tracker, event_name, data)
+            tracker.close()
+            if tracker.enqueued:
+                with span("spawn_deliverer"):
+                    _spawn_deliverer()
 
     except json.JSONDecodeError as e:
-        logging.error(f"JSON decode error: {e}")
+        log.error("json_decode_error", error=str(e))
         sys.exit(1)
     except ValueError as e:
-        logging.error(f"Validation error: {e}")
+        log.error("validation_error", error=str(e))
         sys.exit(1)
     except Exception as e:
-        logging.error(f"Unexpected error: {e}")
+        log.error("unexpected_error", error=str(e))
         sys.exit(1)
 
 
 if __name__ == "__main__":
+    # Let subcommand modules `import ccnotify` without loading this file twice
+    sys.modules.setdefault("ccnotify", sys.modules[__name__])
     main()
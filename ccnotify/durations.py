@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Streaming job-duration quantiles for ccnotify.
+
+Every finished job adds its duration to two DDSketches, one for its project
+(worktrees count under their repo, as in notifications) and one for its
+session. A DDSketch keeps counts in logarithmic buckets, so every quantile it
+reports is within ALPHA of a real duration. It never holds more than
+MAX_BUCKETS buckets, about 2 KB, however many jobs it has seen. The Stop hook
+updates both sketches in its own transaction, and answering a question reads
+one small blob instead of the prompt history.
+
+From a sketch ccnotify can say how a job compares ("slower than 93% of jobs
+in this repo", added to the Stop notification for slow jobs) and how much
+longer a running job is likely to take (the ETA column of `top`).
+
+Usage: ccnotify.py durations [--by project|session] [--project TEXT] [--rank SECONDS]
+                             [--json] [--rebuild]
+"""
+
+import json
+import math
+import struct
+import sys
+import time
+from array import array
+
+import ccnotify
+
+ALPHA = 0.02
+GAMMA = (1 + ALPHA) / (1 - ALPHA)
+LOG_GAMMA = math.log(GAMMA)
+# 1s..1 day spans ~285 buckets at 2%; past the cap the fastest buckets merge
+MAX_BUCKETS = 512
+# Comparisons need some history to mean anything
+MIN_JOBS = 20
+# Stop notifications mention the comparison from this share up
+SLOW_SHARE = 0.9
+
+_HEADER = struct.Struct("<Ii")
+
+
+class Sketch:
+    """DDSketch of durations in seconds; durations under a second count as zero."""
+
+    __slots__ = ("zeros", "offset", "counts")
+
+    def __init__(self, zeros=0, offset=0, counts=None):
+        self.zeros = zeros
+        self.offset = offset
+        self.counts = counts if counts is not None else array("I")
+
+    @classmethod
+    def decode(cls, blob):
+        zeros, offset = _HEADER.unpack_from(blob)
+        counts = array("I")
+        counts.frombytes(blob[_HEADER.size:])
+        return cls(zeros, offset, counts)
+
+    def encode(self):
+        return _HEADER.pack(self.zeros, self.offset) + self.counts.tobytes()
+
+    @property
+    def count(self):
+        return self.zeros + sum(self.counts)
+
+    @staticmethod
+    def _key(seconds):
+        return math.ceil(math.log(seconds) / LOG_GAMMA)
+
+    def add(self, seconds):
+        if seconds < 1:
+            self.zeros += 1
+            return
+        key = self._key(seconds)
+        if not self.counts:
+            self.offset = key
+            self.counts.append(1)
+            return
+        if key < self.offset:
+            grow = min(self.offset - key, MAX_BUCKETS - len(self.counts))
+            if grow:
+                self.counts[0:0] = array("I", bytes(4 * grow))
+                self.offset -= grow
+            self.counts[0] += 1
+            return
+        index = key - self.offset
+        if index >= len(self.counts):
+            self.counts.extend(array("I", bytes(4 * (index + 1 - len(self.counts)))))
+        self.counts[index] += 1
+        excess = len(self.counts) - MAX_BUCKETS
+        if excess > 0:
+            # Collapse the fastest buckets: the slow tail is what the comparisons are about
+            self.counts[excess] += sum(self.counts[:excess])
+            del self.counts[:excess]
+            self.offset += excess
+
+    def rank(self, seconds):
+        """Share of recorded durations shorter than `seconds` (0..1), or None when empty."""
+        total = self.count
+        if not total:
+            return None
+        if seconds < 1:
+            return 0.0
+        below = self._key(seconds) - self.offset
+        faster = self.zeros + sum(self.counts[:max(0, below)])
+        return faster / total
+
+    def quantile(self, q):
+        """Duration at quantile q (0..1) within ALPHA relative error, or None when empty."""
+        total = self.count
+        if not total:
+            return None
+        target = q * (total - 1)
+        if target < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen > target:
+                return 2 * GAMMA ** (self.offset + index) / (GAMMA + 1)
+        return 2 * GAMMA ** (self.offset + len(self.counts) - 1) / (GAMMA + 1)
+
+    def remaining(self, elapsed):
+        """Median time left for a job that has run `elapsed` seconds, from how long
+        jobs that ran at least that long took; None without enough history or past it."""
+        if self.count < MIN_JOBS:
+            return None
+        done = self.rank(elapsed)
+        if done >= 0.99:
+            return None
+        return max(0.0, self.quantile(done + (1 - done) / 2) - elapsed)
+
+
+def load(conn, scope, key):
+    row = conn.execute("SELECT sketch FROM duration_sketch WHERE scope = ? AND key = ?",
+                       (scope, key)).fetchone()
+    return Sketch.decode(row[0]) if row else Sketch()
+
+
+def _save(conn, scope, key, sketch):
+    conn.execute(
+        """INSERT INTO duration_sketch (scope, key, jobs, sketch, updated_at) VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT (scope, key) DO UPDATE SET
+               jobs = excluded.jobs, sketch = excluded.sketch, updated_at = excluded.updated_at""",
+        (scope, key, sketch.count, sketch.encode(), time.time()),
+    )
+
+
+def record(conn, session_id, cwd, seconds):
+    """Add a finished job; called inside the Stop transaction.
+
+    Returns the share of earlier jobs in the project that were faster, or None
+    while the project has fewer than MIN_JOBS.
+    """
+    group = ccnotify.notification_group(cwd)
+    project = load(conn, "project", group)
+    faster = project.rank(seconds) if project.count >= MIN_JOBS else None
+    project.add(seconds)
+    _save(conn, "project", group, project)
+    if session_id:
+        session = load(conn, "session", session_id)
+        session.add(seconds)
+        _save(conn, "session", session_id, session)
+    return faster
+
+
+def describe(faster):
+    """The notification's comparison for a slow job, or None."""
+    if faster is None or faster < SLOW_SHARE:
+        return None
+    return f"slower than {int(faster * 100)}% of jobs in this repo"
+
+
+def rebuild(conn):
+    """Recompute every sketch from the prompt rows, archived ones included."""
+    import retention
+
+    rows = retention.prompt_rows_sql(conn)
+    sketches, groups = {}, {}
+    for session_id, cwd, seconds in conn.execute(
+        f"""SELECT session_id, cwd,
+                   MAX(0, CAST(round((julianday(stoped_at) - julianday(created_at)) * 86400)
+                          AS INTEGER))
+            FROM {rows}
+            WHERE stoped_at IS NOT NULL AND id NOT IN (SELECT prompt_id FROM prompt_end)
+            ORDER BY id"""
+    ):
+        if cwd not in groups:
+            groups[cwd] = ccnotify.notification_group(cwd)
+        sketches.setdefault(("project", groups[cwd]), Sketch()).add(seconds)
+        if session_id:
+            sketches.setdefault(("session", session_id), Sketch()).add(seconds)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM duration_sketch")
+        for (scope, key), sketch in sketches.items():
+            _save(conn, scope, key, sketch)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(sketches)
+
+
+def query(conn, by="project", project=None, limit=50):
+    """Percentiles per project or session as a list of dicts, most jobs first."""
+    clauses, params = ["scope = ?"], [by]
+    if project:
+        clauses.append("key LIKE ?")
+        params.append(f"%{project}%")
+    rows = []
+    for key, jobs, blob in conn.execute(
+        f"""SELECT key, jobs, sketch FROM duration_sketch WHERE {" AND ".join(clauses)}
+            ORDER BY jobs DESC LIMIT ?""",
+        [*params, limit],
+    ):
+        sketch = Sketch.decode(blob)
+        rows.append({by: key, "jobs": jobs,
+                     **{f"p{round(q * 100)}": round(sketch.quantile(q)) for q in (0.5, 0.9, 0.99)}})
+    return rows
+
+
+def main(argv=None):
+    import argparse
+
+    import rollups
+
+    parser = argparse.ArgumentParser(prog="ccnotify.py durations",
+                                     description="Show job-duration percentiles.")
+    parser.add_argument("--by", choices=("project", "session"), default="project")
+    parser.add_argument("--project", help="only projects (or sessions) whose name contains this")
+    parser.add_argument("--rank", type=float, metavar="SECONDS",
+                        help="say how a job of this length compares in each project")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="recompute the sketches from the raw prompt rows first")
+    args = parser.parse_args(argv)
+
+    tracker = ccnotify.ClaudePromptTracker()
+    try:
+        conn = tracker._connect()
+        if args.rebuild:
+            print(f"Rebuilt {rebuild(conn)} sketch(es)", file=sys.stderr)
+        rows = query(conn, args.by, args.project, args.limit)
+        if args.rank is not None:
+            for row in rows:
+                sketch = load(conn, args.by, row[args.by])
+                row["faster"] = round(sketch.rank(args.rank), 3)
+    finally:
+        tracker.close()
+
+    if args.json:
+        json.dump(rows, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+    if not rows:
+        print("No jobs recorded (run `ccnotify.py durations --rebuild` after upgrading)")
+        return
+    width = max(len(args.by), *(len(row[args.by]) for row in rows))
+    header = f"{args.by:<{width}}  {'jobs':>6}  {'p50':>7}  {'p90':>7}  {'p99':>7}"
+    print(header + ("  slower than" if args.rank is not None else ""))
+    for row in rows:
+        line = (f"{row[args.by]:<{width}}  {row['jobs']:>6}  "
+                + "  ".join(f"{rollups.format_seconds(row[p]):>7}" for p in ("p50", "p90", "p99")))
+        if args.rank is not None:
+            line += f"  {row['faster']:>10.0%}"
+        print(line)
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Structured JSON-lines event log for ccnotify.
+
+Callers only enqueue records; a writer thread formats them and appends them in
+batches, rotating by size or age into gzip archives. Many hook processes can
+share one log: appends take a shared flock and rotation takes it exclusively.
+
+Usage: ccnotify.py events [--session ID] [--since 2h|ISO] [--until ISO] [--event NAME]
+"""
+
+import atexit
+import fcntl
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+
+MAX_BYTES = 10 * 1024 * 1024
+MAX_AGE = 86400
+BACKUP_COUNT = 30
+BATCH_SIZE = 512
+
+_ARCHIVE_RE = re.compile(r"\.(\d{8}-\d{6})(?:-(\d+))?\.gz$")
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+class Event:
+    """Log message that stays structured until a handler renders it."""
+
+    __slots__ = ("name", "fields")
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+
+    def __str__(self):
+        return " ".join([self.name, *(f"{k}={v}" for k, v in self.fields.items())])
+
+
+def emit(level, event, **fields):
+    logger = logging.getLogger("ccnotify")
+    if logger.isEnabledFor(level):
+        logger.log(level, Event(event, fields))
+
+
+def info(event, **fields):
+    emit(logging.INFO, event, **fields)
+
+
+def warning(event, **fields):
+    emit(logging.WARNING, event, **fields)
+
+
+def error(event, **fields):
+    emit(logging.ERROR, event, **fields)
+
+
+def format_record(record):
+    entry = {"ts": round(record.created, 3), "level": record.levelname.lower(), "pid": record.process}
+    if isinstance(record.msg, Event):
+        entry["event"] = record.msg.name
+        entry.update(record.msg.fields)
+    else:
+        entry["event"] = "log"
+        entry["msg"] = record.getMessage()
+    return json.dumps(entry, default=str) + "\n"
+
+
+class _QueueHandler(logging.Handler):
+    def __init__(self, writer):
+        super().__init__()
+        self.writer = writer
+
+    def emit(self, record):
+        self.writer.queue.put(record)
+
+
+class EventLogWriter(threading.Thread):
+    """Drain queued records and append them in batches."""
+
+    def __init__(self, path, max_bytes=MAX_BYTES, max_age=MAX_AGE, backup_count=BACKUP_COUNT):
+        super().__init__(name="ccnotify-eventlog", daemon=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backup_count = backup_count
+        self.queue = queue.SimpleQueue()
+        self._fd = None
+        self._inode = None
+        self._started_at = None
+        self._lock_fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+
+    def run(self):
+        stop = False
+        while not stop:
+            batch = [self.queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            lines = "".join(format_record(r) for r in batch if r is not None)
+            if lines:
+                try:
+                    self._write(lines.encode("utf-8"))
+                except OSError as e:
+                    print(f"ccnotify event log write failed: {e}", file=sys.stderr)
+
+    def close(self, timeout=2.0):
+        if self._lock_fd is None:
+            return
+        if self.is_alive():
+            self.queue.put(None)
+            self.join(timeout)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        os.close(self._lock_fd)
+        self._lock_fd = None
+
+    def _open(self):
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._inode = os.fstat(self._fd).st_ino
+        self._started_at = _first_timestamp(self.path) or time.time()
+
+    def _write(self, data):
+        if self._fd is None:
+            self._open()
+        if self._due(len(data)):
+            self._rotate(len(data))
+
+        fcntl.flock(self._lock_fd, fcntl.LOCK_SH)
+        try:
+            # Another process may have rotated the file out from under us
+            try:
+                current = os.stat(self.path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current != self._inode:
+                self._open()
+            os.write(self._fd, data)
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _due(self, incoming):
+        size = os.fstat(self._fd).st_size
+        if size == 0:
+            return False
+        return size + incoming > self.max_bytes or time.time() - self._started_at > self.max_age
+
+    def _rotate(self, incoming):
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            # Re-check under the lock; a concurrent writer may already have rotated
+            try:
+                size = os.stat(self.path).st_size
+            except FileNotFoundError:
+                size = 0
+            started = _first_timestamp(self.path) or time.time()
+            if not size or (size + incoming <= self.max_bytes
+                            and time.time() - started <= self.max_age):
+                self._open()
+                return
+
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            rotated = f"{self.path}.{stamp}"
+            suffix = 0
+            while os.path.exists(rotated) or os.path.exists(f"{rotated}.gz"):
+                suffix += 1
+                rotated = f"{self.path}.{stamp}-{suffix}"
+            os.rename(self.path, rotated)
+            self._open()
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+        import gzip
+        import shutil
+
+        with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.unlink(rotated)
+        for old in archives(self.path)[:-self.backup_count or None]:
+            try:
+                os.unlink(old)
+            except FileNotFoundError:
+                pass
+
+
+def _first_timestamp(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.loads(f.readline())["ts"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def setup(path, level=logging.INFO, **writer_options):
+    """Route logging to the event log at `path`; safe to call repeatedly."""
+    with _writers_lock:
+        if path in _writers:
+            return _writers[path]
+        writer = EventLogWriter(path, **writer_options)
+        writer.start()
+        _writers[path] = writer
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(_QueueHandler(writer))
+    atexit.register(writer.close)
+    return writer
+
+
+def archives(path):
+    """Rotated archives of `path`, oldest first."""
+    import glob
+
+    def order(name):
+        match = _ARCHIVE_RE.search(name)
+        return (match.group(1), int(match.group(2) or 0)) if match else ("", 0)
+
+    return sorted(glob.glob(f"{glob.escape(path)}.*.gz"), key=order)
+
+
+def _archive_end(archive):
+    match = _ARCHIVE_RE.search(archive)
+    return time.mktime(time.strptime(match.group(1), "%Y%m%d-%H%M%S")) if match else None
+
+
+def iter_events(path, session=None, since=None, until=None, event=None):
+    """Stream matching events from the archives and the live file, oldest first.
+
+    Archives that ended before `since` or whose successor starts after `until`
+    are never opened, and lines are only parsed once they pass a cheap substring check.
+    """
+    import gzip
+
+    file_start = None
+    for name in archives(path) + [path]:
+        file_end = _archive_end(name) if name != path else None
+        if until is not None and file_start is not None and file_start > until:
+            return
+        skip = since is not None and file_end is not None and file_end < since
+        file_start = file_end
+        if skip:
+            continue
+
+        opener = gzip.open if name.endswith(".gz") else open
+        try:
+            f = opener(name, "rt", encoding="utf-8")
+        except FileNotFoundError:
+            continue
+        with f:
+            for line in f:
+                if session is not None and session not in line:
+                    continue
+                if event is not None and event not in line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if session is not None and entry.get("session_id") != session:
+                    continue
+                if event is not None and entry.get("event") != event:
+                    continue
+                ts = entry.get("ts", 0)
+                if since is not None and ts < since:
+                    continue
+                if until is not None and ts > until:
+                    continue
+                yield entry
+
+
+def parse_time(value, now=None):
+    """Accept an ISO timestamp or a relative age like '30m', '2h', '7d'."""
+    now = time.time() if now is None else now
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd])", value)
+    if match:
+        unit = {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+        return now - float(match.group(1)) * unit
+    from datetime import datetime
+
+    return datetime.fromisoformat(value).timestamp()
+
+
+def main(argv=None):
+    import argparse
+
+    import ccnotify
+
+    parser = argparse.ArgumentParser(prog="ccnotify.py events",
+                                     description="Stream events from the ccnotify event log.")
+    parser.add_argument("--session", help="only events for this Claude session ID")
+    parser.add_argument("--since", type=parse_time, help="ISO time or age such as 2h")
+    parser.add_argument("--until", type=parse_time, help="ISO time or age such as 30m")
+    parser.add_argument("--event", help="only events with this name")
+    parser.add_argument("--path", default=ccnotify.log_path())
+    args = parser.parse_args(argv)
+
+    try:
+        for entry in iter_events(args.path, args.session, args.since, args.until, args.event):
+            sys.stdout.write(json.dumps(entry) + "\n")
+    except BrokenPipeError:
+        pass
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Focus-state providers for ccnotify.
+
+Answer "which iTerm2 session is frontmost?" without forking osascript on every
+notification: answers are cached in a small shared state file, which a
+long-running watcher can keep current.
+
+Usage: ccnotify.py focus-watch [--interval SECONDS]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+import ccnotify
+import metrics
+
+# How long a hook trusts an answer another hook fetched
+FOCUS_TTL = 1.0
+# The watcher rewrites the state at least this often; older watcher state is ignored
+HEARTBEAT = 5.0
+WATCHER_TTL = 3 * HEARTBEAT
+
+FRONTMOST_SCRIPT = '''
+    tell application "System Events"
+        set frontApp to name of first application process whose frontmost is true
+    end tell
+    if frontApp is not "iTerm2" then return "NOTFRONT:" & frontApp
+    tell application "iTerm2"
+        try
+            return unique ID of current session of current tab of current window
+        on error errMsg
+            return "ERROR:" & errMsg
+        end try
+    end tell
+'''
+
+
+def state_path():
+    return os.environ.get("CCNOTIFY_FOCUS_STATE") or os.path.join(
+        tempfile.gettempdir(), "ccnotify-focus.json"
+    )
+
+
+class AppleScriptFocusProvider:
+    """Ask iTerm2 directly; None when iTerm2 isn't frontmost or the script fails."""
+
+    def frontmost_session(self):
+        try:
+            result = subprocess.run(
+                ["osascript", "-e", FRONTMOST_SCRIPT],
+                capture_output=True, text=True, timeout=2
+            )
+            raw = result.stdout.strip()
+            if not raw or raw.startswith(("NOTFRONT:", "ERROR:")):
+                return None
+            return raw
+        except subprocess.TimeoutExpired as e:
+            metrics.inc("ccnotify_focus_timeouts")
+            ccnotify.log.warning("focus_check_failed", error=str(e))
+            return None
+        except Exception as e:
+            ccnotify.log.warning("focus_check_failed", error=str(e))
+            return None
+
+
+class FakeFocusProvider:
+    """Test stand-in that reports a fixed frontmost session."""
+
+    def __init__(self, session=None):
+        self.session = session
+        self.calls = 0
+
+    def frontmost_session(self):
+        self.calls += 1
+        return self.session
+
+
+def read_state(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_state(path, session, source, now=None):
+    state = {"session": session, "at": time.time() if now is None else now, "source": source}
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        ccnotify.log.warning("focus_state_write_failed", error=str(e))
+
+
+class CachedFocusProvider:
+    """Serve focus from the shared state file while it's fresh, else ask `inner`."""
+
+    def __init__(self, inner=None, path=None, ttl=FOCUS_TTL):
+        self.inner = inner or AppleScriptFocusProvider()
+        self.path = path or state_path()
+        self.ttl = ttl
+
+    def frontmost_session(self):
+        now = time.time()
+        state = read_state(self.path)
+        if state:
+            ttl = WATCHER_TTL if state.get("source") == "watcher" else self.ttl
+            if now - state.get("at", 0) < ttl:
+                return state.get("session")
+
+        session = self.inner.frontmost_session()
+        write_state(self.path, session, "cache", now)
+        return session
+
+
+def default_provider():
+    return CachedFocusProvider()
+
+
+def _poll(path, interval, provider=None):
+    """Fallback watcher: poll AppleScript, rewriting on change and on every heartbeat."""
+    provider = provider or AppleScriptFocusProvider()
+    last, written_at = object(), 0.0
+    while True:
+        session = provider.frontmost_session()
+        now = time.time()
+        if session != last or now - written_at >= HEARTBEAT:
+            write_state(path, session, "watcher", now)
+            last, written_at = session, now
+        time.sleep(interval)
+
+
+def _watch_iterm(path, iterm2):
+    """Event-driven watcher on iTerm2's Python API focus notifications."""
+    import asyncio
+
+    async def watch(connection):
+        app = await iterm2.async_get_app(connection)
+        window = app.current_terminal_window
+        session = window.current_tab.current_session.session_id if window else None
+        state = {"active": AppleScriptFocusProvider().frontmost_session() is not None,
+                 "session": session}
+
+        def publish():
+            write_state(path, state["session"] if state["active"] else None, "watcher")
+
+        async def heartbeat():
+            while True:
+                publish()
+                await asyncio.sleep(HEARTBEAT)
+
+        asyncio.ensure_future(heartbeat())
+        async with iterm2.FocusMonitor(connection) as monitor:
+            while True:
+                update = await monitor.async_get_next_update()
+                if update.application_active is not None:
+                    state["active"] = update.application_active.application_active
+                if update.active_session_changed is not None:
+                    state["session"] = update.active_session_changed.session_id
+                publish()
+
+    iterm2.run_forever(watch)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ccnotify.py focus-watch",
+                                     description="Keep the shared focus state current.")
+    parser.add_argument("--interval", type=float, default=0.5,
+                        help="poll interval when the iterm2 package is unavailable")
+    args = parser.parse_args(argv)
+
+    path = state_path()
+    try:
+        import iterm2
+    except ImportError:
+        ccnotify.log.info("focus_watch_polling", interval=args.interval)
+        _poll(path, args.interval)
+    else:
+        _watch_iterm(path, iterm2)
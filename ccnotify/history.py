@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Date-range reads of ~/.claude/history.jsonl without scanning the whole file.
+
+history.jsonl is append-only and its `timestamp` values (epoch milliseconds)
+only grow, so the byte offsets where a time window starts and ends can be found
+by bisecting the memory-mapped file, re-syncing to the next newline after each
+probe. Only the lines in that slice are parsed and grouped by sessionId, so a
+date-range lookup costs O(log n + k) instead of O(n).
+
+Usage: ccnotify.py history [--start YYYY-MM-DD] [--end YYYY-MM-DD] [--keyword TEXT]
+                           [--project REGEX] [--file PATH]
+"""
+
+import argparse
+import json
+import mmap
+import os
+import re
+import sys
+import time
+
+FIRST_MSG_CHARS = 80
+
+
+def history_path():
+    return os.environ.get("CCNOTIFY_HISTORY_FILE") or os.path.expanduser("~/.claude/history.jsonl")
+
+
+def local_day_ms(day, offset_days=0):
+    """Epoch milliseconds of local midnight on `day` (YYYY-MM-DD), plus offset_days."""
+    return int((time.mktime(time.strptime(day, "%Y-%m-%d")) + offset_days * 86400) * 1000)
+
+
+class HistoryFile:
+    """A memory-mapped history.jsonl; use as a context manager."""
+
+    def __init__(self, path=None):
+        self.path = path or history_path()
+        self._file = None
+        self.map = b""
+
+    def __enter__(self):
+        self._file = open(self.path, "rb")
+        if os.fstat(self._file.fileno()).st_size:
+            self.map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self
+
+    def __exit__(self, *exc):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.map = b""
+        self._file.close()
+
+    def _line_start(self, pos):
+        """Offset of the first line starting at or after pos."""
+        if pos == 0 or self.map[pos - 1:pos] == b"\n":
+            return pos
+        newline = self.map.find(b"\n", pos)
+        return len(self.map) if newline < 0 else newline + 1
+
+    def _line_end(self, start):
+        newline = self.map.find(b"\n", start)
+        return len(self.map) if newline < 0 else newline + 1
+
+    def _timestamp_from(self, start):
+        """(timestamp, line start) of the first parseable line at or after start.
+
+        The timestamp is None at end of file; malformed lines (say, a torn
+        write) are stepped over rather than breaking the bisection.
+        """
+        size = len(self.map)
+        while start < size:
+            end = self._line_end(start)
+            try:
+                return int(json.loads(self.map[start:end])["timestamp"]), start
+            except (ValueError, KeyError, TypeError):
+                start = end
+        return None, size
+
+    def offset_of(self, timestamp):
+        """Offset of the first line whose timestamp is >= timestamp (ms)."""
+        lo, hi = 0, len(self.map)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            found, start = self._timestamp_from(self._line_start(mid))
+            if found is None or found >= timestamp:
+                hi = mid
+            else:
+                # Every probe up to this line lands on an earlier timestamp
+                lo = start + 1
+        return self._line_start(lo)
+
+    def entries(self, since=None, until=None):
+        """Yield the parsed entries with since <= timestamp < until (ms, either optional)."""
+        start = self.offset_of(since) if since is not None else 0
+        stop = self.offset_of(until) if until is not None else len(self.map)
+        while start < stop:
+            end = self._line_end(start)
+            try:
+                entry = json.loads(self.map[start:end])
+            except ValueError:
+                entry = None
+            if isinstance(entry, dict):
+                yield entry
+            start = end
+
+
+def group_sessions(entries, keyword=None, project=None):
+    """One summary per sessionId, oldest first, in search-history.sh's history shape.
+
+    Only a running summary is kept per session, never its lines.
+    """
+    needle = keyword.lower() if keyword else None
+    regex = re.compile(project, re.IGNORECASE) if project else None
+    sessions = {}
+    for entry in entries:
+        if needle and needle not in json.dumps(entry, ensure_ascii=False).lower():
+            continue
+        if regex and not regex.search(entry.get("project") or ""):
+            continue
+        session_id = entry.get("sessionId")
+        summary = sessions.get(session_id)
+        if summary is None:
+            sessions[session_id] = [entry, entry, 1]
+            continue
+        summary[2] += 1
+        if entry.get("timestamp", 0) < summary[1].get("timestamp", 0):
+            summary[1] = entry
+
+    results = []
+    for session_id, (first, earliest, count) in sessions.items():
+        project_full = first.get("project") or ""
+        local = time.localtime(first.get("timestamp", 0) / 1000)
+        results.append({
+            "session": session_id,
+            "project": project_full.rsplit("/", 1)[-1],
+            "project_full": project_full,
+            "time": time.strftime("%H:%M", local),
+            "date": time.strftime("%Y-%m-%d", local),
+            "first_msg": (earliest.get("display") or "")[:FIRST_MSG_CHARS],
+            "count": count,
+        })
+    results.sort(key=lambda r: r["date"] + r["time"])
+    return results
+
+
+def search(path=None, start=None, end=None, keyword=None, project=None):
+    """Sessions active between the local dates start and end (inclusive, either optional)."""
+    since = local_day_ms(start) if start else None
+    until = local_day_ms(end, 1) if end else None
+    with HistoryFile(path) as history:
+        return group_sessions(history.entries(since, until), keyword, project)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ccnotify.py history",
+                                     description="Read a date range of history.jsonl.")
+    parser.add_argument("--start", help="first local date, YYYY-MM-DD (inclusive)")
+    parser.add_argument("--end", help="last local date, YYYY-MM-DD (inclusive)")
+    parser.add_argument("--keyword", help="case-insensitive text to look for")
+    parser.add_argument("--project", help="case-insensitive regex on the project path")
+    parser.add_argument("--file", default=history_path(), help="default: %(default)s")
+    args = parser.parse_args(argv)
+
+    try:
+        results = search(args.file, args.start, args.end, args.keyword, args.project)
+    except FileNotFoundError:
+        return
+    try:
+        for result in results:
+            sys.stdout.write(json.dumps(result) + "\n")
+    except BrokenPipeError:
+        pass
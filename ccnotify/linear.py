@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Linear poller: finds @claude-tagged tickets and launches each one as a Claude
+background task in its own tmux session.
+
+Each poll asks Linear only for what changed since the last one: issues with an
+@claude comment updated after the saved cursor, and only the comments updated
+since then. It merges them into a cache in ccnotify.db (linear_issue,
+linear_comment). Which tickets to launch is decided from the cache: open,
+tagged @claude, and not labelled ai-in-progress or ai-ready-for-review. Every
+request goes over one kept-alive HTTP connection, which --interval keeps open
+between polls. Launching a ticket is mostly waiting on the Claude TUI, so up to
+--concurrency tickets launch at once.
+
+scripts/linear-poller/poll.sh is a thin wrapper around:
+
+Usage: ccnotify.py linear [--api-url URL] [--repo DIR] [--concurrency N] [--interval SECONDS] [--full]
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import re
+import sys
+import urllib.parse
+from typing import NamedTuple
+
+import ccnotify
+
+API_URL = "https://api.linear.app/graphql"
+PAGE_SIZE = 50
+TIMEOUT = 30
+EPOCH = "1970-01-01T00:00:00.000Z"
+
+AI_LABEL_IN_PROGRESS = "ai-in-progress"
+AI_LABEL_READY_FOR_REVIEW = "ai-ready-for-review"
+# Label ID for ai-in-progress, set with issueUpdate (which needs IDs, not names)
+AI_LABEL_IN_PROGRESS_ID = "cc9f2277-acab-4744-a6d0-104741dc8db7"
+
+OPEN_STATES = ("triage", "unstarted", "started")
+# Comments the poller and workers post themselves, left out of the prompt
+BOT_PHRASES = ("Picking this up", "Claude is working", AI_LABEL_IN_PROGRESS, AI_LABEL_READY_FOR_REVIEW)
+DEFAULT_INSTRUCTIONS = "Implement the ticket as described in the title and description."
+SESSION_URL = re.compile(r"https://claude\.ai/code/session_[^ \n]*")
+
+ISSUES_QUERY = """
+query($since: DateTimeOrDuration!, $first: Int!, $after: String) {
+  issues(first: $first, after: $after, orderBy: updatedAt,
+         filter: { updatedAt: { gt: $since }, comments: { body: { contains: "@claude" } } }) {
+    pageInfo { hasNextPage endCursor }
+    nodes {
+      id identifier title description updatedAt
+      state { name type }
+      labels { nodes { name } }
+      comments(first: 100, filter: { updatedAt: { gt: $since } }) {
+        nodes { id body createdAt updatedAt user { name } }
+      }
+    }
+  }
+}"""
+
+COMMENT_MUTATION = ("mutation($id: String!, $body: String!) "
+                    "{ commentCreate(input: { issueId: $id, body: $body }) { success } }")
+LABEL_MUTATION = ("mutation($id: String!, $labelIds: [String!]) "
+                  "{ issueUpdate(id: $id, input: { labelIds: $labelIds }) { success } }")
+
+
+class LinearError(Exception):
+    pass
+
+
+class Client:
+    """GraphQL over one persistent HTTP connection; requests take turns on it."""
+
+    def __init__(self, url, api_key):
+        self.url = url
+        self.api_key = api_key
+        self._parts = urllib.parse.urlsplit(url)
+        self._conn = None
+        self._lock = asyncio.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            cls = http.client.HTTPSConnection if self._parts.scheme == "https" else http.client.HTTPConnection
+            self._conn = cls(self._parts.netloc, timeout=TIMEOUT)
+        return self._conn
+
+    def _post(self, body):
+        headers = {"Content-Type": "application/json", "Authorization": self.api_key}
+        for attempt in (1, 2):
+            try:
+                conn = self._connection()
+                conn.request("POST", self._parts.path or "/", body, headers)
+                response = conn.getresponse()
+                payload = response.read()
+                break
+            except (http.client.HTTPException, OSError) as e:
+                self.close()
+                # A kept-alive connection the server dropped while idle gets one retry
+                stale = isinstance(e, (ConnectionResetError, BrokenPipeError))
+                if attempt == 2 or not stale:
+                    raise LinearError(f"{type(e).__name__}: {e}") from e
+        if response.status != 200:
+            raise LinearError(f"HTTP {response.status}: {payload[:200].decode(errors='replace')}")
+        try:
+            return json.loads(payload)
+        except ValueError as e:
+            raise LinearError(f"invalid JSON response: {e}") from e
+
+    async def execute(self, query, variables=None):
+        body = json.dumps({"query": query, "variables": variables or {}}).encode()
+        async with self._lock:
+            data = await asyncio.to_thread(self._post, body)
+        if data.get("errors"):
+            raise LinearError(data["errors"][0].get("message", "GraphQL error"))
+        return data["data"]
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class Ticket(NamedTuple):
+    id: str
+    identifier: str
+    title: str
+    description: str
+    state: str
+    comments: list  # [(user name, body)], oldest first
+
+
+def _flatten(text):
+    return re.sub(" +", " ", (text or "").replace("\n", " ")).strip()
+
+
+def build_prompt(ticket):
+    """(prompt, trigger comment, its author) for a ticket, as poll.sh built them."""
+    human = [f"{user}: {body}" for user, body in ticket.comments
+             if not any(phrase in body for phrase in BOT_PHRASES)]
+    tagged = [(user, body) for user, body in ticket.comments if "@claude" in body]
+    trigger_user, trigger = tagged[-1] if tagged else ("Unknown", "")
+    instructions = trigger if trigger and trigger != "@claude" else DEFAULT_INSTRUCTIONS
+    prompt = (
+        f"Work on Linear issue {ticket.identifier} (ID: {ticket.id}). Title: {ticket.title}. "
+        f"Description: {_flatten(ticket.description)}. Comments: {_flatten(' '.join(human))}. "
+        f"Instructions: {instructions}. Workflow: (1) Plan what to do to complete the task. "
+        "(2) Implement it, create a branch, commit, and push. "
+        "Do NOT create a PR — a human reviewer will do that."
+    )
+    return _flatten(prompt), trigger, trigger_user
+
+
+def _say(ticket, message):
+    print(f"  {ticket.identifier}: {message}", flush=True)
+
+
+async def _tmux(*args):
+    process = await asyncio.create_subprocess_exec(
+        "tmux", *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+    )
+    out, _ = await process.communicate()
+    return process.returncode, out.decode(errors="replace")
+
+
+async def launch_in_tmux(ticket, prompt, repo):
+    """Start `claude` in a tmux session, send the prompt as a background task,
+    and return the session URL it prints (None if it never showed one)."""
+    session = f"claude-{ticket.identifier}"
+    if (await _tmux("has-session", "-t", session))[0] == 0:
+        _say(ticket, f"Skipping — tmux session '{session}' already exists")
+        return None
+
+    _say(ticket, "Launching background task...")
+    await _tmux("new-session", "-d", "-s", session, "-c", repo, "claude")
+    await asyncio.sleep(8)
+    # & puts the TUI in background mode; wait for it to notice before typing
+    for keys, pause in ((["&"], 3), ([" "], 0.5), (["-l", prompt], 1), (["Enter"], 0)):
+        await _tmux("send-keys", "-t", session, *keys)
+        await asyncio.sleep(pause)
+    _say(ticket, "Sent! Waiting for background task to register...")
+
+    pane = ""
+    for _ in range(15):
+        await asyncio.sleep(2)
+        pane = (await _tmux("capture-pane", "-t", session, "-p"))[1]
+        if "Include local changes" in pane:
+            _say(ticket, "Handling 'Include local changes' dialog...")
+            await asyncio.sleep(1)
+            await _tmux("send-keys", "-t", session, "Down")
+            await asyncio.sleep(0.5)
+            await _tmux("send-keys", "-t", session, "Enter")
+            await asyncio.sleep(8)
+            pane = (await _tmux("capture-pane", "-t", session, "-p"))[1]
+            break
+        if "running in the background" in pane:
+            break
+
+    # Old comments quoted in the prompt may contain session URLs of their own
+    urls = [url for url in sorted(set(SESSION_URL.findall(pane))) if url not in prompt]
+    return urls[-1] if urls else None
+
+
+class Poller:
+    def __init__(self, tracker, client, repo, concurrency=4, launch=launch_in_tmux):
+        self.tracker = tracker
+        self.client = client
+        self.repo = repo
+        self.concurrency = concurrency
+        self.launch = launch
+
+    async def sync(self, full=False):
+        """Merge issues updated since the saved cursor into the cache; returns how many came back."""
+        row = self.tracker._connect().execute(
+            "SELECT updated_at FROM linear_sync WHERE api_url = ?", (self.client.url,)
+        ).fetchone()
+        since = EPOCH if full or row is None else row[0]
+        newest, count, after = since, 0, None
+        while True:
+            data = await self.client.execute(ISSUES_QUERY, {"since": since, "first": PAGE_SIZE,
+                                                            "after": after})
+            page = data["issues"]
+            with self.tracker._write() as conn:
+                for issue in page["nodes"]:
+                    self._store(conn, issue)
+                    newest = max(newest, issue["updatedAt"])
+            count += len(page["nodes"])
+            if not page["pageInfo"]["hasNextPage"]:
+                break
+            after = page["pageInfo"]["endCursor"]
+        # Only advance once every page is in, so an interrupted sync starts over
+        with self.tracker._write() as conn:
+            conn.execute("INSERT OR REPLACE INTO linear_sync (api_url, updated_at) VALUES (?, ?)",
+                         (self.client.url, newest))
+        return count
+
+    @staticmethod
+    def _store(conn, issue):
+        state = issue.get("state") or {}
+        labels = [label["name"] for label in (issue.get("labels") or {}).get("nodes") or []]
+        conn.execute(
+            """INSERT OR REPLACE INTO linear_issue
+               (id, identifier, title, description, state_name, state_type, labels, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (issue["id"], issue["identifier"], issue.get("title"), issue.get("description"),
+             state.get("name"), state.get("type"), json.dumps(labels), issue["updatedAt"]),
+        )
+        conn.executemany(
+            """INSERT OR REPLACE INTO linear_comment
+               (id, issue_id, body, user_name, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)""",
+            [(c["id"], issue["id"], c.get("body"), (c.get("user") or {}).get("name"),
+              c.get("createdAt"), c.get("updatedAt"))
+             for c in (issue.get("comments") or {}).get("nodes") or []],
+        )
+
+    def candidates(self):
+        """Open, @claude-tagged tickets from the cache not yet picked up, oldest update first."""
+        conn = self.tracker._connect()
+        tickets = []
+        for issue_id, identifier, title, description, state, labels in conn.execute(
+            f"""SELECT id, identifier, title, description, state_name, labels FROM linear_issue
+                WHERE state_type IN ({", ".join("?" * len(OPEN_STATES))})
+                ORDER BY updated_at""",
+            OPEN_STATES,
+        ):
+            labels = json.loads(labels)
+            if AI_LABEL_IN_PROGRESS in labels:
+                continue
+            if AI_LABEL_READY_FOR_REVIEW in labels:
+                print(f"Skipping {identifier} — already reviewed")
+                continue
+            comments = [(user or "Unknown", body or "") for user, body in conn.execute(
+                "SELECT user_name, body FROM linear_comment WHERE issue_id = ? ORDER BY created_at",
+                (issue_id,),
+            )]
+            if any("@claude" in body for _, body in comments):
+                tickets.append(Ticket(issue_id, identifier, title or "", description or "",
+                                      state or "", comments))
+        return tickets
+
+    async def _claim(self, ticket, url):
+        """Post the session link and label the ticket ai-in-progress."""
+        body = f"Claude is working on this. Follow along or take over here: {url}\n\n@Tom Lynch please allow sharing"
+        try:
+            await self.client.execute(COMMENT_MUTATION, {"id": ticket.id, "body": body})
+            _say(ticket, "Posted session link")
+            await self.client.execute(LABEL_MUTATION, {"id": ticket.id,
+                                                       "labelIds": [AI_LABEL_IN_PROGRESS_ID]})
+            _say(ticket, f"Added '{AI_LABEL_IN_PROGRESS}' label")
+        except LinearError as e:
+            _say(ticket, f"Warning: couldn't update the ticket: {e}")
+            return
+        # Don't wait for the next sync to learn the ticket is taken
+        with self.tracker._write() as conn:
+            labels = json.loads(conn.execute("SELECT labels FROM linear_issue WHERE id = ?",
+                                             (ticket.id,)).fetchone()[0])
+            conn.execute("UPDATE linear_issue SET labels = ? WHERE id = ?",
+                         (json.dumps(labels + [AI_LABEL_IN_PROGRESS]), ticket.id))
+
+    async def _dispatch(self, ticket, semaphore):
+        prompt, trigger, trigger_user = build_prompt(ticket)
+        async with semaphore:
+            print(f"=== {ticket.identifier}: {ticket.title} ({ticket.state}) ===")
+            print(f"  Triggered by: {trigger_user}")
+            print(f"  Comment: {trigger[:80]}", flush=True)
+            url = await self.launch(ticket, prompt, self.repo)
+        if url:
+            _say(ticket, f"Session: {url}")
+            await self._claim(ticket, url)
+        else:
+            _say(ticket, "Warning: couldn't capture session URL")
+        return url
+
+    async def poll(self, full=False):
+        """Sync, then launch every candidate ticket; returns {identifier: session URL or None}."""
+        updated = await self.sync(full)
+        tickets = self.candidates()
+        print(f"Found {len(tickets)} ticket(s) ({updated} updated since the last poll)", flush=True)
+        if not tickets:
+            return {}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self._dispatch(ticket, semaphore) for ticket in tickets),
+                                       return_exceptions=True)
+        launched = {}
+        for ticket, result in zip(tickets, results):
+            if isinstance(result, Exception):
+                _say(ticket, f"Error: {result}")
+                ccnotify.log.warning("linear_launch_failed", issue=ticket.identifier, error=str(result))
+                result = None
+            launched[ticket.identifier] = result
+        ccnotify.log.info("linear_poll", updated=updated, tickets=len(tickets),
+                          launched=sum(1 for url in launched.values() if url))
+        print("\nAll tickets dispatched.")
+        print("List sessions: tmux list-sessions")
+        return launched
+
+
+async def _run(poller, interval, full):
+    try:
+        while True:
+            try:
+                await poller.poll(full)
+            except LinearError as e:
+                ccnotify.log.warning("linear_poll_failed", error=str(e))
+                if not interval:
+                    raise
+                print(f"Linear request failed: {e}", file=sys.stderr)
+            if not interval:
+                return
+            full = False
+            await asyncio.sleep(interval)
+    finally:
+        poller.client.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ccnotify.py linear",
+                                     description="Launch @claude-tagged Linear tickets.")
+    parser.add_argument("--api-url", default=os.environ.get("LINEAR_API_URL") or API_URL)
+    parser.add_argument("--repo", default=os.getcwd(), help="repo the tasks run in")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="tickets launched at once (default: 4)")
+    parser.add_argument("--interval", type=float, default=0,
+                        help="keep polling every SECONDS on the same connection")
+    parser.add_argument("--full", action="store_true", help="ignore the cursor and re-sync everything")
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    api_key = os.environ.get("LINEAR_API_KEY")
+    if not api_key:
+        parser.error("LINEAR_API_KEY is not set (see scripts/linear-poller/.env.example)")
+
+    tracker = ccnotify.ClaudePromptTracker()
+    try:
+        poller = Poller(tracker, Client(args.api_url, api_key), os.path.expanduser(args.repo),
+                        args.concurrency)
+        asyncio.run(_run(poller, args.interval, args.full))
+    except LinearError as e:
+        print(f"Linear request failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        tracker.close()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Counters and latency histograms for ccnotify, exported as OpenMetrics.
+
+Hooks are short-lived processes, so each one only accumulates samples in memory
+(inc, observe) and flush() adds them to the metric table in a single upsert when
+the hook is done. Database size and row counters are read when the metrics are
+rendered, from PRAGMAs and sqlite_sequence, so nothing is ever counted twice.
+
+Expose them either as a file for node-exporter's textfile collector
+(--textfile, rewritten atomically, e.g. from cron) or on a localhost endpoint
+for Prometheus to scrape (--serve).
+
+Usage: ccnotify.py metrics [--textfile PATH | --serve [HOST:]PORT]
+"""
+
+import os
+import sys
+
+import ccnotify
+
+# Upper bounds in seconds; hooks are expected to stay in the tens of milliseconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+DEFAULT_LISTEN = "127.0.0.1:9469"
+OPENMETRICS_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# name -> (type, help); render() emits families in this order
+FAMILIES = {
+    "ccnotify_handler_seconds": ("histogram", "Time to handle a hook event, retries included."),
+    "ccnotify_events": ("counter", "Hook events by outcome (handled, spooled, error)."),
+    "ccnotify_focus_check_seconds": ("histogram", "Time to find the frontmost iTerm2 session."),
+    "ccnotify_focus_timeouts": ("counter", "osascript focus checks that timed out."),
+    "ccnotify_notifications": ("counter", "Notifications by outcome (sent, skipped_focused, failed)."),
+    "ccnotify_prompts": ("counter", "Prompt rows ever inserted."),
+    "ccnotify_db_size_bytes": ("gauge", "Size of ccnotify.db and its WAL on disk."),
+    "ccnotify_db_free_bytes": ("gauge", "Free pages in ccnotify.db awaiting incremental vacuum."),
+    "ccnotify_outbox_pending": ("gauge", "Notifications waiting to be delivered."),
+}
+
+# Samples not yet flushed: (name, labels, sample, le) -> value
+_pending = {}
+
+
+def _labels(labels):
+    return ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+
+
+def _add(key, value):
+    _pending[key] = _pending.get(key, 0) + value
+
+
+def inc(name, amount=1, **labels):
+    _add((name, _labels(labels), "_total", ""), amount)
+
+
+def observe(name, seconds, **labels):
+    labels = _labels(labels)
+    le = next(bound for bound in BUCKETS if seconds <= bound)
+    _add((name, labels, "_bucket", _format_value(le)), 1)
+    _add((name, labels, "_count", ""), 1)
+    _add((name, labels, "_sum", ""), seconds)
+
+
+def flush(conn):
+    """Add this process's samples to the metric table; kept for the next flush on failure."""
+    import sqlite3
+
+    if not _pending:
+        return
+    rows = [(*key, value) for key, value in _pending.items()]
+    try:
+        with conn:
+            conn.executemany(
+                """INSERT INTO metric (name, labels, sample, le, value) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (name, labels, sample, le) DO UPDATE SET value = value + excluded.value""",
+                rows,
+            )
+    except sqlite3.Error as e:
+        ccnotify.log.warning("metrics_flush_failed", error=str(e))
+        return
+    _pending.clear()
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _stored(conn):
+    """Persisted samples grouped by family name, buckets made cumulative."""
+    families = {}
+    for name, labels, sample, le, value in conn.execute(
+        "SELECT name, labels, sample, le, value FROM metric ORDER BY name, labels, sample"
+    ):
+        families.setdefault(name, []).append((labels, sample, le, value))
+
+    for name, rows in families.items():
+        series = []
+        for labels in sorted({labels for labels, _, _, _ in rows}):
+            own = [row for row in rows if row[0] == labels]
+            buckets = {le: value for _, sample, le, value in own if sample == "_bucket"}
+            running = 0
+            for bound in BUCKETS if buckets else ():
+                le = _format_value(bound)
+                running += buckets.get(le, 0)
+                series.append(("_bucket", _join(labels, f'le="{le}"'), running))
+            series.extend((sample, labels, value) for _, sample, _, value in own
+                          if sample != "_bucket")
+        families[name] = series
+    return families
+
+
+def _join(*labels):
+    return ",".join(label for label in labels if label)
+
+
+def _database(conn, db_path):
+    """Gauges and counters read straight from the database and its files."""
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    sizes = []
+    # An in-memory database has no files to measure
+    files = (("db", db_path), ("wal", f"{db_path}-wal")) if db_path else ()
+    for label, path in files:
+        try:
+            sizes.append(("", f'file="{label}"', os.path.getsize(path)))
+        except OSError:
+            pass
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'prompt'").fetchone()
+    pending = conn.execute(
+        "SELECT COUNT(*) FROM notification_outbox WHERE state = 'pending'"
+    ).fetchone()[0]
+    return {
+        "ccnotify_prompts": [("_total", "", row[0] if row else 0)],
+        "ccnotify_db_size_bytes": sizes,
+        "ccnotify_db_free_bytes": [("", "", free_pages * page_size)],
+        "ccnotify_outbox_pending": [("", "", pending)],
+    }
+
+
+def render(conn, db_path, openmetrics=True):
+    """Every family in the OpenMetrics text format (or Prometheus 0.0.4 for textfiles)."""
+    families = _stored(conn)
+    families.update(_database(conn, db_path))
+    lines = []
+    for name, (kind, help_text) in FAMILIES.items():
+        # The Prometheus text format names counter families after their _total sample
+        family = name if openmetrics or kind != "counter" else f"{name}_total"
+        lines.append(f"# TYPE {family} {kind}")
+        lines.append(f"# HELP {family} {help_text}")
+        for sample, labels, value in families.get(name, ()):
+            labels = f"{{{labels}}}" if labels else ""
+            lines.append(f"{name}{sample}{labels} {_format_value(value)}")
+    if openmetrics:
+        lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path, text):
+    """Replace path with text in one rename, so the collector never reads half a file."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def make_server(tracker, host, port):
+    """HTTP server for /metrics; OpenMetrics when the scraper asks for it."""
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+            body = render(tracker._connect(), tracker.db_path, openmetrics).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", OPENMETRICS_TYPE if openmetrics else PROMETHEUS_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return HTTPServer((host, port), Handler)
+
+
+def serve(tracker, host, port):
+    """Serve /metrics until interrupted."""
+    server = make_server(tracker, host, port)
+    ccnotify.log.info("metrics_serving", host=host, port=server.server_port)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="ccnotify.py metrics",
+                                     description="Export ccnotify counters and histograms.")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--textfile", help="write Prometheus text to PATH for node-exporter")
+    target.add_argument("--serve", nargs="?", const=DEFAULT_LISTEN, metavar="[HOST:]PORT",
+                        help=f"serve /metrics over HTTP (default: {DEFAULT_LISTEN})")
+    args = parser.parse_args(argv)
+
+    tracker = ccnotify.ClaudePromptTracker()
+    try:
+        if args.serve:
+            host, _, port = args.serve.rpartition(":")
+            try:
+                serve(tracker, host or "127.0.0.1", int(port))
+            except KeyboardInterrupt:
+                pass
+        elif args.textfile:
+            write_textfile(args.textfile, render(tracker._connect(), tracker.db_path, openmetrics=False))
+        else:
+            sys.stdout.write(render(tracker._connect(), tracker.db_path))
+    finally:
+        tracker.close()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Long-lived ccnotify daemon.
+
+Hooks forward their JSON payload over a Unix socket (see ccnotify._forward_to_daemon)
+so the interpreter, logger and SQLite connection stay warm between turns.
+
+A hook is only answered "ok" once its event is committed (or spooled), so an
+event the daemon dies on is never acknowledged and the hook handles it itself.
+Events the worker has not started within DAEMON_TIMEOUT are handed back the same
+way. One it has started must be settled HANDLE_MARGIN before the hook's
+DAEMON_REPLY_TIMEOUT runs out: lock waits are cut off there and the event is
+spooled instead, so a slow daemon never leaves the hook to handle it a second
+time. Notifications go out from a separate delivery thread with its own
+connection, so a slow osascript never holds up the next event.
+
+Usage: ccnotify.py daemon [--socket PATH]
+"""
+
+import argparse
+import json
+import os
+import queue
+import signal
+import socket
+import threading
+import time
+
+import ccnotify
+import outbox
+import retention
+
+MAX_REQUEST_BYTES = 4 * 1024 * 1024
+# How often the worker retries outbox rows when no hooks are arriving
+RETRY_INTERVAL = 5.0
+# How often an idle worker applies the retention policy
+COMPACT_INTERVAL = 6 * 3600
+# Seconds before the hook's reply timeout by which an event must be committed or spooled
+HANDLE_MARGIN = 1.0
+
+
+def _daemon_alive(socket_path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            return False
+    return True
+
+
+def _read_request(conn):
+    """Read one request (and an optional tty fd) until the client closes its end."""
+    data, fds, _, _ = socket.recv_fds(conn, 65536, 1)
+    chunks = [data]
+    size = len(data)
+    try:
+        while data:
+            data = conn.recv(65536)
+            chunks.append(data)
+            size += len(data)
+            if size > MAX_REQUEST_BYTES:
+                raise ValueError(f"request larger than {MAX_REQUEST_BYTES} bytes")
+        request = json.loads(b"".join(chunks))
+    except (OSError, ValueError):
+        for fd in fds:
+            os.close(fd)
+        raise
+    request["tty_fd"] = fds[0] if fds else None
+    return request
+
+
+class NotifyDaemon:
+    def __init__(self, socket_path, tracker_factory=None):
+        self.socket_path = socket_path
+        self.tracker_factory = tracker_factory or ccnotify.ClaudePromptTracker
+        self.requests = queue.Queue()
+        # (iterm_session, tty_fd) drains for the delivery thread; it owns the fd
+        self.deliveries = queue.Queue()
+        self._stopping = threading.Event()
+        self._server = None
+        self._worker = None
+        self._deliverer = None
+        # Guards a request's claimed/cancelled hand-off between server and worker
+        self._claim_lock = threading.Lock()
+        self._compacted_at = float("-inf")
+        # Monotonic time the next held notification group is due, if any
+        self._drain_at = None
+
+    def start(self):
+        if os.path.exists(self.socket_path):
+            if _daemon_alive(self.socket_path):
+                raise RuntimeError(f"ccnotify daemon already listening on {self.socket_path}")
+            os.unlink(self.socket_path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        server.listen(64)
+        server.settimeout(0.5)
+        self._server = server
+
+        # Each thread opens its own tracker (and SQLite connection) and keeps it to itself
+        self._worker = threading.Thread(target=self._work, name="ccnotify-worker", daemon=True)
+        self._worker.start()
+        self._deliverer = threading.Thread(target=self._deliver_loop, name="ccnotify-deliver",
+                                           daemon=True)
+        self._deliverer.start()
+
+    def request_stop(self):
+        self._stopping.set()
+
+    def serve_forever(self):
+        while not self._stopping.is_set():
+            try:
+                conn, _ = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                if self._stopping.is_set():
+                    break
+                raise
+
+            with conn:
+                conn.settimeout(ccnotify.DAEMON_TIMEOUT)
+                try:
+                    request = _read_request(conn)
+                except (OSError, ValueError) as e:
+                    ccnotify.log.warning("daemon_request_dropped", error=str(e))
+                    continue
+                # The hook's reply timeout started when it finished sending
+                request["deadline"] = (time.monotonic() + ccnotify.DAEMON_REPLY_TIMEOUT
+                                       - HANDLE_MARGIN)
+
+                if request.get("event") not in ccnotify.EVENT_HANDLERS:
+                    ccnotify.log.warning("daemon_unknown_event", hook=request.get("event"))
+                    if request["tty_fd"] is not None:
+                        os.close(request["tty_fd"])
+                    continue
+
+                request["done"] = threading.Event()
+                request["claimed"] = request["cancelled"] = request["committed"] = False
+                self.requests.put(request)
+                try:
+                    conn.sendall(b"ok\n" if self._await(request) else b"retry\n")
+                except OSError:
+                    pass
+
+    def _await(self, request):
+        """Wait until the worker has committed the request; False hands it back to the hook."""
+        if not request["done"].wait(ccnotify.DAEMON_TIMEOUT):
+            with self._claim_lock:
+                if not request["claimed"]:
+                    request["cancelled"] = True
+                    if request["tty_fd"] is not None:
+                        os.close(request["tty_fd"])
+                    return False
+            # Started, so it will be handled here; only its outcome is left to wait for
+            request["done"].wait()
+        return request["committed"]
+
+    def stop(self):
+        self._stopping.set()
+        self.requests.put(None)
+        self.deliveries.put(None)
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+        for thread in (self._worker, self._deliverer):
+            if thread is not None:
+                thread.join()
+        self._worker = self._deliverer = None
+
+    def _work(self):
+        tracker = self.tracker_factory()
+        try:
+            while True:
+                try:
+                    request = self.requests.get(timeout=RETRY_INTERVAL)
+                except queue.Empty:
+                    self._replay(tracker)
+                    self._maybe_compact(tracker)
+                    continue
+                if request is None:
+                    break
+                with self._claim_lock:
+                    if request["cancelled"]:
+                        continue
+                    request["claimed"] = True
+                try:
+                    request["committed"] = self._dispatch(tracker, request)
+                finally:
+                    request["done"].set()
+        finally:
+            tracker.close()
+
+    def _dispatch(self, tracker, request):
+        """Handle one event; True once it is committed or spooled."""
+        event_name = request["event"]
+        tty_fd = request.get("tty_fd")
+        tracker.environ = request.get("env") or {}
+        tracker.tty_path = f"/dev/fd/{tty_fd}" if tty_fd is not None else None
+        tracker.enqueued = 0
+        tracker.deadline = request.get("deadline")
+        try:
+            with ccnotify.span(f"daemon:{event_name}"):
+                ccnotify.handle_event(tracker, event_name, request["data"])
+        except Exception as e:
+            ccnotify.log.error("unexpected_error", hook=event_name, error=str(e))
+            return False
+        finally:
+            tracker.deadline = None
+            if tracker.enqueued:
+                self.deliveries.put((tracker.environ.get("ITERM_SESSION_ID"), tty_fd))
+            elif tty_fd is not None:
+                os.close(tty_fd)
+        return True
+
+    def _deliver_loop(self):
+        tracker = self.tracker_factory()
+        try:
+            while True:
+                try:
+                    job = self.deliveries.get(timeout=self._idle_timeout())
+                except queue.Empty:
+                    self._deliver(tracker)
+                    continue
+                if job is None:
+                    break
+                iterm_session, tty_fd = job
+                try:
+                    self._deliver(tracker, iterm_session,
+                                  f"/dev/fd/{tty_fd}" if tty_fd is not None else None)
+                finally:
+                    if tty_fd is not None:
+                        os.close(tty_fd)
+        finally:
+            tracker.close()
+
+    def _replay(self, tracker):
+        """Replay events hooks spooled while the database was locked."""
+        if not ccnotify._spooled():
+            return
+        try:
+            import spool
+            spool.replay(tracker)
+        except Exception as e:
+            ccnotify.log.error("replay_failed", error=str(e))
+
+    def _idle_timeout(self):
+        if self._drain_at is None:
+            return RETRY_INTERVAL
+        return max(0.0, min(RETRY_INTERVAL, self._drain_at - time.monotonic()))
+
+    def _maybe_compact(self, tracker):
+        now = time.monotonic()
+        if now - self._compacted_at < COMPACT_INTERVAL:
+            return
+        self._compacted_at = now
+        try:
+            result = retention.compact(tracker._connect(), **retention.policy_from_env())
+            ccnotify.log.info("compacted", **result._asdict())
+        except Exception as e:
+            ccnotify.log.error("compaction_failed", error=str(e))
+
+    def _deliver(self, tracker, iterm_session=None, tty_path=None):
+        try:
+            box = outbox.Outbox(tracker._connect())
+            box.drain(outbox.make_deliverer(tracker), iterm_session=iterm_session,
+                      tty_path=tty_path)
+            due = box.next_due()
+            self._drain_at = None if due is None else time.monotonic() + due
+        except Exception as e:
+            ccnotify.log.error("outbox_drain_failed", error=str(e))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ccnotify.py daemon",
+                                     description="Serve ccnotify hooks from one long-lived process.")
+    parser.add_argument("--socket", default=ccnotify._socket_path(),
+                        help="Unix socket to listen on (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    daemon = NotifyDaemon(args.socket)
+    daemon.start()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: daemon.request_stop())
+
+    ccnotify.log.info("daemon_started", socket=args.socket)
+    try:
+        daemon.serve_forever()
+    finally:
+        daemon.stop()
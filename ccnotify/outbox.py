@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Notification outbox for ccnotify.
+
+Hooks commit rows into notification_outbox and return; this module drains them
+off the critical path, with retries, per-session ordering and pluggable delivery.
+
+Stop notifications are coalesced: a group (project) is held until its oldest
+pending row is CCNOTIFY_COALESCE_SECONDS old, then everything pending in the
+group goes out as one summary ("3 jobs done in repo-x, longest 12m").
+Permission and other prompts have no group and are delivered straight away.
+
+Usage: ccnotify.py deliver
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import NamedTuple
+
+import ccnotify
+import metrics
+import rollups
+
+LEASE_SECONDS = 30
+MAX_ATTEMPTS = 5
+# Rows from other terminals are only picked up once their own drainer had a chance
+STALE_AFTER = 10
+# How long Stop notifications wait for others from the same project
+COALESCE_SECONDS = 3.0
+
+# Rows a drain may take now; :held is the newest created_at a group's oldest row may have
+_CLAIMABLE = """
+    n.state = 'pending'
+    AND n.next_attempt_at <= :now
+    AND (n.lease_until IS NULL OR n.lease_until < :now)
+    AND (:iterm IS NULL OR n.iterm_session = :iterm OR n.created_at < :stale
+         OR n.group_key IS NOT NULL)
+    AND (n.group_key IS NULL OR EXISTS (
+        SELECT 1 FROM notification_outbox AS g
+        WHERE g.state = 'pending' AND g.group_key = n.group_key AND g.created_at <= :held
+    ))
+    AND NOT EXISTS (
+        SELECT 1 FROM notification_outbox AS o
+        WHERE o.state = 'pending' AND o.session_id = n.session_id AND o.id < n.id
+          AND (o.next_attempt_at > :now OR o.lease_until >= :now)
+    )
+"""
+
+
+class Notification(NamedTuple):
+    id: int
+    session_id: str
+    iterm_session: str
+    title: str
+    subtitle: str
+    cwd: str
+    attempts: int
+    group_key: str = None
+    prompt_id: int = None
+    seconds: int = None
+
+
+class TrackerDeliverer:
+    """Deliver through ClaudePromptTracker.send_notification (osascript, terminal-notifier, tty flash)."""
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+
+    def deliver(self, note, tty_path):
+        environ, saved_tty = self.tracker.environ, self.tracker.tty_path
+        self.tracker.environ = {"ITERM_SESSION_ID": note.iterm_session} if note.iterm_session else {}
+        self.tracker.tty_path = tty_path
+        try:
+            self.tracker.send_notification(note.title, note.subtitle, cwd=note.cwd)
+        finally:
+            self.tracker.environ, self.tracker.tty_path = environ, saved_tty
+
+
+class RecordingDeliverer:
+    """Stand-in that records deliveries instead of touching the desktop."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.delivered = []
+
+    def deliver(self, note, tty_path):
+        self.delivered.append(note)
+        if self.path:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(note._asdict()) + "\n")
+
+
+def make_deliverer(tracker):
+    """Pick the deliverer named by CCNOTIFY_DELIVERER (default: terminal-notifier)."""
+    if os.environ.get("CCNOTIFY_DELIVERER") == "record":
+        return RecordingDeliverer(os.environ.get("CCNOTIFY_RECORD_PATH"))
+    return TrackerDeliverer(tracker)
+
+
+def coalesce_window():
+    try:
+        return max(0.0, float(os.environ.get("CCNOTIFY_COALESCE_SECONDS", COALESCE_SECONDS)))
+    except ValueError:
+        return COALESCE_SECONDS
+
+
+def summarize(notes):
+    """The one notification a batch goes out as; a batch of one is left as it is."""
+    if len(notes) == 1:
+        return notes[0]
+    lead = notes[0]
+    longest = max((note.seconds or 0) for note in notes)
+    return lead._replace(
+        title=lead.group_key,
+        subtitle=f"{len(notes)} jobs done in {lead.group_key}, "
+                 f"longest {rollups.format_seconds(longest)}",
+    )
+
+
+class Outbox:
+    def __init__(self, conn, window=None):
+        self.conn = conn
+        self.window = coalesce_window() if window is None else window
+
+    def claim(self, iterm_session=None, now=None):
+        """Lease every deliverable row, oldest first.
+
+        With iterm_session set, only that terminal's rows plus stale orphans are
+        taken. A row is skipped while an earlier row of the same session is still
+        waiting on a retry or leased elsewhere, which keeps per-session order.
+        Grouped rows are held until their group's oldest pending row has waited
+        out the window, and are then taken whole, whichever terminal they're from.
+        """
+        now = time.time() if now is None else now
+        with self.conn:
+            rows = self.conn.execute(
+                f"""UPDATE notification_outbox AS n SET lease_until = :lease
+                   WHERE {_CLAIMABLE}
+                   RETURNING id, session_id, iterm_session, title, subtitle, cwd, attempts,
+                             group_key, prompt_id, seconds""",
+                {"lease": now + LEASE_SECONDS, "now": now, "iterm": iterm_session,
+                 "stale": now - STALE_AFTER, "held": now - self.window},
+            ).fetchall()
+        return sorted((Notification(*row) for row in rows), key=lambda n: n.id)
+
+    def has_work(self, iterm_session=None, now=None):
+        """Whether a drain would deliver anything, now or once a held group is due."""
+        now = time.time() if now is None else now
+        return self.conn.execute(
+            f"SELECT EXISTS (SELECT 1 FROM notification_outbox AS n WHERE {_CLAIMABLE})",
+            {"now": now, "iterm": iterm_session, "stale": now - STALE_AFTER, "held": now},
+        ).fetchone()[0] == 1
+
+    def next_due(self, now=None):
+        """Seconds until the next held group can be delivered, or None if nothing is held."""
+        now = time.time() if now is None else now
+        oldest = self.conn.execute(
+            """SELECT MIN(created_at) FROM notification_outbox
+               WHERE state = 'pending' AND group_key IS NOT NULL
+                 AND next_attempt_at <= :now AND (lease_until IS NULL OR lease_until < :now)""",
+            {"now": now},
+        ).fetchone()[0]
+        return None if oldest is None else max(0.0, oldest + self.window - now)
+
+    def drain(self, deliverer, iterm_session=None, tty_path=None, wait=False):
+        """Deliver until nothing is claimable; returns the number delivered.
+
+        tty_path is only handed to rows from iterm_session, since it is that
+        terminal's background that gets flashed. With wait set, held groups are
+        waited out instead of being left for the next drain.
+        """
+        total = 0
+        while True:
+            delivered = self._drain_once(deliverer, iterm_session, tty_path)
+            total += delivered
+            if delivered:
+                metrics.flush(self.conn)
+                continue
+            due = self.next_due() if wait else None
+            if not due:
+                return total
+            time.sleep(due)
+
+    def drain_exclusive(self, deliverer, iterm_session=None, tty_path=None):
+        """drain(wait=True) under the terminal's drainer lock; returns the number delivered.
+
+        Returns 0 at once if another drainer holds the lock. Hooks skip spawning a
+        drainer while it is held, so after letting go this takes it back for any
+        rows they queued in the meantime.
+        """
+        path = ccnotify.deliver_lock_path(iterm_session)
+        delivered = 0
+        lock = _try_lock(path)
+        while lock is not None:
+            try:
+                delivered += self.drain(deliverer, iterm_session, tty_path, wait=True)
+            finally:
+                os.close(lock)
+            lock = _try_lock(path) if self.has_work(iterm_session) else None
+        return delivered
+
+    @staticmethod
+    def _batches(notes):
+        """Split claimed rows into deliveries: one per ungrouped row, one per group."""
+        groups = {}
+        for note in notes:
+            groups.setdefault(note.group_key or ("row", note.id), []).append(note)
+        return sorted(groups.values(), key=lambda batch: batch[0].id)
+
+    def _drain_once(self, deliverer, iterm_session, tty_path):
+        delivered = 0
+        blocked = set()
+        for batch in self._batches(self.claim(iterm_session)):
+            held = [note for note in batch if note.session_id in blocked]
+            for note in held:
+                self._release(note)
+            batch = [note for note in batch if note.session_id not in blocked]
+            if not batch:
+                continue
+            note = summarize(batch)
+            try:
+                with ccnotify.span("deliver", group=note.group_key, notes=len(batch)):
+                    deliverer.deliver(note, tty_path if note.iterm_session == iterm_session else None)
+            except Exception as e:
+                ccnotify.log.warning("delivery_failed", outbox_id=note.id, session_id=note.session_id,
+                                     error=str(e))
+                for row in batch:
+                    self._fail(row, e)
+                    blocked.add(row.session_id)
+                continue
+            self._finish(batch)
+            if len(batch) > 1:
+                ccnotify.log.info("notifications_coalesced", summary_of=note.id,
+                                  group=note.group_key, subtitle=note.subtitle,
+                                  prompt_ids=[row.prompt_id for row in batch])
+            delivered += 1
+        return delivered
+
+    def covered_prompts(self, summary_id):
+        """Prompt ids of the jobs a merged notification reported."""
+        return [prompt_id for (prompt_id,) in self.conn.execute(
+            "SELECT prompt_id FROM notification_outbox WHERE summary_of = ? ORDER BY id",
+            (summary_id,),
+        )]
+
+    def _finish(self, batch):
+        summary_of = batch[0].id if len(batch) > 1 else None
+        with self.conn:
+            self.conn.executemany(
+                """UPDATE notification_outbox
+                   SET state = 'delivered', delivered_at = ?, lease_until = NULL,
+                       attempts = attempts + 1, summary_of = ?
+                   WHERE id = ?""",
+                [(time.time(), summary_of, note.id) for note in batch],
+            )
+
+    def _release(self, note):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE notification_outbox SET lease_until = NULL WHERE id = ?", (note.id,)
+            )
+
+    def _fail(self, note, error):
+        attempts = note.attempts + 1
+        state = "failed" if attempts >= MAX_ATTEMPTS else "pending"
+        with self.conn:
+            self.conn.execute(
+                """UPDATE notification_outbox
+                   SET state = ?, attempts = ?, next_attempt_at = ?, lease_until = NULL,
+                       last_error = ?
+                   WHERE id = ?""",
+                (state, attempts, time.time() + 2 ** attempts, str(error), note.id),
+            )
+
+
+def _try_lock(path):
+    """An fd holding an exclusive flock on path, or None if someone else holds it."""
+    import fcntl
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ccnotify.py deliver",
+                                     description="Deliver queued ccnotify notifications.")
+    parser.parse_args(argv)
+
+    tracker = ccnotify.ClaudePromptTracker()
+    try:
+        delivered = Outbox(tracker._connect()).drain_exclusive(
+            make_deliverer(tracker),
+            iterm_session=os.environ.get("ITERM_SESSION_ID") or None,
+            tty_path=tracker.tty_path,
+        )
+        ccnotify.log.info("outbox_drained", delivered=delivered)
+    finally:
+        tracker.close()
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+Retention and compaction for ccnotify.db.
+
+Jobs still open ABANDON_HOURS after they started are closed first, since a
+session that crashed or was killed never sends the Stop (or SessionEnd) that
+would; SessionEnd hooks also run that sweep, at most hourly, for setups
+without the daemon. Finished prompts older than the age policy, or beyond the
+newest MAX_ROWS, then move out of the hot `prompt` table into per-month
+prompt_archive_YYYYMM tables. There the cwd is stored once in the `cwd` lookup
+table and long prompt bodies are zlib compressed. Whole months can be dropped
+once they age out. Delivered outbox rows and the duration sketches of sessions
+idle for SESSION_SKETCH_KEEP_DAYS are pruned, and freed pages are returned with
+incremental vacuum so the hot table stays small.
+
+Usage: ccnotify.py compact [--max-age-days N] [--max-rows N] [--keep-months N]
+                          [--abandon-hours N] [--vacuum]
+"""
+
+import argparse
+import os
+import re
+import time
+import zlib
+from typing import NamedTuple
+
+import ccnotify
+
+# Hot-table policy: archive finished prompts older than this or beyond this many rows
+MAX_AGE_DAYS = 30
+MAX_ROWS = 50000
+# Archived months kept; 0 keeps them forever
+KEEP_MONTHS = 0
+# Open jobs older than this are closed as abandoned; 0 leaves them open
+ABANDON_HOURS = 24
+# SessionEnd hooks run the abandoned-job sweep at most this often
+SWEEP_INTERVAL = 3600
+# Delivered or failed outbox rows are only kept for debugging
+OUTBOX_KEEP_DAYS = 7
+# Per-session duration sketches are dropped once the session has been idle this long
+SESSION_SKETCH_KEEP_DAYS = 30
+# Prompt bodies at least this long are stored compressed
+COMPRESS_MIN_BYTES = 256
+BATCH_SIZE = 5000
+
+_MONTH_RE = re.compile(r"\d{4}-\d{2}")
+
+
+class ArchivedPrompt(NamedTuple):
+    id: int
+    session_id: str
+    created_at: str
+    stoped_at: str
+    last_wait_user_at: str
+    seq: int
+    cwd: str
+    prompt: str
+
+
+class CompactionResult(NamedTuple):
+    abandoned: int
+    archived: int
+    dropped_months: list
+    outbox_pruned: int
+    sketches_pruned: int
+    pages_freed: int
+
+
+def policy_from_env(environ=None):
+    """Age/row/month limits, overridable with CCNOTIFY_RETAIN_DAYS, _ROWS and _MONTHS,
+    and the abandoned-job cutoff, CCNOTIFY_ABANDON_HOURS."""
+    environ = os.environ if environ is None else environ
+    return {
+        "max_age_days": float(environ.get("CCNOTIFY_RETAIN_DAYS", MAX_AGE_DAYS)),
+        "max_rows": int(environ.get("CCNOTIFY_RETAIN_ROWS", MAX_ROWS)),
+        "keep_months": int(environ.get("CCNOTIFY_RETAIN_MONTHS", KEEP_MONTHS)),
+        "abandon_hours": float(environ.get("CCNOTIFY_ABANDON_HOURS", ABANDON_HOURS)),
+    }
+
+
+def abandon_stale(conn, abandon_hours, now):
+    """Close jobs open longer than abandon_hours, recording them in prompt_end.
+
+    Runs in the caller's transaction and records the sweep time in meta;
+    returns how many jobs were closed. A status line still showing one of them
+    as running is cleared, since no Stop will come to rewrite it.
+    """
+    import statusline
+
+    cutoff = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now - abandon_hours * 3600))
+    ended = conn.execute(
+        """UPDATE prompt SET stoped_at = ?
+           WHERE stoped_at IS NULL AND created_at < ?
+           RETURNING id, session_id, seq""",
+        (time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now)), cutoff),
+    ).fetchall()
+    conn.executemany(
+        "INSERT OR REPLACE INTO prompt_end (prompt_id, reason) VALUES (?, 'abandoned')",
+        [(prompt_id,) for prompt_id, _, _ in ended],
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO meta (key, value) VALUES ('abandon_swept_at', ?)", (now,)
+    )
+    for _, session_id, seq in ended:
+        job = statusline.load(session_id)
+        if job and job[0] == seq and job[2] is None:
+            statusline.clear(session_id)
+    return len(ended)
+
+
+def sweep_if_due(conn, environ=None, now=None):
+    """abandon_stale() from a hook, in its transaction, at most once per SWEEP_INTERVAL.
+
+    The daemon sweeps with every compaction; this keeps setups without it from
+    showing crashed sessions' jobs as running forever.
+    """
+    abandon_hours = policy_from_env(environ)["abandon_hours"]
+    now = time.time() if now is None else now
+    if not abandon_hours:
+        return 0
+    row = conn.execute("SELECT value FROM meta WHERE key = 'abandon_swept_at'").fetchone()
+    if row and now - row[0] < SWEEP_INTERVAL:
+        return 0
+    return abandon_stale(conn, abandon_hours, now)
+
+
+def partition_table(month):
+    """Table name for a 'YYYY-MM' month; validated since it is interpolated into SQL."""
+    if not _MONTH_RE.fullmatch(month or ""):
+        raise ValueError(f"bad archive month: {month!r}")
+    return f"prompt_archive_{month.replace('-', '')}"
+
+
+def pack_prompt(text):
+    """Return (prompt, prompt_z): short text as-is, long text zlib-compressed."""
+    if text is None:
+        return None, None
+    raw = text.encode("utf-8")
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return text, None
+    return None, zlib.compress(raw, 6)
+
+
+def unpack_prompt(prompt, prompt_z):
+    if prompt_z is not None:
+        return zlib.decompress(prompt_z).decode("utf-8")
+    return prompt
+
+
+class Compactor:
+    def __init__(self, conn, max_age_days=MAX_AGE_DAYS, max_rows=MAX_ROWS,
+                 keep_months=KEEP_MONTHS, abandon_hours=ABANDON_HOURS, now=None):
+        self.conn = conn
+        self.max_age_days = max_age_days
+        self.max_rows = max_rows
+        self.keep_months = keep_months
+        self.abandon_hours = abandon_hours
+        self.now = time.time() if now is None else now
+        self._load_caches()
+
+    def _load_caches(self):
+        self._cwd_ids = {}
+        self._partitions = {
+            month for (month,) in self.conn.execute("SELECT month FROM prompt_archive")
+        }
+
+    def run(self):
+        abandoned = self.abandon_stale()
+        archived = self.archive()
+        dropped = self.drop_expired_months()
+        pruned = self.prune_outbox()
+        sketches = self.prune_session_sketches()
+        return CompactionResult(abandoned, archived, dropped, pruned, sketches,
+                                self.incremental_vacuum())
+
+    def abandon_stale(self):
+        if not self.abandon_hours:
+            return 0
+        with self.conn:
+            return abandon_stale(self.conn, self.abandon_hours, self.now)
+
+    def _cutoffs(self):
+        cutoff_time = time.strftime(
+            "%Y-%m-%d %H:%M:%S", time.gmtime(self.now - self.max_age_days * 86400)
+        )
+        row = None
+        if self.max_rows:
+            row = self.conn.execute(
+                "SELECT id FROM prompt ORDER BY id DESC LIMIT 1 OFFSET ?", (self.max_rows,)
+            ).fetchone()
+        return cutoff_time, row[0] if row else 0
+
+    def archive(self):
+        """Move prompts past the age or row policy into monthly partitions.
+
+        Open jobs are never moved, so Stop and Notification hooks always find
+        their row in the hot table. Each batch is one write transaction.
+        """
+        cutoff_time, cutoff_id = self._cutoffs()
+        total = 0
+        while True:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.conn.execute(
+                    """SELECT id, session_id, created_at, stoped_at, lastWaitUserAt, seq,
+                              cwd, prompt
+                       FROM prompt
+                       WHERE stoped_at IS NOT NULL AND (created_at < ? OR id <= ?)
+                       ORDER BY id LIMIT ?""",
+                    (cutoff_time, cutoff_id, BATCH_SIZE),
+                ).fetchall()
+                by_month = {}
+                for row in rows:
+                    by_month.setdefault((row[2] or "")[:7], []).append(row)
+                for month, batch in by_month.items():
+                    self._insert(month, batch)
+                self.conn.executemany("DELETE FROM prompt WHERE id = ?",
+                                      [(row[0],) for row in rows])
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                # Cached cwd ids and partitions may name rows that were rolled back
+                self._load_caches()
+                raise
+            total += len(rows)
+            if len(rows) < BATCH_SIZE:
+                return total
+
+    def _insert(self, month, rows):
+        table = self._partition(month)
+        packed = []
+        for row_id, session_id, created_at, stoped_at, wait_at, seq, cwd, prompt in rows:
+            text, compressed = pack_prompt(prompt)
+            packed.append((row_id, session_id, created_at, stoped_at, wait_at, seq,
+                           self._cwd_id(cwd), text, compressed))
+        self.conn.executemany(
+            f"""INSERT INTO {table}
+                (id, session_id, created_at, stoped_at, lastWaitUserAt, seq, cwd_id,
+                 prompt, prompt_z)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            packed,
+        )
+        self.conn.execute(
+            "UPDATE prompt_archive SET row_count = row_count + ? WHERE month = ?",
+            (len(packed), month),
+        )
+
+    def _partition(self, month):
+        table = partition_table(month)
+        if month not in self._partitions:
+            self.conn.execute(
+                f"""CREATE TABLE IF NOT EXISTS {table} (
+                    id INTEGER PRIMARY KEY,
+                    session_id TEXT NOT NULL,
+                    created_at DATETIME,
+                    stoped_at DATETIME,
+                    lastWaitUserAt DATETIME,
+                    seq INTEGER,
+                    cwd_id INTEGER REFERENCES cwd (id),
+                    prompt TEXT,
+                    prompt_z BLOB
+                )"""
+            )
+            self.conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{table}_session ON {table} (session_id)"
+            )
+            self.conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{table}_cwd ON {table} (cwd_id, created_at)"
+            )
+            self.conn.execute(
+                "INSERT OR IGNORE INTO prompt_archive (month, table_name) VALUES (?, ?)",
+                (month, table),
+            )
+            self._partitions.add(month)
+        return table
+
+    def _cwd_id(self, path):
+        if path is None:
+            return None
+        if path not in self._cwd_ids:
+            self._cwd_ids[path] = self.conn.execute(
+                """INSERT INTO cwd (path) VALUES (?)
+                   ON CONFLICT (path) DO UPDATE SET path = excluded.path
+                   RETURNING id""",
+                (path,),
+            ).fetchone()[0]
+        return self._cwd_ids[path]
+
+    def drop_expired_months(self):
+        """Drop whole archived months older than keep_months; returns their names."""
+        if not self.keep_months:
+            return []
+        year, month = time.gmtime(self.now)[:2]
+        index = year * 12 + month - 1 - self.keep_months
+        oldest_kept = f"{index // 12:04d}-{index % 12 + 1:02d}"
+        expired = [m for m in sorted(self._partitions) if m < oldest_kept]
+        with self.conn:
+            for month in expired:
+                table = partition_table(month)
+                # The full-text index is contentless, so removal needs the original text
+                self.conn.executemany(
+                    "INSERT INTO prompt_fts (prompt_fts, rowid, prompt) VALUES ('delete', ?, ?)",
+                    [(row_id, unpack_prompt(text, packed)) for row_id, text, packed in
+                     self.conn.execute(f"SELECT id, prompt, prompt_z FROM {table}")],
+                )
+                self.conn.execute(
+                    f"DELETE FROM prompt_end WHERE prompt_id IN (SELECT id FROM {table})"
+                )
+                self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+                self.conn.execute("DELETE FROM prompt_archive WHERE month = ?", (month,))
+                self._partitions.discard(month)
+        return expired
+
+    def prune_outbox(self):
+        with self.conn:
+            return self.conn.execute(
+                "DELETE FROM notification_outbox WHERE state != 'pending' AND created_at < ?",
+                (self.now - OUTBOX_KEEP_DAYS * 86400,),
+            ).rowcount
+
+    def prune_session_sketches(self):
+        # durations.record() writes one per session; project sketches are kept for good
+        with self.conn:
+            return self.conn.execute(
+                "DELETE FROM duration_sketch WHERE scope = 'session' AND updated_at < ?",
+                (self.now - SESSION_SKETCH_KEEP_DAYS * 86400,),
+            ).rowcount
+
+    def incremental_vacuum(self):
+        """Return free pages to the filesystem; a no-op unless auto_vacuum is INCREMENTAL."""
+        before = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # execute() steps the pragma once, which frees a single page; executescript runs it out
+        self.conn.executescript("PRAGMA incremental_vacuum")
+        return before - self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def enable_incremental_vacuum(conn):
+    """Switch an existing database to incremental auto_vacuum with a one-off VACUUM.
+
+    VACUUM rewrites the whole file and holds the write lock while it does, so
+    this only runs on request (compact --vacuum), never from the daemon.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+
+def iter_prompts(conn, session_id=None, since=None, until=None):
+    """Yield ArchivedPrompt rows from the archive and then the hot table, oldest first.
+
+    since/until are 'YYYY-MM-DD HH:MM:SS' UTC strings like created_at; only the
+    monthly partitions that overlap the window are read.
+    """
+    months = [m for (m,) in conn.execute("SELECT month FROM prompt_archive ORDER BY month")]
+    clauses, params = [], []
+    if session_id is not None:
+        clauses.append("p.session_id = ?")
+        params.append(session_id)
+    if since is not None:
+        clauses.append("p.created_at >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("p.created_at <= ?")
+        params.append(until)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    for month in months:
+        if (since is not None and month < since[:7]) or (until is not None and month > until[:7]):
+            continue
+        for row in conn.execute(
+            f"""SELECT p.id, p.session_id, p.created_at, p.stoped_at, p.lastWaitUserAt,
+                       p.seq, c.path, p.prompt, p.prompt_z
+                FROM {partition_table(month)} AS p LEFT JOIN cwd AS c ON c.id = p.cwd_id
+                {where} ORDER BY p.id""",
+            params,
+        ):
+            yield ArchivedPrompt(*row[:7], unpack_prompt(row[7], row[8]))
+
+    for row in conn.execute(
+        f"""SELECT p.id, p.session_id, p.created_at, p.stoped_at, p.lastWaitUserAt,
+                   p.seq, p.cwd, p.prompt
+            FROM prompt AS p {where} ORDER BY p.id""",
+        params,
+    ):
+        yield ArchivedPrompt(*row)
+
+
+def prompt_rows_sql(conn):
+    """Subquery over hot and archived prompts, without the prompt text.
+
+    Columns: id, session_id, created_at, stoped_at, lastWaitUserAt, seq, cwd.
+    Lets aggregate queries run in SQL instead of decompressing through iter_prompts.
+    """
+    parts = ["SELECT id, session_id, created_at, stoped_at, lastWaitUserAt, seq, cwd FROM prompt"]
+    for (month,) in conn.execute("SELECT month FROM prompt_archive ORDER BY month"):
+        parts.append(
+            f"""SELECT p.id, p.session_id, p.created_at, p.stoped_at, p.lastWaitUserAt,
+                       p.seq, c.path
+                FROM {partition_table(month)} AS p LEFT JOIN cwd AS c ON c.id = p.cwd_id"""
+        )
+    return "(" + " UNION ALL ".join(parts) + ")"
+
+
+def compact(conn, **policy):
+    return Compactor(conn, **policy).run()
+
+
+def main(argv=None):
+    defaults = policy_from_env()
+    parser = argparse.ArgumentParser(prog="ccnotify.py compact",
+                                     description="Archive, prune and vacuum ccnotify.db.")
+    parser.add_argument("--max-age-days", type=float, default=defaults["max_age_days"])
+    parser.add_argument("--max-rows", type=int, default=defaults["max_rows"],
+                        help="finished prompts kept in the hot table (0: no limit)")
+    parser.add_argument("--keep-months", type=int, default=defaults["keep_months"],
+                        help="archived months kept (0: forever)")
+    parser.add_argument("--abandon-hours", type=float, default=defaults["abandon_hours"],
+                        help="close jobs open this long as abandoned (0: never)")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="convert an older database to incremental auto_vacuum first")
+    args = parser.parse_args(argv)
+
+    tracker = ccnotify.ClaudePromptTracker()
+    try:
+        conn = tracker._connect()
+        if args.vacuum and enable_incremental_vacuum(conn):
+            print("Converted ccnotify.db to incremental auto_vacuum")
+        result = compact(conn, max_age_days=args.max_age_days, max_rows=args.max_rows,
+                         keep_months=args.keep_months, abandon_hours=args.abandon_hours)
+    finally:
+        tracker.close()
+
+    ccnotify.log.info("compacted", **result._asdict())
+    print(f"abandoned {result.abandoned} open job(s), archived {result.archived} prompt(s), "
+          f"dropped {len(result.dropped_months)} month(s), "
+          f"pruned {result.outbox_pruned} outbox row(s) and "
+          f"{result.sketches_pruned} session sketch(es), freed {result.pages_freed} page(s)")
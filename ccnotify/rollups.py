@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Usage rollups for ccnotify.
+
+Per project per day, and per session: jobs finished, total agent time, and time
+spent waiting on the user. A project is ccnotify.notification_group(cwd), so every
+worktree of a repo counts as that repo, the same key the duration sketches use. The hooks update the rollups inside their own
+transactions, so `stats` only ever reads these small tables. `--rebuild`
+recomputes them from the raw prompt rows, archived ones included.
+
+Usage: ccnotify.py stats [--by project|day|session] [--days N] [--project TEXT]
+                         [--json] [--rebuild]
+"""
+
+import json
+import sys
+import time
+
+import ccnotify
+
+# Whole seconds between two timestamps, never negative; jobs are booked on the
+# local day they started
+_SECONDS = "MAX(0, CAST(round((julianday({end}) - julianday({start})) * 86400) AS INTEGER))"
+
+_RECORD_DAILY = """
+    INSERT INTO rollup_daily (project, day, jobs, agent_seconds, waits, wait_seconds)
+    VALUES (:project, date(:created_at, 'localtime'), :jobs, {agent}, :waits, {wait})
+    ON CONFLICT (project, day) DO UPDATE SET
+        jobs = jobs + excluded.jobs,
+        agent_seconds = agent_seconds + excluded.agent_seconds,
+        waits = waits + excluded.waits,
+        wait_seconds = wait_seconds + excluded.wait_seconds
+"""
+
+_RECORD_SESSION = """
+    INSERT INTO rollup_session
+        (session_id, project, first_at, last_at, jobs, agent_seconds, waits, wait_seconds)
+    VALUES (:session_id, :project, :created_at, :created_at, :jobs, {agent}, :waits, {wait})
+    ON CONFLICT (session_id) DO UPDATE SET
+        project = CASE WHEN excluded.jobs THEN excluded.project ELSE project END,
+        first_at = MIN(first_at, excluded.first_at),
+        last_at = MAX(last_at, excluded.last_at),
+        jobs = jobs + excluded.jobs,
+        agent_seconds = agent_seconds + excluded.agent_seconds,
+        waits = waits + excluded.waits,
+        wait_seconds = wait_seconds + excluded.wait_seconds
+"""
+
+_ELAPSED = _SECONDS.format(start=":start", end=":end")
+RECORD_JOB = [sql.format(agent=_ELAPSED, wait="0") for sql in (_RECORD_DAILY, _RECORD_SESSION)]
+RECORD_WAIT = [sql.format(agent="0", wait=_ELAPSED) for sql in (_RECORD_DAILY, _RECORD_SESSION)]
+
+
+def record_job(conn, session_id, cwd, created_at, stoped_at):
+    """Count a finished job; called inside the Stop transaction."""
+    params = {"session_id": session_id, "project": ccnotify.notification_group(cwd),
+              "created_at": created_at, "jobs": 1, "waits": 0, "start": created_at, "end": stoped_at}
+    for sql in RECORD_JOB:
+        conn.execute(sql, params)
+
+
+def record_wait(conn, session_id, cwd, created_at, waited_since, answered_at):
+    """Count a wait on the user that ended at answered_at; called on the next prompt.
+
+    The wait is booked against the job that was waiting (its project and day).
+    """
+    params = {"session_id": session_id, "project": ccnotify.notification_group(cwd),
+              "created_at": created_at, "jobs": 0, "waits": 1, "start": waited_since, "end": answered_at}
+    for sql in RECORD_WAIT:
+        conn.execute(sql, params)
+
+
+def rebuild(conn):
+    """Recompute both rollup tables from every prompt row, in one transaction."""
+    import retention
+
+    rows = retention.prompt_rows_sql(conn)
+    agent = _SECONDS.format(start="created_at", end="stoped_at")
+    wait = _SECONDS.format(start="lastWaitUserAt", end="next_at")
+    conn.create_function("notification_group", 1, ccnotify.notification_group,
+                         deterministic=True)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DROP TABLE IF EXISTS temp.rollup_rows")
+        conn.execute(
+            f"""CREATE TEMP TABLE rollup_rows AS
+                WITH ordered AS (
+                    SELECT id, session_id, notification_group(cwd) AS project, created_at,
+                           -- Jobs closed by SessionEnd or the abandoned sweep have no real duration
+                           CASE WHEN id IN (SELECT prompt_id FROM prompt_end) THEN NULL
+                                ELSE stoped_at END AS stoped_at,
+                           lastWaitUserAt,
+                           LEAD(created_at) OVER (PARTITION BY session_id ORDER BY id) AS next_at
+                    FROM {rows}
+                )
+                SELECT id, session_id, project, created_at,
+                       stoped_at IS NOT NULL AS jobs,
+                       CASE WHEN stoped_at IS NOT NULL THEN {agent} ELSE 0 END AS agent_seconds,
+                       lastWaitUserAt IS NOT NULL AND next_at IS NOT NULL AS waits,
+                       CASE WHEN lastWaitUserAt IS NOT NULL AND next_at IS NOT NULL
+                            THEN {wait} ELSE 0 END AS wait_seconds
+                FROM ordered
+                WHERE stoped_at IS NOT NULL
+                   OR (lastWaitUserAt IS NOT NULL AND next_at IS NOT NULL)"""
+        )
+        conn.execute("CREATE INDEX temp.idx_rollup_rows ON rollup_rows (session_id, jobs, id)")
+        conn.execute("DELETE FROM rollup_daily")
+        conn.execute("DELETE FROM rollup_session")
+        conn.execute(
+            """INSERT INTO rollup_daily (project, day, jobs, agent_seconds, waits, wait_seconds)
+                SELECT project, date(created_at, 'localtime'), SUM(jobs), SUM(agent_seconds),
+                       SUM(waits), SUM(wait_seconds)
+                FROM rollup_rows GROUP BY 1, 2"""
+        )
+        conn.execute(
+            """INSERT INTO rollup_session
+                   (session_id, project, first_at, last_at, jobs, agent_seconds, waits,
+                    wait_seconds)
+               SELECT session_id,
+                      (SELECT r.project FROM rollup_rows AS r
+                       WHERE r.session_id = s.session_id
+                       ORDER BY r.jobs DESC, r.id DESC LIMIT 1),
+                      MIN(created_at), MAX(created_at), SUM(jobs), SUM(agent_seconds),
+                      SUM(waits), SUM(wait_seconds)
+               FROM rollup_rows AS s GROUP BY session_id"""
+        )
+        count = conn.execute("SELECT COUNT(*) FROM rollup_rows").fetchone()[0]
+        conn.execute("DROP TABLE temp.rollup_rows")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return count
+
+
+def query(conn, by="project", days=7, project=None, limit=50):
+    """Read rollups as a list of dicts, busiest first."""
+    since = time.strftime("%Y-%m-%d", time.localtime(time.time() - (days - 1) * 86400)) \
+        if days else None
+    totals = ("SUM(jobs) AS jobs, SUM(agent_seconds) AS agent_seconds, "
+              "SUM(waits) AS waits, SUM(wait_seconds) AS wait_seconds")
+    clauses, params = [], []
+    if since:
+        clauses.append("last_at >= ?" if by == "session" else "day >= ?")
+        params.append(since)
+    if project:
+        clauses.append("project LIKE ?")
+        params.append(f"%{project}%")
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    if by == "session":
+        sql = f"""SELECT session_id, project, first_at, last_at, jobs, agent_seconds, waits,
+                         wait_seconds
+                  FROM rollup_session {where} ORDER BY last_at DESC LIMIT ?"""
+    elif by == "day":
+        sql = f"SELECT day, {totals} FROM rollup_daily {where} GROUP BY day ORDER BY day DESC LIMIT ?"
+    else:
+        sql = (f"SELECT project, {totals} FROM rollup_daily {where} "
+               "GROUP BY project ORDER BY agent_seconds DESC LIMIT ?")
+    cursor = conn.execute(sql, [*params, limit])
+    names = [d[0] for d in cursor.description]
+    return [dict(zip(names, row)) for row in cursor]
+
+
+def format_seconds(seconds):
+    seconds = int(seconds or 0)
+    if seconds < 60:
+        return f"{seconds}s"
+    hours, remainder = divmod(seconds, 3600)
+    minutes = remainder // 60
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m"
+
+
+def _print_table(rows, by):
+    if not rows:
+        print("No jobs recorded in this window (run `ccnotify.py stats --rebuild` after upgrading)")
+        return
+    key = {"project": "project", "day": "day", "session": "session_id"}[by]
+    width = max(len(key), *(len(_label(row, key)) for row in rows))
+    print(f"{key:<{width}}  {'jobs':>6}  {'agent':>8}  {'waits':>6}  {'waiting':>8}")
+    for row in rows:
+        print(f"{_label(row, key):<{width}}  {row['jobs']:>6}  "
+              f"{format_seconds(row['agent_seconds']):>8}  {row['waits']:>6}  "
+              f"{format_seconds(row['wait_seconds']):>8}")
+
+
+def _label(row, key):
+    value = row[key] or "-"
+    if key == "project":
+        return value.rstrip("/").rsplit("/", 1)[-1] or value
+    return value
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="ccnotify.py stats",
+                                     description="Show job counts, agent time and waits.")
+    parser.add_argument("--by", choices=("project", "day", "session"), default="project")
+    parser.add_argument("--days", type=int, default=7, help="window in days (0: all time)")
+    parser.add_argument("--project", help="only projects whose name contains this")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="recompute the rollups from the raw prompt rows first")
+    args = parser.parse_args(argv)
+
+    tracker = ccnotify.ClaudePromptTracker()
+    try:
+        conn = tracker._connect()
+        if args.rebuild:
+            started = time.perf_counter()
+            count = rebuild(conn)
+            print(f"Rebuilt rollups from {count} prompt row(s) in "
+                  f"{time.perf_counter() - started:.2f}s", file=sys.stderr)
+        rows = query(conn, args.by, args.days, args.project, args.limit)
+    finally:
+        tracker.close()
+
+    if args.json:
+        json.dump(rows, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        _print_table(rows, args.by)
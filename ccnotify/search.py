@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Full-text search over the prompts ccnotify has recorded.
+
+Keywords go through the prompt_fts index (ranked by bm25), dates through
+idx_prompt_created and projects through idx_prompt_cwd, for both the hot table
+and any archived months in range. Results come out one JSON object per session,
+in the shape skills/search-history/search-history.sh prints.
+
+Usage: ccnotify.py search [--keyword TERMS] [--start YYYY-MM-DD] [--end YYYY-MM-DD]
+                          [--project REGEX] [--sort rank|time] [--limit N] [--reindex]
+                          [--deep]
+"""
+
+import argparse
+import calendar
+import json
+import re
+import sys
+import time
+
+import ccnotify
+import retention
+
+FIRST_MSG_CHARS = 80
+DEFAULT_LIMIT = 50
+
+# Distinct cwd values via idx_prompt_cwd, one index seek per value instead of a scan
+_DISTINCT_CWDS = """
+    WITH RECURSIVE seen (cwd) AS (
+        SELECT MIN(cwd) FROM prompt
+        UNION ALL
+        SELECT (SELECT MIN(cwd) FROM prompt WHERE cwd > seen.cwd) FROM seen
+        WHERE seen.cwd IS NOT NULL
+    )
+    SELECT cwd FROM seen WHERE cwd IS NOT NULL
+"""
+
+
+def fts_query(keyword):
+    """Quote and prefix-match every word, so 'auth bug' behaves like grep on both words."""
+    return " ".join(f'"{term}"*' for term in re.findall(r"\w+", keyword))
+
+
+def utc_bounds(start=None, end=None):
+    """created_at bounds [since, until) for inclusive local YYYY-MM-DD dates."""
+    def utc(day, offset_days=0):
+        local = time.mktime(time.strptime(day, "%Y-%m-%d")) + offset_days * 86400
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(local))
+
+    return (utc(start) if start else None), (utc(end, 1) if end else None)
+
+
+def matching_cwds(conn, pattern):
+    """Hot-table cwd strings and archived cwd ids whose path matches `pattern`."""
+    regex = re.compile(pattern, re.IGNORECASE)
+    hot = [cwd for (cwd,) in conn.execute(_DISTINCT_CWDS) if regex.search(cwd)]
+    archived = [cwd_id for cwd_id, path in conn.execute("SELECT id, path FROM cwd")
+                if regex.search(path)]
+    return hot, archived
+
+
+def session_result(session_id, cwd, at, first_msg, count, **extra):
+    """One search result; `at` is a UTC 'YYYY-MM-DD HH:MM:SS' string shown in local time."""
+    local = time.localtime(calendar.timegm(time.strptime(at, "%Y-%m-%d %H:%M:%S")))
+    cwd = cwd or ""
+    return {
+        "session": session_id,
+        "project": cwd.rstrip("/").rsplit("/", 1)[-1],
+        "project_full": cwd,
+        "cwd": cwd,
+        "time": time.strftime("%H:%M", local),
+        "date": time.strftime("%Y-%m-%d", local),
+        "first_msg": (first_msg or "")[:FIRST_MSG_CHARS],
+        "count": count,
+        **extra,
+    }
+
+
+def search(conn, keyword=None, start=None, end=None, project=None, sort=None):
+    """Matching sessions, one dict each in the shape search-history.sh prints.
+
+    Counting and ranking happen in SQL per table (hot prompt plus archived months
+    in range); only each session's first matching prompt is read back as text.
+    Keyword searches are sorted by rank (best bm25 first) unless sort is "time";
+    everything else comes out oldest first.
+    """
+    since, until = utc_bounds(start, end)
+    if keyword is not None:
+        query = fts_query(keyword)
+        if not query:
+            return []
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS search_hits (id INTEGER PRIMARY KEY, rank REAL)")
+        with conn:
+            conn.execute("DELETE FROM temp.search_hits")
+            conn.execute(
+                """INSERT INTO temp.search_hits (id, rank)
+                   SELECT rowid, rank FROM prompt_fts WHERE prompt_fts MATCH ?""",
+                (query,),
+            )
+    hot_cwds = archived_cwds = None
+    if project:
+        hot_cwds, archived_cwds = matching_cwds(conn, project)
+
+    # (table, cwd column, path expression, cwd join, prompt columns, allowed cwds)
+    sources = []
+    if archived_cwds != []:
+        for (month,) in conn.execute("SELECT month FROM prompt_archive ORDER BY month"):
+            if (since and month < since[:7]) or (until and month > until[:7]):
+                continue
+            sources.append((retention.partition_table(month), "cwd_id", "c.path",
+                            "LEFT JOIN cwd AS c ON c.id = p.cwd_id", "p.prompt, p.prompt_z",
+                            archived_cwds))
+    if hot_cwds != []:
+        sources.append(("prompt", "cwd", "p.cwd", "", "p.prompt, NULL", hot_cwds))
+
+    join = "JOIN temp.search_hits AS h ON h.id = p.id" if keyword is not None else ""
+    rank = "h.rank" if keyword is not None else "NULL"
+
+    def where(cwd_column, cwds):
+        clauses, params = [], []
+        if since:
+            clauses.append("p.created_at >= ?")
+            params.append(since)
+        if until:
+            clauses.append("p.created_at < ?")
+            params.append(until)
+        if cwds is not None:
+            clauses.append(f"p.{cwd_column} IN ({', '.join('?' * len(cwds))})")
+            params.extend(cwds)
+        return clauses, params
+
+    sessions = {}
+    for source in sources:
+        table, cwd_column, _, _, _, cwds = source
+        clauses, params = where(cwd_column, cwds)
+        clause = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        for session_id, count, best, first_at in conn.execute(
+            f"""SELECT p.session_id, COUNT(*), MIN({rank}), MIN(p.created_at)
+                FROM {table} AS p {join} {clause} GROUP BY p.session_id""",
+            params,
+        ):
+            entry = sessions.get(session_id)
+            if entry is None:
+                sessions[session_id] = [count, best, first_at, source]
+                continue
+            entry[0] += count
+            if best is not None and (entry[1] is None or best < entry[1]):
+                entry[1] = best
+            if first_at < entry[2]:
+                entry[2:] = [first_at, source]
+
+    results = []
+    for session_id, (count, best, first_at, source) in sessions.items():
+        table, cwd_column, path, cwd_join, text, cwds = source
+        clauses, params = where(cwd_column, cwds)
+        cwd, prompt, packed = conn.execute(
+            f"""SELECT {path}, {text} FROM {table} AS p {cwd_join} {join}
+                WHERE {' AND '.join(["p.session_id = ?", "p.created_at = ?", *clauses])}
+                ORDER BY p.id LIMIT 1""",
+            [session_id, first_at, *params],
+        ).fetchone()
+        results.append((best, session_result(
+            session_id, cwd, first_at, retention.unpack_prompt(prompt, packed), count
+        )))
+
+    if keyword is not None and sort != "time":
+        results.sort(key=lambda r: r[0])
+    else:
+        results.sort(key=lambda r: r[1]["date"] + r[1]["time"])
+    return [result for _, result in results]
+
+
+def merge_deep(results, deep, sort):
+    """Add transcript matches for sessions the prompt search didn't find.
+
+    In rank order they follow the ranked prompt matches; otherwise everything is
+    re-sorted by time.
+    """
+    seen = {result["session"] for result in results}
+    merged = results + [result for result in deep if result["session"] not in seen]
+    if sort == "time":
+        merged.sort(key=lambda r: r["date"] + r["time"])
+    return merged
+
+
+def reindex(conn):
+    """Rebuild prompt_fts from every hot and archived prompt; returns the row count."""
+    count = 0
+    with conn:
+        conn.execute("INSERT INTO prompt_fts (prompt_fts) VALUES ('delete-all')")
+        batch = []
+        for row in retention.iter_prompts(conn):
+            batch.append((row.id, row.prompt))
+            if len(batch) >= retention.BATCH_SIZE:
+                conn.executemany("INSERT INTO prompt_fts (rowid, prompt) VALUES (?, ?)", batch)
+                count += len(batch)
+                batch = []
+        conn.executemany("INSERT INTO prompt_fts (rowid, prompt) VALUES (?, ?)", batch)
+        count += len(batch)
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ccnotify.py search",
+                                     description="Search recorded prompts.")
+    parser.add_argument("--keyword", help="words that must all appear (prefix match)")
+    parser.add_argument("--start", help="first local date, YYYY-MM-DD (inclusive)")
+    parser.add_argument("--end", help="last local date, YYYY-MM-DD (inclusive)")
+    parser.add_argument("--project", help="case-insensitive regex on the working directory")
+    parser.add_argument("--sort", choices=("rank", "time"),
+                        help="default: rank with --keyword, otherwise time")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT, help="sessions to print")
+    parser.add_argument("--reindex", action="store_true",
+                        help="rebuild the full-text index (after restoring archives)")
+    parser.add_argument("--deep", action="store_true",
+                        help="also search full transcripts (see `ccnotify.py transcripts`)")
+    args = parser.parse_args(argv)
+
+    tracker = ccnotify.ClaudePromptTracker()
+    try:
+        conn = tracker._connect()
+        if args.reindex:
+            print(f"Indexed {reindex(conn)} prompt(s)", file=sys.stderr)
+        if not (args.keyword or args.start or args.end or args.project):
+            return
+        sort = args.sort or ("rank" if args.keyword else "time")
+        results = search(conn, args.keyword, args.start, args.end, args.project, sort)
+        if args.deep:
+            import transcripts
+            transcripts.TranscriptIndexer(conn).update()
+            deep = transcripts.deep_search(conn, args.keyword, args.start, args.end, args.project)
+            results = merge_deep(results, deep, sort)
+    finally:
+        tracker.close()
+
+    try:
+        for result in results[:args.limit] if sort == "rank" else results[-args.limit:]:
+            sys.stdout.write(json.dumps(result) + "\n")
+    except BrokenPipeError:
+        pass
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Spool for hook events that could not be written because ccnotify.db stayed locked.
+
+ccnotify.handle_event retries a locked database with backoff. If every attempt
+fails, the event is written here as one JSON file, renamed into place so a
+reader never sees half of it, instead of being dropped. The next hook that gets
+through replays the spool oldest first, one replayer at a time.
+
+Usage: ccnotify.py replay
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import ccnotify
+
+
+def save(event_name, data, env):
+    """Write one event to the spool; returns its path."""
+    directory = ccnotify.spool_dir()
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.time_ns():020d}-{os.getpid()}"
+    path = os.path.join(directory, f"{name}.json")
+    temp = os.path.join(directory, f".{name}.tmp")
+    with open(temp, "w", encoding="utf-8") as f:
+        json.dump({"event": event_name, "data": data, "env": env, "spooled_at": time.time()}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+    return path
+
+
+def pending():
+    """Spooled event files, oldest first."""
+    directory = ccnotify.spool_dir()
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name) for name in sorted(names) if name.endswith(".json")]
+
+
+def replay(tracker):
+    """Handle every spooled event; returns how many were replayed.
+
+    Stops at the first event that still finds the database locked, so order is
+    kept. A file that can't be handled for any other reason is renamed to
+    *.failed and logged rather than retried forever.
+    """
+    import fcntl
+
+    if not pending():
+        return 0
+    lock_fd = os.open(os.path.join(ccnotify.spool_dir(), ".lock"), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0  # another hook is replaying
+
+        replayed = 0
+        # Events spooled while this runs are picked up by the next pass
+        while True:
+            done, blocked = _replay_pass(tracker)
+            replayed += done
+            if blocked or not done:
+                return replayed
+    finally:
+        os.close(lock_fd)
+
+
+def _replay_pass(tracker):
+    """Replay the files pending now; returns (replayed, stopped on a locked database)."""
+    import sqlite3
+
+    replayed = 0
+    environ, tty_path = tracker.environ, tracker.tty_path
+    for path in pending():
+        try:
+            with open(path, encoding="utf-8") as f:
+                event = json.load(f)
+        except FileNotFoundError:
+            continue
+        except ValueError as e:
+            _quarantine(path, e)
+            continue
+        try:
+            tracker.environ, tracker.tty_path = event.get("env") or {}, None
+            # Rows get the time the hook fired, not the replay's, so durations stay true
+            ccnotify.dispatch(tracker, event["event"], event["data"], event.get("spooled_at"))
+        except sqlite3.OperationalError as e:
+            if ccnotify._is_busy(e):
+                return replayed, True
+            _quarantine(path, e)
+            continue
+        except Exception as e:
+            _quarantine(path, e)
+            continue
+        finally:
+            tracker.environ, tracker.tty_path = environ, tty_path
+        os.unlink(path)
+        replayed += 1
+        ccnotify.log.info("event_replayed", hook=event["event"],
+                          delay=round(time.time() - event.get("spooled_at", time.time()), 3))
+    return replayed, False
+
+
+def _quarantine(path, error):
+    os.replace(path, path[:-len(".json")] + ".failed")
+    ccnotify.log.error("replay_failed", path=path, error=str(error))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ccnotify.py replay",
+                                     description="Replay hook events spooled while the database was locked.")
+    parser.parse_args(argv)
+
+    tracker = ccnotify.ClaudePromptTracker()
+    try:
+        replayed = replay(tracker)
+        left = len(pending())
+    finally:
+        tracker.close()
+    print(f"Replayed {replayed} event(s), {left} still spooled", file=sys.stderr)
+    if tracker.enqueued:
+        ccnotify._spawn_deliverer()
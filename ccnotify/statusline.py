@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Claude Code status line: the shortened working directory, the share of the
+context window left, and the session's current job.
+
+Claude Code runs the statusLine command on every refresh, so this path never
+opens ccnotify.db. Beyond json it imports only ccnotify, for state_dir(). That
+import loads cached bytecode and, with ccnotify.py's lazy imports, costs little
+more than os, sys and time. The job comes from
+status/<session_id>, a one-line file the UserPromptSubmit and Stop hooks
+rewrite after each commit: "seq started_epoch [stopped_epoch]".
+
+settings.json runs this file directly rather than `ccnotify.py statusline`:
+a script run as __main__ is compiled on every start, and ccnotify.py is large
+enough for that to cost more than everything else here put together.
+
+Usage: statusline.py < status.json
+       ccnotify.py statusline < status.json
+"""
+
+import os
+import sys
+import time
+
+import ccnotify
+
+CHECK = "\033[1;38;5;039m√\033[0m"
+PATH_STYLE = "\033[1;38;2;247;127;84m"
+DIM = "\033[38;5;242m"
+RESET = "\033[0m"
+
+
+def cache_path(session_id):
+    return os.path.join(ccnotify.state_dir(), "status", session_id.replace("/", "_"))
+
+
+def save(session_id, seq, started, stopped=None):
+    """Record the session's current job for the status line; called by the hooks after commit."""
+    if not session_id:
+        return
+    path = cache_path(session_id)
+    line = f"{seq} {started:.0f}" + (f" {stopped:.0f}" if stopped is not None else "") + "\n"
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, "w") as f:
+            f.write(line)
+        os.replace(tmp, path)
+    except OSError as e:
+        ccnotify.log.warning("status_cache_failed", session_id=session_id, error=str(e))
+
+
+def load(session_id):
+    """(seq, started, stopped or None) for the session's current job, or None."""
+    try:
+        with open(cache_path(session_id)) as f:
+            fields = f.read().split()
+        seq, started = int(fields[0]), float(fields[1])
+        return seq, started, float(fields[2]) if len(fields) > 2 else None
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def clear(session_id):
+    """Drop the session's cached job once it is closed without a Stop to rewrite it."""
+    try:
+        os.remove(cache_path(session_id))
+    except OSError:
+        pass
+
+
+def _seconds(seconds):
+    # rollups.format_seconds, without importing rollups on every refresh
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    hours, remainder = divmod(seconds, 3600)
+    minutes = remainder // 60
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m"
+
+
+def short_path(cwd):
+    """The last three path components behind '...', as the old awk one-liner printed."""
+    parts = cwd.split("/")
+    return cwd if len(parts) <= 3 else ".../" + "/".join(parts[-3:])
+
+
+def render(status, job=None, now=None):
+    cwd = (status.get("workspace") or {}).get("current_dir") or status.get("cwd") or ""
+    line = f"{CHECK} {PATH_STYLE}{short_path(cwd)}{RESET}"
+
+    remaining = (status.get("context_window") or {}).get("remaining_percentage")
+    if isinstance(remaining, (int, float)):
+        if remaining < 25:
+            color = "\033[38;5;196m"
+        elif remaining < 50:
+            color = "\033[38;5;214m"
+        else:
+            color = DIM
+        line += f" {color}{remaining:g}%{RESET}"
+
+    if job:
+        seq, started, stopped = job
+        if stopped is None:
+            now = time.time() if now is None else now
+            line += f" {DIM}job#{seq} {_seconds(max(0, now - started))}{RESET}"
+        else:
+            line += f" {DIM}job#{seq} done {_seconds(max(0, stopped - started))}{RESET}"
+    return line
+
+
+def main(argv=None):
+    import json
+
+    try:
+        status = json.loads(sys.stdin.read() or "{}")
+    except ValueError:
+        status = {}
+    session_id = status.get("session_id")
+    sys.stdout.write(render(status, load(session_id) if session_id else None))
+
+
+if __name__ == "__main__":
+    main()
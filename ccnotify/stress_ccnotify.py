@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Concurrent-writer stress test for the ccnotify hooks.
+
+Runs N writers in parallel against one sandbox ccnotify.db. Each writer plays
+one session, cycling `ccnotify.py UserPromptSubmit -> Notification -> Stop` as
+fresh processes, the way a burst of worktree agents does. Afterwards anything
+left in the spool is replayed, and the report covers:
+
+  throughput   hook processes per second of wall time
+  lock wait    time hooks spent waiting for the write lock or backing off,
+               from the write_contended events in the sandbox's event log
+  lost events  prompts or stops that never reached the database
+  spooled      events that went through the spool instead of failing
+
+--hold-ms adds a competing writer that keeps taking the write lock for that
+long (like a compaction or backfill would), to exercise the retry and spool path.
+
+Usage:
+    ./stress_ccnotify.py [--writers 16] [--rounds 10] [--hold-ms 0] [--json PATH]
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import bench_ccnotify
+
+
+def run_writer(script, env, session_id, rounds, results):
+    for _ in range(rounds):
+        for hook in bench_ccnotify.HOOKS:
+            stdin = json.dumps(bench_ccnotify.payload(hook, session_id))
+            started = time.perf_counter()
+            proc = subprocess.run([sys.executable, script, hook], input=stdin, text=True,
+                                  env=env, capture_output=True)
+            results.append((hook, time.perf_counter() - started, proc.returncode))
+
+
+def hold_lock(db_path, hold_seconds, stop):
+    """Keep grabbing the write lock for hold_seconds at a time until stop is set."""
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    try:
+        while not stop.wait(0.01):
+            conn.execute("BEGIN IMMEDIATE")
+            time.sleep(hold_seconds)
+            conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def lock_waits(log_path):
+    """(lock wait ms per contended hook, spooled events, replayed events) from the event log."""
+    import eventlog
+
+    waits, spooled, replayed = [], 0, 0
+    for record in eventlog.iter_events(log_path):
+        event = record.get("event")
+        if event == "write_contended":
+            waits.append(record.get("lock_wait_ms", 0.0))
+        elif event == "event_spooled":
+            spooled += 1
+        elif event == "event_replayed":
+            replayed += 1
+    return waits, spooled, replayed
+
+
+def stress(writers, rounds, hold_ms=0):
+    sandbox = bench_ccnotify.make_sandbox()
+    try:
+        env = bench_ccnotify.hook_env(sandbox)
+        script = os.path.join(sandbox, "ccnotify.py")
+        db_path = os.path.join(sandbox, "ccnotify.db")
+        results = []
+        threads = [
+            threading.Thread(target=run_writer,
+                             args=(script, env, f"stress-{i:03d}", rounds, results))
+            for i in range(writers)
+        ]
+        stop = threading.Event()
+        holder = None
+        if hold_ms:
+            subprocess.run([sys.executable, script, "replay"], env=env, capture_output=True)
+            holder = threading.Thread(target=hold_lock, args=(db_path, hold_ms / 1000, stop))
+            holder.start()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+        stop.set()
+        if holder:
+            holder.join()
+
+        subprocess.run([sys.executable, script, "replay"], env=env, capture_output=True)
+        with sqlite3.connect(db_path) as conn:
+            prompts, stopped = conn.execute(
+                "SELECT COUNT(*), COUNT(stoped_at) FROM prompt"
+            ).fetchone()
+        still_spooled = len(glob.glob(os.path.join(sandbox, "spool", "*.json")))
+        # Hook processes flush their events on exit, so the log is complete by now
+        waits, spooled, replayed = lock_waits(os.path.join(sandbox, "ccnotify.jsonl"))
+    finally:
+        shutil.rmtree(sandbox, ignore_errors=True)
+
+    expected = writers * rounds
+    latencies = [seconds for _, seconds, _ in results]
+    return {
+        "writers": writers,
+        "hooks": len(results),
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(len(results) / wall, 1),
+        "latency": bench_ccnotify.summarize(latencies),
+        "failed_hooks": sum(1 for _, _, code in results if code),
+        "contended_hooks": len(waits),
+        "lock_wait_total_ms": round(sum(waits), 1),
+        "lock_wait_p95_ms": bench_ccnotify.percentile(waits, 95) if waits else 0.0,
+        "spooled": spooled,
+        "replayed": replayed,
+        "still_spooled": still_spooled,
+        "lost_events": (expected - prompts) + (expected - stopped),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stress ccnotify with concurrent hook processes.")
+    parser.add_argument("--writers", type=int, default=16, help="parallel sessions")
+    parser.add_argument("--rounds", type=int, default=10,
+                        help="prompt/notification/stop cycles per writer")
+    parser.add_argument("--hold-ms", type=int, default=0,
+                        help="also run a writer that holds the lock this long at a time")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    report = stress(args.writers, args.rounds, args.hold_ms)
+    for key, value in report.items():
+        print(f"{key:<20} {value}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["lost_events"] or report["failed_hooks"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""Tests for backfilling ccnotify.db from transcripts and history.jsonl."""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import backfill
+import ccnotify
+import retention
+import rollups
+import statusline
+
+
+def _user(text, at, **extra):
+    return {"type": "user", "timestamp": at, "cwd": "/work/repo-x",
+            "message": {"role": "user", "content": text}, **extra}
+
+
+def _assistant(at):
+    return {"type": "assistant", "timestamp": at,
+            "message": {"role": "assistant", "content": [{"type": "text", "text": "ok"}]}}
+
+
+def _tool_result(at):
+    return {"type": "user", "timestamp": at,
+            "message": {"role": "user", "content": [{"type": "tool_result", "content": "x"}]}}
+
+
+class BackfillCase(unittest.TestCase):
+    def setUp(self):
+        # Status-line caches and the spool go to a temp dir, never the source tree
+        state = patch.dict(os.environ, {"CCNOTIFY_STATE_DIR": tempfile.mkdtemp()})
+        state.start()
+        self.addCleanup(state.stop)
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            self.tracker = ccnotify.ClaudePromptTracker(storage=ccnotify.Storage.in_memory())
+        self.tracker.environ = {}
+        self.conn = self.tracker._connect()
+        self.root = tempfile.mkdtemp()
+        self.history = os.path.join(self.root, "history.jsonl")
+
+    def tearDown(self):
+        self.tracker.close()
+
+    def _transcript(self, session_id, *entries):
+        os.makedirs(os.path.join(self.root, "-work-repo-x"), exist_ok=True)
+        with open(os.path.join(self.root, "-work-repo-x", f"{session_id}.jsonl"), "w") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in entries)
+
+    def _run(self):
+        return backfill.backfill(self.conn, self.root, self.history, workers=0)
+
+    def _rows(self, session_id="s1"):
+        return self.conn.execute(
+            """SELECT seq, created_at, prompt, stoped_at, lastWaitUserAt FROM prompt
+               WHERE session_id = ? ORDER BY created_at""",
+            (session_id,),
+        ).fetchall()
+
+
+class TestParse(BackfillCase):
+    def test_turns_become_jobs(self):
+        self._transcript(
+            "s1",
+            _user("<command-name>/clear</command-name>", "2024-03-10T09:00:00Z", isMeta=True),
+            _user("fix the bug", "2024-03-10T09:00:01.500Z"),
+            _assistant("2024-03-10T09:00:30Z"),
+            _tool_result("2024-03-10T09:01:00Z"),
+            _assistant("2024-03-10T09:02:00Z"),
+            _user("and the tests", "2024-03-10T09:02:20Z"),
+            _assistant("2024-03-10T09:03:00Z"),
+            {"type": "user", "timestamp": "2024-03-10T09:03:30Z", "isSidechain": True,
+             "message": {"content": "subagent prompt"}},
+            _user("thanks", "2024-03-10T09:10:00Z"),
+        )
+        self.assertEqual(self._run(), {"files": 1, "staged": 3, "added": 3})
+        self.assertEqual(self._rows(), [
+            (1, "2024-03-10 09:00:01", "fix the bug", "2024-03-10 09:02:00", None),
+            (2, "2024-03-10 09:02:20", "and the tests", "2024-03-10 09:03:30",
+             "2024-03-10 09:04:30"),
+            (3, "2024-03-10 09:10:00", "thanks", "2024-03-10 09:10:00", "2024-03-10 09:11:00"),
+        ])
+
+    def test_rollups_and_search_see_backfilled_jobs(self):
+        self._transcript("s1", _user("deploy it", "2024-03-10T09:00:00Z"),
+                         _assistant("2024-03-10T09:10:00Z"))
+        self._run()
+        (row,) = rollups.query(self.conn, days=0)
+        self.assertEqual((row["jobs"], row["agent_seconds"]), (1, 600))
+        self.assertEqual(self.conn.execute(
+            "SELECT rowid FROM prompt_fts WHERE prompt_fts MATCH 'deploy'").fetchall(), [(1,)])
+
+
+class TestIdempotence(BackfillCase):
+    def test_rerun_adds_nothing(self):
+        self._transcript("s1", _user("one", "2024-03-10T09:00:00Z"),
+                         _user("two", "2024-03-10T09:05:00Z"))
+        self.assertEqual(self._run()["added"], 2)
+        self.assertEqual(self._run()["added"], 0)
+        self.assertEqual(len(self._rows()), 2)
+
+    def test_archived_rows_count_as_present(self):
+        self._transcript("s1", _user("one", "2023-01-10T09:00:00Z"),
+                         _assistant("2023-01-10T09:01:00Z"))
+        self._run()
+        retention.compact(self.conn, max_age_days=30, max_rows=0)
+        self.assertEqual(self._run()["added"], 0)
+
+    def test_archived_rows_are_renumbered(self):
+        self._transcript("s1", _user("two", "2023-01-10T09:00:00Z"),
+                         _assistant("2023-01-10T09:01:00Z"))
+        self._run()
+        retention.compact(self.conn, max_age_days=30, max_rows=0)
+
+        self._transcript("s1", _user("one", "2023-01-10T08:00:00Z"),
+                         _assistant("2023-01-10T08:01:00Z"),
+                         _user("two", "2023-01-10T09:00:00Z"),
+                         _assistant("2023-01-10T09:01:00Z"))
+        self.assertEqual(self._run()["added"], 1)
+        self.assertEqual(sorted((p.seq, p.prompt) for p in retention.iter_prompts(self.conn)),
+                         [(1, "one"), (2, "two")])
+
+    def test_hook_rows_are_not_duplicated_and_seq_is_renumbered(self):
+        with patch("subprocess.run"):
+            self.tracker.handle_user_prompt_submit(
+                {"session_id": "s1", "prompt": "live one", "cwd": "/work/repo-x"})
+        hook_at = backfill._epoch(self.conn.execute("SELECT created_at FROM prompt").fetchone()[0])
+
+        def iso(epoch):
+            return backfill._stamp(epoch).replace(" ", "T") + "Z"
+
+        # The transcript entry is stamped a moment before the hook ran
+        self._transcript("s1", _user("missed by the hooks", iso(hook_at - 600)),
+                         _user("live one", iso(hook_at - 1)))
+        self.assertEqual(self._run()["added"], 1)
+        self.assertEqual([(seq, prompt) for seq, _, prompt, _, _ in self._rows()],
+                         [(1, "missed by the hooks"), (2, "live one")])
+        self.assertEqual(self.conn.execute(
+            "SELECT seq FROM session_seq WHERE session_id = 's1'").fetchone(), (2,))
+        # The status line shows the renumbered job, not the hook's job#1
+        self.assertEqual(statusline.load("s1")[0], 2)
+
+
+class TestHistory(BackfillCase):
+    def test_history_fills_sessions_without_transcripts(self):
+        self._transcript("s1", _user("from transcript", "2024-03-10T09:00:00Z"))
+        with open(self.history, "w") as f:
+            for session_id, display in (("s1", "from transcript"), ("gone", "old prompt")):
+                f.write(json.dumps({"display": display, "timestamp": 1710061200000,
+                                    "project": "/work/old", "sessionId": session_id}) + "\n")
+        self.assertEqual(self._run()["added"], 2)
+        (row,) = self._rows("gone")
+        self.assertEqual(row[2:4], ("old prompt", "2024-03-10 09:00:00"))
+
+    def test_history_rows_are_not_jobs(self):
+        with open(self.history, "w") as f:
+            for i in range(30):
+                f.write(json.dumps({"display": f"p{i}", "timestamp": 1710061200000 + i * 60000,
+                                    "project": "/work/old", "sessionId": "gone"}) + "\n")
+        self.assertEqual(self._run()["added"], 30)
+        # Their duration is unknown: no 0-second jobs in the rollups or sketches
+        self.assertEqual(self.conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT reason) FROM prompt_end WHERE reason = 'unknown'"
+        ).fetchone(), (30, 1))
+        self.assertEqual(self.conn.execute("SELECT COALESCE(SUM(jobs), 0) FROM rollup_daily").fetchone(),
+                         (0,))
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM duration_sketch").fetchone(), (0,))
+
+
+class TestPool(BackfillCase):
+    def test_process_pool_matches_in_process(self):
+        for i in range(5):
+            self._transcript(f"s{i}", _user("go", f"2024-03-10T09:0{i}:00Z"))
+        counts = backfill.backfill(self.conn, self.root, self.history, workers=2)
+        self.assertEqual(counts, {"files": 5, "staged": 5, "added": 5})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Tests for the ccnotify benchmark helpers (not the benchmarks themselves)."""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import bench_ccnotify
+
+
+class TestPercentile(unittest.TestCase):
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(bench_ccnotify.percentile(values, 50), 50)
+        self.assertEqual(bench_ccnotify.percentile(values, 95), 95)
+        self.assertEqual(bench_ccnotify.percentile(values, 99), 99)
+        self.assertEqual(bench_ccnotify.percentile([7], 99), 7)
+
+
+class TestGenerateHistory(unittest.TestCase):
+    def test_builds_consistent_history(self):
+        db_path = os.path.join(tempfile.mkdtemp(), "ccnotify.db")
+        sessions = bench_ccnotify.generate_history(db_path, rows=500, sessions=10)
+        self.assertEqual(len(sessions), 10)
+
+        with sqlite3.connect(db_path) as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM prompt").fetchone()[0], 500)
+            open_jobs = conn.execute(
+                "SELECT session_id, COUNT(*) FROM prompt WHERE stoped_at IS NULL GROUP BY 1"
+            ).fetchall()
+            self.assertEqual(len(open_jobs), 10)
+            self.assertTrue(all(count == 1 for _, count in open_jobs))
+            mismatched = conn.execute(
+                """SELECT COUNT(*) FROM session_seq s
+                   WHERE s.seq != (SELECT MAX(seq) FROM prompt p WHERE p.session_id = s.session_id)"""
+            ).fetchone()[0]
+            self.assertEqual(mismatched, 0)
+
+
+class TestCheckRegressions(unittest.TestCase):
+    def test_flags_only_slow_scenarios(self):
+        baseline = {"10000/cold/Stop": {"p95_ms": 10.0}, "10000/warm/Stop": {"p95_ms": 1.0}}
+        results = {"10000/cold/Stop": {"p95_ms": 14.0}, "10000/warm/Stop": {"p95_ms": 2.5},
+                   "1000000/warm/Stop": {"p95_ms": 99.0}}
+        regressions = bench_ccnotify.check_regressions(results, baseline)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("10000/warm/Stop"))
+
+    def test_sub_millisecond_noise_is_not_a_regression(self):
+        baseline = {"10000/warm/Notification": {"p95_ms": 0.15}}
+        results = {"10000/warm/Notification": {"p95_ms": 1.1}}
+        self.assertEqual(bench_ccnotify.check_regressions(results, baseline), [])
+
+
+class TestCheckBudgets(unittest.TestCase):
+    def test_stop_over_budget_at_any_size(self):
+        results = {"10000/cold/Stop": {"p95_ms": 120.0}, "1000000/cold/Stop": {"p95_ms": 180.0},
+                   "1000000/cold/UserPromptSubmit": {"p95_ms": 400.0},
+                   "1000000/warm/Stop": {"p95_ms": 30.0}}
+        over = bench_ccnotify.check_budgets(results, {"cold": 150.0, "warm": 25.0})
+        self.assertEqual([line.split(":")[0] for line in over],
+                         ["1000000/cold/Stop", "1000000/warm/Stop"])
+
+
+if __name__ == "__main__":
+    unittest.main()
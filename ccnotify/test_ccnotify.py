@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
 """Tests for ccnotify notification logic."""
 
+import json
 import os
+import shutil
+import socket
 import sqlite3
+import subprocess
+import sys
 import tempfile
+import threading
 import unittest
 from unittest.mock import MagicMock, patch, call
 
@@ -11,15 +17,15 @@ from unittest.mock import MagicMock, patch, call
 _tmpdir = tempfile.mkdtemp()
 with patch.dict(os.environ, {"ITERM_SESSION_ID": "w1t0p0:TEST-UUID-1234"}):
     import ccnotify
+    import focus
     ccnotify.SCRIPT_DIR = _tmpdir
 
 
 def _make_tracker():
-    """Create a tracker with an in-memory-like temp db, skip logging."""
+    """Create a tracker with an in-memory db, skip logging and the focus cache."""
     with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
-        tracker = ccnotify.ClaudePromptTracker()
-        tracker.db_path = os.path.join(_tmpdir, "test.db")
-        tracker._init_database()
+        tracker = ccnotify.ClaudePromptTracker(storage=ccnotify.Storage.in_memory())
+    tracker.focus = focus.AppleScriptFocusProvider()
     return tracker
 
 
@@ -52,28 +58,28 @@ class TestIsSessionFocused(unittest.TestCase):
         return result
 
     @patch.dict(os.environ, {"ITERM_SESSION_ID": "w1t0p0:MY-UUID"})
-    @patch("ccnotify.subprocess.run")
+    @patch("subprocess.run")
     def test_matching_uuid_returns_true(self, mock_run):
         mock_run.return_value = self._make_result(stdout="MY-UUID\n")
         tracker = _make_tracker()
         self.assertTrue(tracker._is_session_focused())
 
     @patch.dict(os.environ, {"ITERM_SESSION_ID": "w1t0p0:MY-UUID"})
-    @patch("ccnotify.subprocess.run")
+    @patch("subprocess.run")
     def test_different_uuid_returns_false(self, mock_run):
         mock_run.return_value = self._make_result(stdout="OTHER-UUID\n")
         tracker = _make_tracker()
         self.assertFalse(tracker._is_session_focused())
 
     @patch.dict(os.environ, {"ITERM_SESSION_ID": "w1t0p0:MY-UUID"})
-    @patch("ccnotify.subprocess.run")
+    @patch("subprocess.run")
     def test_not_iterm_frontmost_returns_false(self, mock_run):
         mock_run.return_value = self._make_result(stdout="NOTFRONT:Safari\n")
         tracker = _make_tracker()
         self.assertFalse(tracker._is_session_focused())
 
     @patch.dict(os.environ, {"ITERM_SESSION_ID": "w1t0p0:MY-UUID"})
-    @patch("ccnotify.subprocess.run")
+    @patch("subprocess.run")
     def test_applescript_error_returns_false(self, mock_run):
         mock_run.return_value = self._make_result(stdout="ERROR:some error\n")
         tracker = _make_tracker()
@@ -92,8 +98,8 @@ class TestSendNotification(unittest.TestCase):
     @patch.dict(os.environ, {"ITERM_SESSION_ID": "w1t0p0:MY-UUID"})
     @patch("ccnotify.time.sleep")
     @patch("builtins.open", MagicMock())
-    @patch("ccnotify.subprocess.Popen")
-    @patch("ccnotify.subprocess.run")
+    @patch("subprocess.Popen")
+    @patch("subprocess.run")
     def test_focused_plays_glass_no_notification(self, mock_run, mock_popen, mock_sleep):
         """Test 1: Session focused → Glass sound + flash, no terminal-notifier."""
         # AppleScript returns matching UUID
@@ -119,8 +125,8 @@ class TestSendNotification(unittest.TestCase):
     @patch.dict(os.environ, {"ITERM_SESSION_ID": "w1t0p0:MY-UUID"})
     @patch("ccnotify.time.sleep")
     @patch("builtins.open", MagicMock())
-    @patch("ccnotify.subprocess.Popen")
-    @patch("ccnotify.subprocess.run")
+    @patch("subprocess.Popen")
+    @patch("subprocess.run")
     def test_not_focused_sends_notification(self, mock_run, mock_popen, mock_sleep):
         """Test 2/3: Not focused → terminal-notifier + flash, no Glass."""
         # AppleScript returns different app (not iTerm2)
@@ -145,8 +151,8 @@ class TestSendNotification(unittest.TestCase):
     @patch.dict(os.environ, {"ITERM_SESSION_ID": "w1t0p0:MY-UUID"})
     @patch("ccnotify.time.sleep")
     @patch("builtins.open", MagicMock())
-    @patch("ccnotify.subprocess.Popen")
-    @patch("ccnotify.subprocess.run")
+    @patch("subprocess.Popen")
+    @patch("subprocess.run")
     def test_different_iterm_window_sends_notification(self, mock_run, mock_popen, mock_sleep):
         """Test 3: Different iTerm2 session focused → notification sent."""
         # AppleScript returns a different UUID (iTerm2 is front but different session)
@@ -167,8 +173,8 @@ class TestSendNotification(unittest.TestCase):
     @patch.dict(os.environ, {"ITERM_SESSION_ID": "w1t0p0:MY-UUID"})
     @patch("ccnotify.time.sleep")
     @patch("builtins.open", MagicMock())
-    @patch("ccnotify.subprocess.Popen")
-    @patch("ccnotify.subprocess.run")
+    @patch("subprocess.Popen")
+    @patch("subprocess.run")
     def test_notification_uses_group_for_replacement(self, mock_run, mock_popen, mock_sleep):
         """Notifications use -group flag so they replace stale ones."""
         focus_result = MagicMock(stdout="NOTFRONT:Safari\n", stderr="")
@@ -185,8 +191,8 @@ class TestSendNotification(unittest.TestCase):
     @patch.dict(os.environ, {"ITERM_SESSION_ID": "w1t0p0:MY-UUID"})
     @patch("ccnotify.time.sleep")
     @patch("builtins.open", MagicMock())
-    @patch("ccnotify.subprocess.Popen")
-    @patch("ccnotify.subprocess.run")
+    @patch("subprocess.Popen")
+    @patch("subprocess.run")
     def test_notification_includes_execute_with_activate_script(self, mock_run, mock_popen, mock_sleep):
         """Click handler uses activate-session.sh with session UUID."""
         focus_result = MagicMock(stdout="NOTFRONT:Safari\n", stderr="")
@@ -204,7 +210,7 @@ class TestSendNotification(unittest.TestCase):
 
 class TestPromptSubmitDismissesNotification(unittest.TestCase):
     @patch.dict(os.environ, {"ITERM_SESSION_ID": "w1t0p0:MY-UUID"})
-    @patch("ccnotify.subprocess.run")
+    @patch("subprocess.run")
     def test_prompt_submit_removes_notification(self, mock_run):
         """Submitting a prompt dismisses any pending notification for the session."""
         mock_run.return_value = MagicMock()
@@ -274,5 +280,378 @@ class TestValidateInputData(unittest.TestCase):
             ccnotify.validate_input_data({}, "FakeEvent")
 
 
+class TestSchemaMigrations(unittest.TestCase):
+    def setUp(self):
+        self.db_path = os.path.join(tempfile.mkdtemp(), "ccnotify.db")
+
+    def _open(self):
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            return ccnotify.ClaudePromptTracker(db_path=self.db_path)
+
+    def test_fresh_database_is_at_latest_version(self):
+        tracker = self._open()
+        version = tracker._connect().execute("PRAGMA user_version").fetchone()[0]
+        self.assertEqual(version, len(ccnotify.MIGRATIONS))
+
+    def test_current_schema_skips_ddl(self):
+        self._open().close()
+        statements = []
+        with patch.object(ccnotify.ClaudePromptTracker, "_init_database"):
+            tracker = self._open()
+        tracker._connect().set_trace_callback(statements.append)
+        tracker._init_database()
+        self.assertEqual(statements, ["PRAGMA user_version"])
+
+    def test_failed_migration_is_retried(self):
+        tracker = self._open()
+        locked = sqlite3.OperationalError("database is locked")
+        with patch.object(ccnotify.ClaudePromptTracker, "_init_database", side_effect=locked):
+            with self.assertRaises(sqlite3.OperationalError):
+                tracker._connect()
+        self.assertIsNone(tracker._conn)
+        version = tracker._connect().execute("PRAGMA user_version").fetchone()[0]
+        self.assertEqual(version, len(ccnotify.MIGRATIONS))
+
+    def test_legacy_trigger_database_is_upgraded(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(ccnotify.MIGRATIONS[0][0])
+            conn.execute("""
+                CREATE TRIGGER auto_increment_seq AFTER INSERT ON prompt
+                FOR EACH ROW BEGIN
+                    UPDATE prompt SET seq = (
+                        SELECT COALESCE(MAX(seq), 0) + 1 FROM prompt
+                        WHERE session_id = NEW.session_id
+                    ) WHERE id = NEW.id;
+                END
+            """)
+            for _ in range(3):
+                conn.execute("INSERT INTO prompt (session_id) VALUES ('legacy')")
+
+        tracker = self._open()
+        conn = tracker._connect()
+        triggers = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger'"
+        ).fetchall()
+        self.assertNotIn(("auto_increment_seq",), triggers)
+
+        with patch("subprocess.run"):
+            tracker.handle_user_prompt_submit(
+                {"session_id": "legacy", "prompt": "p", "cwd": "/tmp"}
+            )
+        seqs = [r[0] for r in conn.execute(
+            "SELECT seq FROM prompt WHERE session_id = 'legacy' ORDER BY id"
+        )]
+        self.assertEqual(seqs, [1, 2, 3, 4])
+
+    def test_seq_counts_per_session(self):
+        tracker = self._open()
+        with patch("subprocess.run"):
+            for session_id in ("a", "b", "a"):
+                tracker.handle_user_prompt_submit(
+                    {"session_id": session_id, "prompt": "p", "cwd": "/tmp"}
+                )
+        rows = tracker._connect().execute(
+            "SELECT session_id, seq FROM prompt ORDER BY id"
+        ).fetchall()
+        self.assertEqual(rows, [("a", 1), ("b", 1), ("a", 2)])
+
+    def test_open_job_lookup_uses_partial_index(self):
+        conn = self._open()._connect()
+        plan = conn.execute(
+            """EXPLAIN QUERY PLAN SELECT id FROM prompt
+               WHERE session_id = ? AND stoped_at IS NULL
+               ORDER BY created_at DESC LIMIT 1""",
+            ("s",),
+        ).fetchall()
+        self.assertIn("idx_prompt_open", " ".join(str(r) for r in plan))
+
+
+class TestStopTransaction(unittest.TestCase):
+    def setUp(self):
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            self.tracker = ccnotify.ClaudePromptTracker(
+                db_path=os.path.join(tempfile.mkdtemp(), "ccnotify.db")
+            )
+        self.conn = self.tracker._connect()
+
+    def test_database_runs_in_wal_mode(self):
+        mode = self.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+    def test_stop_closes_job_and_queues_in_one_transaction(self):
+        self.conn.execute(
+            """INSERT INTO prompt (session_id, prompt, cwd, seq, created_at)
+               VALUES ('s1', 'p', '/work/repo-x', 3, datetime('now', '-90 seconds'))"""
+        )
+        self.conn.commit()
+
+        statements = []
+        self.conn.set_trace_callback(statements.append)
+        self.tracker.handle_stop({"session_id": "s1"})
+        self.conn.set_trace_callback(None)
+
+        self.assertEqual(statements[0], "BEGIN IMMEDIATE")
+        self.assertEqual(statements[-1], "COMMIT")
+        queries = statements[1:-1]
+        self.assertEqual(len(queries), 8)
+        self.assertIn("RETURNING", queries[0])
+        self.assertIn("rollup_daily", queries[1])
+        self.assertIn("rollup_session", queries[2])
+        # Read and rewrite the project's and the session's duration sketch
+        self.assertTrue(all("duration_sketch" in sql for sql in queries[3:7]))
+        self.assertIn("notification_outbox", queries[7])
+
+        title, subtitle = self.conn.execute(
+            "SELECT title, subtitle FROM notification_outbox"
+        ).fetchone()
+        self.assertEqual(title, "repo-x")
+        self.assertTrue(subtitle.startswith("job#3 done, duration: 1m3"))
+        self.assertEqual(self.tracker.enqueued, 1)
+
+    def test_stop_without_open_job_does_nothing(self):
+        self.tracker.handle_stop({"session_id": "nobody"})
+        self.assertEqual(self.tracker.enqueued, 0)
+
+
+class TestSessionEnd(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        patcher = patch.object(ccnotify, "SCRIPT_DIR", self.dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            self.tracker = ccnotify.ClaudePromptTracker(db_path=os.path.join(self.dir, "ccnotify.db"))
+        self.tracker.environ = {}
+        self.addCleanup(self.tracker.close)
+        self.conn = self.tracker._connect()
+
+    def test_closes_open_jobs_with_the_reason(self):
+        import statusline
+
+        with patch("subprocess.run"):
+            for session_id in ("s1", "s1", "s2"):
+                self.tracker.handle_user_prompt_submit(
+                    {"session_id": session_id, "prompt": "go", "cwd": "/work/repo-x"})
+        self.assertIsNotNone(statusline.load("s1"))
+
+        self.tracker.handle_session_end({"session_id": "s1", "reason": "prompt_input_exit"})
+
+        rows = self.conn.execute(
+            """SELECT p.session_id, p.stoped_at IS NOT NULL, e.reason
+               FROM prompt AS p LEFT JOIN prompt_end AS e ON e.prompt_id = p.id ORDER BY p.id"""
+        ).fetchall()
+        self.assertEqual(rows, [("s1", 1, "prompt_input_exit"), ("s1", 1, "prompt_input_exit"),
+                                ("s2", 0, None)])
+        self.assertIsNone(statusline.load("s1"))
+        # Nothing is left for a late Stop to close or notify about
+        self.tracker.handle_stop({"session_id": "s1"})
+        self.assertEqual(self.tracker.enqueued, 0)
+
+    def test_dispatched_like_the_other_hooks(self):
+        data = {"session_id": "s1", "hook_event_name": "SessionEnd"}
+        ccnotify.validate_input_data(data, "SessionEnd")
+        self.assertIs(ccnotify.EVENT_HANDLERS["SessionEnd"], ccnotify.ClaudePromptTracker.handle_session_end)
+        self.tracker.handle_session_end(data)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM prompt_end").fetchone()[0], 0)
+
+
+class TestStorage(unittest.TestCase):
+    def test_default_is_next_to_the_scripts(self):
+        storage = ccnotify.Storage.from_env({})
+        self.assertEqual(storage.target, os.path.join(_tmpdir, "ccnotify.db"))
+        self.assertEqual((storage.path, storage.shard), (storage.target, ""))
+
+    def test_state_dir_moves_database_log_and_spool(self):
+        with patch.dict(os.environ, {"XDG_STATE_HOME": "/fast/state",
+                                     "CCNOTIFY_STATE_DIR": "$XDG_STATE_HOME/ccnotify"}):
+            self.assertEqual(ccnotify.Storage.from_env().path, "/fast/state/ccnotify/ccnotify.db")
+            self.assertEqual(ccnotify.log_path(), "/fast/state/ccnotify/ccnotify.jsonl")
+            self.assertEqual(ccnotify.spool_dir(), "/fast/state/ccnotify/spool")
+
+    def test_shards_per_host_and_project(self):
+        host = os.uname().nodename.split(".")[0]
+        with patch.dict(os.environ, {"CCNOTIFY_DB": "/db/{host}/{project}.db",
+                                     "CCNOTIFY_STATE_DIR": "/state"}), \
+                patch("os.getcwd", return_value="/work/repo-x"):
+            storage = ccnotify.Storage.from_env()
+            self.assertEqual(storage.path, f"/db/{host}/repo-x.db")
+            self.assertEqual(storage.shard, f"{host}-repo-x")
+            self.assertEqual(ccnotify.spool_dir(), f"/state/spool/{host}-repo-x")
+
+    def test_uri_targets(self):
+        self.assertEqual(ccnotify.Storage("file:///tmp/a%20b.db?mode=rwc").path, "/tmp/a b.db")
+        memory = ccnotify.Storage("file:bench?mode=memory&cache=shared")
+        self.assertTrue(memory.memory)
+        self.assertIsNone(memory.path)
+
+    def test_in_memory_database_is_shared_while_open(self):
+        storage = ccnotify.Storage.in_memory()
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            first = ccnotify.ClaudePromptTracker(storage=storage)
+            second = ccnotify.ClaudePromptTracker(db_path=storage.target)
+        first.environ = {}
+        with patch("subprocess.run"):
+            first.handle_user_prompt_submit({"session_id": "s1", "prompt": "go", "cwd": "/w"})
+        self.assertEqual(second._connect().execute("SELECT COUNT(*) FROM prompt").fetchone()[0], 1)
+        self.assertIsNone(second.db_path)
+        first.close()
+        second.close()
+
+        # It goes away with its last connection
+        conn = storage.connect()
+        self.assertIsNone(conn.execute("SELECT name FROM sqlite_master WHERE name = 'prompt'").fetchone())
+        conn.close()
+
+    def test_hooks_write_under_the_state_dir(self):
+        import bench_ccnotify
+
+        sandbox, state_home = bench_ccnotify.make_sandbox(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, sandbox, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, state_home, ignore_errors=True)
+        state = os.path.join(state_home, "ccnotify")
+        env = dict(bench_ccnotify.hook_env(sandbox), CCNOTIFY_STATE_DIR=state)
+        del env["CCNOTIFY_DB"]
+        subprocess.run([sys.executable, os.path.join(sandbox, "ccnotify.py"), "UserPromptSubmit"],
+                       input='{"session_id": "s1", "prompt": "go", "cwd": "/w", '
+                             '"hook_event_name": "UserPromptSubmit"}',
+                       env=env, text=True, check=True, capture_output=True)
+        self.assertTrue(os.path.exists(os.path.join(state, "ccnotify.db")))
+        self.assertTrue(os.path.exists(os.path.join(state, "ccnotify.jsonl")))
+        self.assertTrue(os.path.exists(os.path.join(state, "status", "s1")))
+        self.assertFalse(os.path.exists(os.path.join(sandbox, "ccnotify.db")))
+
+
+def _import_times(args, stdin="", env=None):
+    """Map module -> self-time (us) for everything `python -X importtime <args>` imports."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        input=stdin, capture_output=True, text=True, env=env,
+        cwd=os.path.dirname(os.path.abspath(ccnotify.__file__)),
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            self_us, _, name = line[len("import time:"):].split("|")
+            if self_us.strip().isdigit():
+                times[name.strip()] = int(self_us)
+    return times
+
+
+def _modules(args, stdin="", env=None):
+    """Modules loaded once `ccnotify.py <args>` has run, beyond those of a bare interpreter."""
+    code = ("import sys\n"
+            "baseline = set(sys.modules)\n"
+            "sys.argv = ['ccnotify.py', *sys.argv[1:]]\n"
+            "try:\n"
+            "    import ccnotify\n"
+            "    ccnotify.main()\n"
+            "finally:\n"
+            "    sys.stderr.write('\\nmodules: ' + ' '.join(sorted(set(sys.modules) - baseline)))\n")
+    result = subprocess.run(
+        [sys.executable, "-c", code, *args], input=stdin, capture_output=True, text=True, env=env,
+        cwd=os.path.dirname(os.path.abspath(ccnotify.__file__)),
+    )
+    return set(result.stderr.rpartition("modules: ")[2].split())
+
+
+class TestImportBudget(unittest.TestCase):
+    """Hooks pay interpreter start-up on every turn; keep each path's imports minimal.
+
+    Budgets are -X importtime self-time of modules beyond a bare `python -c pass`.
+    On a one-CPU VM the forward-to-daemon path (json and socket) measures ~25 ms
+    and the invalid-payload path (json plus the event log) ~40 ms; eager imports
+    used to cost ~65 ms on the forward path alone. Each path is timed best of
+    three against about 2x headroom; CCNOTIFY_IMPORT_BUDGET_SCALE stretches the
+    budgets on slower CI machines.
+    """
+
+    NO_ARGUMENT_BUDGET_US = 5000
+    INVALID_PAYLOAD_BUDGET_US = 80000
+    FORWARD_BUDGET_US = 50000
+    HEAVY = {"sqlite3", "subprocess", "logging", "logging.handlers", "datetime", "eventlog"}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.baseline = set(_import_times(["-c", "pass"]))
+        cls.scale = float(os.environ.get("CCNOTIFY_IMPORT_BUDGET_SCALE", "1"))
+
+    def _assert_within_budget(self, budget_us, args, stdin="", env=None, runs=3):
+        """Best of `runs`, so one descheduled run on a busy machine doesn't fail the test."""
+        best = None
+        for _ in range(runs):
+            times = _import_times(["ccnotify.py", *args], stdin, env)
+            self.assertIn("encodings", times)  # sanity: the output was parsed
+            extra = {name: us for name, us in times.items() if name not in self.baseline}
+            if best is None or sum(extra.values()) < sum(best.values()):
+                best = extra
+        self.assertLess(sum(best.values()), budget_us * self.scale, best)
+
+    def _daemon_env(self):
+        """Environment pointing the hook at a fake daemon that acks every connection."""
+        sock_path = os.path.join(tempfile.mkdtemp(), "d.sock")
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(sock_path)
+        server.listen(4)
+        server.settimeout(10)
+
+        def ack():
+            while True:
+                try:
+                    conn, _ = server.accept()
+                except OSError:
+                    return
+                with conn:
+                    while conn.recv(65536):
+                        pass
+                    conn.sendall(b"ok\n")
+
+        threading.Thread(target=ack, daemon=True).start()
+        self.addCleanup(server.close)
+        return dict(os.environ, CCNOTIFY_SOCKET=sock_path)
+
+    def test_no_argument_path_imports_nothing(self):
+        self.assertEqual(_modules([]), {"ccnotify"})
+        self._assert_within_budget(self.NO_ARGUMENT_BUDGET_US, [])
+
+    def test_invalid_payload_skips_db_and_subprocess(self):
+        extra = _modules(["Stop"], stdin="{not json")
+        self.assertIn("json", extra)  # sanity: the payload was read
+        self.assertFalse({"sqlite3", "subprocess", "socket"} & extra)
+        self._assert_within_budget(self.INVALID_PAYLOAD_BUDGET_US, ["Stop"], stdin="{not json")
+
+    def test_forward_path_stays_light(self):
+        env = self._daemon_env()
+        stdin = '{"session_id": "s", "hook_event_name": "Stop"}'
+        extra = _modules(["Stop"], stdin=stdin, env=env)
+        self.assertIn("socket", extra)  # sanity: it forwarded
+        self.assertFalse(self.HEAVY & extra, f"heavy imports on forward path: {extra}")
+        self._assert_within_budget(self.FORWARD_BUDGET_US, ["Stop"], stdin=stdin, env=env)
+
+    def test_in_process_hook_skips_cli_modules(self):
+        state = tempfile.mkdtemp()
+        env = dict(os.environ, CCNOTIFY_STATE_DIR=state, CCNOTIFY_DB=os.path.join(state, "c.db"),
+                   CCNOTIFY_SOCKET=os.path.join(state, "none.sock"))
+        payload = {"session_id": "s", "hook_event_name": "UserPromptSubmit",
+                   "prompt": "p", "cwd": state}
+        extra = _modules(["UserPromptSubmit"], stdin=json.dumps(payload), env=env)
+        self.assertIn("sqlite3", extra)  # sanity: handled in-process
+        cli_only = {"argparse", "glob", "gzip", "shutil", "retention", "socket"}
+        self.assertFalse(cli_only & extra, f"CLI modules on the hook path: {cli_only & extra}")
+
+    def test_tracker_defers_the_event_log(self):
+        code = ("import sys, threading\n"
+                "import ccnotify\n"
+                "ccnotify.ClaudePromptTracker(storage=ccnotify.Storage.in_memory())\n"
+                "print('eventlog' in sys.modules, threading.active_count())\n"
+                "ccnotify.log.info('first_record')\n"
+                "print('eventlog' in sys.modules, threading.active_count())\n")
+        state = tempfile.mkdtemp()
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                             env=dict(os.environ, CCNOTIFY_STATE_DIR=state),
+                             cwd=os.path.dirname(os.path.abspath(ccnotify.__file__))).stdout
+        self.assertEqual(out.split("\n")[:2], ["False 1", "True 2"])
+        self.assertTrue(os.path.exists(os.path.join(state, "ccnotify.jsonl")))
+
+
 if __name__ == "__main__":
     unittest.main()
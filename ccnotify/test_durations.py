@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Tests for the streaming job-duration sketches."""
+
+import io
+import json
+import os
+import tempfile
+import random
+import unittest
+from unittest.mock import patch
+
+import ccnotify
+import durations
+
+
+class TestSketch(unittest.TestCase):
+    def test_quantiles_within_relative_error(self):
+        rng = random.Random(7)
+        values = sorted(round(rng.lognormvariate(5, 1.2)) for _ in range(20000))
+        sketch = durations.Sketch()
+        for value in values:
+            sketch.add(value)
+        for q in (0.5, 0.9, 0.99):
+            exact = values[int(q * (len(values) - 1))]
+            self.assertAlmostEqual(sketch.quantile(q) / exact, 1, delta=durations.ALPHA * 1.01)
+        self.assertAlmostEqual(sketch.rank(values[int(0.9 * len(values))]), 0.9, delta=0.01)
+
+    def test_size_is_bounded_and_round_trips(self):
+        sketch = durations.Sketch()
+        for exponent in range(0, 300):
+            sketch.add(1.1 ** exponent)
+        sketch.add(0)
+        self.assertLessEqual(len(sketch.counts), durations.MAX_BUCKETS)
+        blob = sketch.encode()
+        self.assertLessEqual(len(blob), 8 + 4 * durations.MAX_BUCKETS)
+        copy = durations.Sketch.decode(blob)
+        self.assertEqual((copy.zeros, copy.offset, copy.counts), (sketch.zeros, sketch.offset, sketch.counts))
+        self.assertEqual(copy.count, 301)
+        # The slow tail survives collapsing
+        self.assertAlmostEqual(copy.quantile(1.0) / 1.1 ** 299, 1, delta=durations.ALPHA)
+
+    def test_remaining_time(self):
+        sketch = durations.Sketch()
+        for seconds in range(60, 660, 20):
+            sketch.add(seconds)
+        self.assertAlmostEqual(sketch.remaining(0), 350, delta=350 * 0.05)
+        # Past the median, the estimate comes from the jobs that ran at least that long
+        self.assertAlmostEqual(sketch.remaining(400), 120, delta=25)
+        self.assertIsNone(sketch.remaining(5000))
+        self.assertIsNone(durations.Sketch().remaining(10))
+
+
+class DurationCase(unittest.TestCase):
+    def setUp(self):
+        # Status-line caches and the spool go to a temp dir, never the source tree
+        state = patch.dict(os.environ, {"CCNOTIFY_STATE_DIR": tempfile.mkdtemp()})
+        state.start()
+        self.addCleanup(state.stop)
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            self.tracker = ccnotify.ClaudePromptTracker(storage=ccnotify.Storage.in_memory())
+        self.tracker.environ = {}
+        self.addCleanup(self.tracker.close)
+        self.conn = self.tracker._connect()
+
+    def _job(self, session_id, seconds, cwd="/work/repo-x"):
+        with patch("subprocess.run"):
+            self.tracker.handle_user_prompt_submit({"session_id": session_id, "prompt": "go", "cwd": cwd})
+        with self.conn:
+            self.conn.execute(
+                """UPDATE prompt SET created_at = datetime('now', ?)
+                   WHERE id = (SELECT MAX(id) FROM prompt)""",
+                (f"-{seconds} seconds",),
+            )
+        self.tracker.handle_stop({"session_id": session_id})
+        return self.conn.execute(
+            "SELECT subtitle FROM notification_outbox ORDER BY id DESC LIMIT 1").fetchone()[0]
+
+    def _sketches(self):
+        return self.conn.execute(
+            "SELECT scope, key, jobs, sketch FROM duration_sketch ORDER BY scope, key").fetchall()
+
+
+class TestStop(DurationCase):
+    def test_slow_jobs_are_compared_with_the_repo(self):
+        for n in range(durations.MIN_JOBS):
+            self.assertEqual(self._job(f"s{n % 3}", 60 + n), f"job#{n // 3 + 1} done, duration: 1m"
+                             + (f"{n}s" if n else ""))
+        self.assertEqual(self._job("s0", 30), "job#8 done, duration: 30s")
+        self.assertEqual(self._job("s1", 600),
+                         "job#8 done, duration: 10m, slower than 100% of jobs in this repo")
+
+        self.assertEqual([(scope, key, jobs) for scope, key, jobs, _ in self._sketches()],
+                         [("project", "repo-x", 22), ("session", "s0", 8), ("session", "s1", 8),
+                          ("session", "s2", 6)])
+
+    def test_rebuild_matches_the_hooks(self):
+        for n in range(30):
+            self._job(f"s{n % 4}", 10 * n, cwd=f"/work/repo-{n % 2}")
+        incremental = self._sketches()
+        self.assertEqual(durations.rebuild(self.conn), 6)
+        self.assertEqual([row[:3] + (bytes(row[3]),) for row in self._sketches()],
+                         [row[:3] + (bytes(row[3]),) for row in incremental])
+
+
+class TestQuery(DurationCase):
+    def test_percentiles_and_rank(self):
+        for n in range(1, 21):
+            self._job("s1", 30 * n)
+        (row,) = durations.query(self.conn)
+        self.assertEqual(row["project"], "repo-x")
+        self.assertEqual(row["jobs"], 20)
+        self.assertAlmostEqual(row["p50"], 300, delta=300 * durations.ALPHA)
+        self.assertAlmostEqual(row["p99"], 570, delta=570 * durations.ALPHA)
+
+        # The command's own connection shares the in-memory database while ours is open
+        with patch.dict(os.environ, {"CCNOTIFY_DB": self.tracker.storage.target}), \
+                patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"), \
+                patch("sys.stdout", new_callable=io.StringIO) as out:
+            durations.main(["--rank", "400", "--json"])
+        (row,) = json.loads(out.getvalue())
+        # 390s shares a bucket with 400s, so it may count as equal rather than faster
+        self.assertIn(row["faster"], (0.6, 0.65))
+
+
+if __name__ == "__main__":
+    unittest.main()
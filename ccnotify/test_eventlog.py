@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Tests for the ccnotify JSON-lines event log."""
+
+import gzip
+import json
+import logging
+import os
+import tempfile
+import time
+import unittest
+
+import eventlog
+
+
+class EventLogCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "ccnotify.jsonl")
+        self.logger = logging.getLogger("ccnotify.test")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        self.logger.handlers.clear()
+
+    def _writer(self, **options):
+        writer = eventlog.EventLogWriter(self.path, **options)
+        writer.start()
+        self.logger.addHandler(eventlog._QueueHandler(writer))
+        return writer
+
+    def _log(self, event, **fields):
+        self.logger.info(eventlog.Event(event, fields))
+
+    def _lines(self, path=None):
+        with open(path or self.path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+
+class TestEventLogWriter(EventLogCase):
+    def test_events_are_written_as_json_lines(self):
+        writer = self._writer()
+        for seq in range(3):
+            self._log("job_stopped", session_id="abc", seq=seq)
+        self.logger.warning("plain %s", "message")
+        writer.close()
+
+        lines = self._lines()
+        self.assertEqual([e["event"] for e in lines], ["job_stopped"] * 3 + ["log"])
+        self.assertEqual(lines[2]["seq"], 2)
+        self.assertEqual(lines[2]["session_id"], "abc")
+        self.assertEqual(lines[0]["level"], "info")
+        self.assertEqual(lines[3]["msg"], "plain message")
+        self.assertEqual(lines[3]["level"], "warning")
+
+    def test_size_rotation_archives_and_prunes(self):
+        writer = eventlog.EventLogWriter(self.path, max_bytes=200, backup_count=2)
+        try:
+            for seq in range(4):
+                entry = {"ts": time.time(), "event": "job_stopped", "seq": seq, "pad": "x" * 150}
+                writer._write((json.dumps(entry) + "\n").encode())
+        finally:
+            writer.close()
+
+        archived = eventlog.archives(self.path)
+        self.assertEqual(len(archived), 2)
+        with gzip.open(archived[-1], "rt", encoding="utf-8") as f:
+            self.assertEqual(json.loads(f.readline())["seq"], 2)
+        self.assertEqual([e["seq"] for e in self._lines()], [3])
+
+    def test_rotation_by_age(self):
+        with open(self.path, "w") as f:
+            f.write(json.dumps({"ts": time.time() - 100, "event": "old"}) + "\n")
+        writer = self._writer(max_age=10)
+        self._log("fresh")
+        writer.close()
+
+        self.assertEqual(len(eventlog.archives(self.path)), 1)
+        self.assertEqual([e["event"] for e in self._lines()], ["fresh"])
+
+
+class TestSetup(unittest.TestCase):
+    def test_repeated_setup_does_not_stack_handlers(self):
+        path = os.path.join(tempfile.mkdtemp(), "ccnotify.jsonl")
+        root = logging.getLogger()
+        before = list(root.handlers)
+        try:
+            first = eventlog.setup(path)
+            second = eventlog.setup(path)
+            self.assertIs(first, second)
+            self.assertEqual(len(root.handlers), len(before) + 1)
+        finally:
+            root.handlers = before
+            eventlog._writers.pop(path).close()
+
+
+class TestIterEvents(EventLogCase):
+    def _write(self, path, entries, compress=False):
+        opener = gzip.open if compress else open
+        with opener(path, "wt", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+
+    def test_filters_by_session_event_and_window(self):
+        self._write(self.path, [
+            {"ts": 100, "event": "prompt_recorded", "session_id": "a"},
+            {"ts": 200, "event": "job_stopped", "session_id": "a"},
+            {"ts": 300, "event": "job_stopped", "session_id": "ab"},
+            {"ts": 400, "event": "job_stopped", "session_id": "a"},
+        ])
+        found = list(eventlog.iter_events(self.path, session="a", since=150, until=450,
+                                          event="job_stopped"))
+        self.assertEqual([e["ts"] for e in found], [200, 400])
+
+    def test_archives_are_read_in_order_and_skipped_outside_window(self):
+        jan = time.mktime((2024, 1, 1, 0, 0, 0, 0, 0, -1))
+        feb = time.mktime((2024, 2, 1, 0, 0, 0, 0, 0, -1))
+        old = f"{self.path}.20240101-000000.gz"
+        recent = f"{self.path}.20240201-000000.gz"
+        self._write(old, [{"ts": jan - 10, "event": "e"}], compress=True)
+        self._write(recent, [{"ts": feb - 10, "event": "e"}], compress=True)
+        self._write(self.path, [{"ts": feb + 10, "event": "e"}])
+
+        self.assertEqual([e["ts"] for e in eventlog.iter_events(self.path)],
+                         [jan - 10, feb - 10, feb + 10])
+
+        # Archives wholly outside the window are never opened
+        with open(old, "wb") as f:
+            f.write(b"not gzip")
+        found = [e["ts"] for e in eventlog.iter_events(self.path, since=jan + 10)]
+        self.assertEqual(found, [feb - 10, feb + 10])
+
+        self._write(old, [{"ts": jan - 10, "event": "e"}], compress=True)
+        with open(recent, "wb") as f:
+            f.write(b"not gzip")
+        found = [e["ts"] for e in eventlog.iter_events(self.path, until=jan - 5)]
+        self.assertEqual(found, [jan - 10])
+
+
+class TestParseTime(unittest.TestCase):
+    def test_relative_and_iso(self):
+        self.assertEqual(eventlog.parse_time("2h", now=10000), 10000 - 7200)
+        self.assertEqual(eventlog.parse_time("30m", now=10000), 10000 - 1800)
+        self.assertEqual(eventlog.parse_time("1.5d", now=200000), 200000 - 129600)
+        self.assertAlmostEqual(
+            eventlog.parse_time("2024-01-02T03:04:05"),
+            time.mktime((2024, 1, 2, 3, 4, 5, 0, 0, -1)),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
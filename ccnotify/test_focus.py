@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Tests for ccnotify focus-state providers."""
+
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import ccnotify
+import focus
+
+
+class TestCachedFocusProvider(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "focus.json")
+        self.inner = focus.FakeFocusProvider("MY-UUID")
+        self.provider = focus.CachedFocusProvider(self.inner, self.path)
+
+    def test_answer_is_shared_within_ttl(self):
+        self.assertEqual(self.provider.frontmost_session(), "MY-UUID")
+        other_process = focus.CachedFocusProvider(focus.FakeFocusProvider("OTHER"), self.path)
+        self.assertEqual(other_process.frontmost_session(), "MY-UUID")
+        self.assertEqual(self.inner.calls, 1)
+
+    def test_expired_answer_is_refetched(self):
+        focus.write_state(self.path, "OLD", "cache", now=time.time() - focus.FOCUS_TTL - 1)
+        self.assertEqual(self.provider.frontmost_session(), "MY-UUID")
+        self.assertEqual(self.inner.calls, 1)
+
+    def test_fresh_watcher_state_outlives_cache_ttl(self):
+        focus.write_state(self.path, "WATCHED", "watcher", now=time.time() - focus.FOCUS_TTL - 1)
+        self.assertEqual(self.provider.frontmost_session(), "WATCHED")
+        self.assertEqual(self.inner.calls, 0)
+
+    def test_dead_watcher_state_is_ignored(self):
+        focus.write_state(self.path, "WATCHED", "watcher", now=time.time() - focus.WATCHER_TTL - 1)
+        self.assertEqual(self.provider.frontmost_session(), "MY-UUID")
+
+    def test_not_front_is_cached_as_none(self):
+        self.inner.session = None
+        self.assertIsNone(self.provider.frontmost_session())
+        self.assertIsNone(focus.read_state(self.path)["session"])
+
+    def test_corrupt_state_file_falls_back_to_inner(self):
+        with open(self.path, "w") as f:
+            f.write("{not json")
+        self.assertEqual(self.provider.frontmost_session(), "MY-UUID")
+
+
+class TestAppleScriptFocusProvider(unittest.TestCase):
+    @patch("focus.subprocess.run")
+    def test_not_front_and_errors_are_none(self, mock_run):
+        provider = focus.AppleScriptFocusProvider()
+        for stdout in ("NOTFRONT:Safari\n", "ERROR:boom\n", ""):
+            mock_run.return_value = MagicMock(stdout=stdout)
+            self.assertIsNone(provider.frontmost_session())
+
+    @patch("focus.subprocess.run", side_effect=TimeoutError("osascript hung"))
+    def test_exception_is_none(self, mock_run):
+        self.assertIsNone(focus.AppleScriptFocusProvider().frontmost_session())
+
+
+class TestTrackerUsesProvider(unittest.TestCase):
+    def _tracker(self, front):
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            tracker = ccnotify.ClaudePromptTracker(
+                db_path=os.path.join(tempfile.mkdtemp(), "ccnotify.db")
+            )
+        tracker.environ = {"ITERM_SESSION_ID": "w1t0p0:MY-UUID"}
+        tracker.focus = focus.FakeFocusProvider(front)
+        return tracker
+
+    @patch("subprocess.run")
+    def test_focus_check_never_forks(self, mock_run):
+        self.assertTrue(self._tracker("MY-UUID")._is_session_focused())
+        self.assertFalse(self._tracker("OTHER")._is_session_focused())
+        self.assertFalse(self._tracker(None)._is_session_focused())
+        mock_run.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
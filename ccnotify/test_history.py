@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Tests for the bisecting history.jsonl reader."""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import history
+
+
+def _entry(day, hour, session_id, display="hello", project="/work/toocan-app"):
+    return {"display": display, "pastedContents": {},
+            "timestamp": history.local_day_ms(day) + hour * 3600 * 1000,
+            "project": project, "sessionId": session_id}
+
+
+class HistoryCase(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "history.jsonl")
+
+    def _write(self, entries, raw=""):
+        with open(self.path, "a") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in entries)
+            f.write(raw)
+
+
+class TestBisection(HistoryCase):
+    def test_offsets_land_on_line_starts(self):
+        entries = [_entry("2024-03-10", hour, f"s{hour}", display="x" * hour) for hour in range(24)]
+        self._write(entries)
+        with history.HistoryFile(self.path) as h:
+            for hour, entry in enumerate(entries):
+                start = h.offset_of(entry["timestamp"])
+                line = h.map[start:h.map.find(b"\n", start)]
+                self.assertEqual(json.loads(line)["sessionId"], f"s{hour}")
+            self.assertEqual(h.offset_of(0), 0)
+            self.assertEqual(h.offset_of(entries[-1]["timestamp"] + 1), len(h.map))
+
+    def test_range_parses_log_n_plus_k_lines(self):
+        self._write(_entry("2024-01-01", 0, f"s{i}") | {"timestamp": i * 60_000 + 1}
+                    for i in range(20000))
+        real_loads = json.loads
+        with patch("history.json.loads", side_effect=real_loads) as loads:
+            with history.HistoryFile(self.path) as h:
+                entries = list(h.entries(since=10000 * 60_000, until=10010 * 60_000))
+        self.assertEqual([e["sessionId"] for e in entries], [f"s{i}" for i in range(10000, 10010)])
+        self.assertLess(loads.call_count, 100)
+
+    def test_malformed_and_partial_lines_are_skipped(self):
+        self._write([_entry("2024-03-10", 1, "a")], raw="{not json\n")
+        self._write([_entry("2024-03-10", 2, "b"), _entry("2024-03-10", 3, "c")], raw='{"dis')
+        with history.HistoryFile(self.path) as h:
+            since = _entry("2024-03-10", 2, "b")["timestamp"]
+            self.assertEqual([e["sessionId"] for e in h.entries(since=since)], ["b", "c"])
+            self.assertEqual(len(list(h.entries())), 3)
+
+    def test_empty_file(self):
+        self._write([])
+        self.assertEqual(history.search(self.path, "2024-03-10", "2024-03-10"), [])
+
+
+class TestSearch(HistoryCase):
+    def test_groups_by_session_in_script_shape(self):
+        self._write([
+            _entry("2024-03-09", 23, "old"),
+            _entry("2024-03-10", 9, "s1", display="fix the auth redirect"),
+            _entry("2024-03-10", 10, "s2", project="/work/infra"),
+            _entry("2024-03-10", 11, "s1", display="now the tests"),
+            _entry("2024-03-11", 0, "new"),
+        ])
+        results = history.search(self.path, "2024-03-10", "2024-03-10")
+        self.assertEqual(results[0], {
+            "session": "s1",
+            "project": "toocan-app",
+            "project_full": "/work/toocan-app",
+            "time": "09:00",
+            "date": "2024-03-10",
+            "first_msg": "fix the auth redirect",
+            "count": 2,
+        })
+        self.assertEqual([r["session"] for r in results], ["s1", "s2"])
+
+    def test_keyword_and_project_filters(self):
+        self._write([
+            _entry("2024-03-10", 9, "s1", display="Deploy the app"),
+            _entry("2024-03-10", 10, "s2", display="deploy infra", project="/work/infra"),
+            _entry("2024-03-10", 11, "s3", display="unrelated"),
+        ])
+        self.assertEqual([r["session"] for r in history.search(self.path, keyword="DEPLOY")],
+                         ["s1", "s2"])
+        self.assertEqual([r["session"] for r in history.search(self.path, project="TOOCAN")],
+                         ["s1", "s3"])
+
+    def test_missing_file_prints_nothing(self):
+        with patch("sys.stdout.write") as write:
+            history.main(["--file", self.path, "--start", "2024-03-10", "--end", "2024-03-10"])
+        write.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""Tests for the Linear poller, against a stand-in GraphQL server."""
+
+import asyncio
+import http.server
+import io
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import bench_ccnotify
+import ccnotify
+import linear
+
+POLL_SH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       "scripts", "linear-poller", "poll.sh")
+
+
+class StandInLinear(http.server.HTTPServer):
+    """Just enough of Linear's GraphQL API: the issues query and the two mutations."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.issues = []
+        self.connections = 0
+        self.queries = []
+        self.mutations = []
+        self.drop_idle = False
+        thread = threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True)
+        thread.start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/graphql"
+
+    def issue(self, identifier, updated_at, comments=(), state="unstarted", labels=()):
+        issue = {
+            "id": f"id-{identifier}", "identifier": identifier, "title": f"Title {identifier}",
+            "description": "Line one\nline two", "updatedAt": updated_at,
+            "state": {"name": state.title(), "type": state},
+            "labels": {"nodes": [{"name": name} for name in labels]},
+            "comments": {"nodes": []},
+        }
+        for body, at in comments:
+            self.comment(issue, body, at)
+        self.issues.append(issue)
+        return issue
+
+    @staticmethod
+    def comment(issue, body, at, user="Ann"):
+        issue["comments"]["nodes"].append({
+            "id": f"{issue['identifier']}-c{len(issue['comments']['nodes'])}", "body": body,
+            "createdAt": at, "updatedAt": at, "user": {"name": user},
+        })
+        issue["updatedAt"] = max(issue["updatedAt"], at)
+
+    def answer(self, query, variables):
+        if "commentCreate" in query or "issueUpdate" in query:
+            self.mutations.append(("comment" if "commentCreate" in query else "label", variables))
+            return {"data": {"x": {"success": True}}}
+        self.queries.append(variables)
+        since = variables["since"]
+        matching = sorted(
+            (i for i in self.issues if i["updatedAt"] > since
+             and any("@claude" in c["body"] for c in i["comments"]["nodes"])),
+            key=lambda i: i["updatedAt"],
+        )
+        start = int(variables["after"] or 0)
+        page = matching[start:start + variables["first"]]
+        nodes = [dict(i, comments={"nodes": [c for c in i["comments"]["nodes"] if c["updatedAt"] > since]})
+                 for i in page]
+        end = start + len(page)
+        return {"data": {"issues": {"nodes": nodes,
+                                    "pageInfo": {"hasNextPage": end < len(matching), "endCursor": str(end)}}}}
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        if self.headers["Authorization"] != "lin_api_test":
+            self.send_error(401)
+            return
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        body = json.dumps(self.server.answer(request["query"], request["variables"])).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        # Like a load balancer timing out an idle keep-alive: hang up without saying so
+        if self.server.drop_idle:
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+class LinearCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInLinear()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            self.tracker = ccnotify.ClaudePromptTracker(
+                db_path=os.path.join(tempfile.mkdtemp(), "ccnotify.db")
+            )
+        self.addCleanup(self.tracker.close)
+        self.launched = []
+        self.poller = self._poller()
+
+    def _poller(self, concurrency=4, launch=None):
+        client = linear.Client(self.server.url, "lin_api_test")
+        self.addCleanup(client.close)
+        return linear.Poller(self.tracker, client, "/src/app", concurrency, launch or self._launch)
+
+    async def _launch(self, ticket, prompt, repo):
+        self.launched.append(ticket.identifier)
+        return f"https://claude.ai/code/session_{ticket.identifier}"
+
+    def _run(self, *coroutines):
+        async def run():
+            return [await coroutine for coroutine in coroutines]
+
+        with patch("sys.stdout", new_callable=io.StringIO):
+            return asyncio.run(run())
+
+    def _cached(self):
+        conn = self.tracker._connect()
+        return (conn.execute("SELECT identifier FROM linear_issue ORDER BY identifier").fetchall(),
+                conn.execute("SELECT id FROM linear_comment ORDER BY id").fetchall())
+
+
+class TestSync(LinearCase):
+    def test_only_changes_since_the_cursor_are_fetched(self):
+        issue = self.server.issue("APP-1", "2024-03-01T10:00:00.000Z",
+                                  [("Please look", "2024-03-01T09:00:00.000Z"),
+                                   ("@claude fix it", "2024-03-01T10:00:00.000Z")])
+        self.server.issue("APP-2", "2024-03-01T11:00:00.000Z", [("no tag", "2024-03-01T11:00:00.000Z")])
+        self.assertEqual(self._run(self.poller.sync()), [1])
+        self.assertEqual(self._run(self.poller.sync()), [0])
+        self.assertEqual(self.server.queries[1]["since"], "2024-03-01T10:00:00.000Z")
+
+        self.server.comment(issue, "also the tests", "2024-03-02T08:00:00.000Z")
+        self.assertEqual(self._run(self.poller.sync()), [1])
+        self.assertEqual(self._cached(), ([("APP-1",)], [("APP-1-c0",), ("APP-1-c1",), ("APP-1-c2",)]))
+
+    def test_pages_are_followed(self):
+        for n in range(5):
+            self.server.issue(f"APP-{n}", f"2024-03-0{n + 1}T00:00:00.000Z",
+                              [("@claude", f"2024-03-0{n + 1}T00:00:00.000Z")])
+        with patch.object(linear, "PAGE_SIZE", 2):
+            self.assertEqual(self._run(self.poller.sync()), [5])
+        self.assertEqual(len(self.server.queries), 3)
+        self.assertEqual(len(self._cached()[0]), 5)
+
+    def test_graphql_errors_are_raised(self):
+        with patch.object(StandInLinear, "answer", return_value={"errors": [{"message": "bad filter"}]}):
+            with self.assertRaisesRegex(linear.LinearError, "bad filter"):
+                self._run(self.poller.sync())
+
+
+class TestConnection(LinearCase):
+    def test_polls_share_one_connection(self):
+        self.server.issue("APP-1", "2024-03-01T10:00:00.000Z", [("@claude", "2024-03-01T10:00:00.000Z")])
+        poller = self.poller
+        self._run(poller.poll(), poller.poll(), poller.poll())
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.queries), 3)
+        self.assertEqual(len(self.server.mutations), 2)
+        self.assertEqual(self.launched, ["APP-1"])
+
+    def test_dropped_connection_is_reopened(self):
+        self.server.drop_idle = True
+        self._run(self.poller.sync(), self.poller.sync())
+        self.assertEqual(self.server.connections, 2)
+
+
+class TestCandidates(LinearCase):
+    def test_open_untaken_tagged_tickets(self):
+        at = "2024-03-01T10:00:00.000Z"
+        self.server.issue("APP-1", at, [("@claude", at)])
+        self.server.issue("APP-2", at, [("@claude", at)], state="completed")
+        self.server.issue("APP-3", at, [("@claude", at)], labels=["ai-in-progress"])
+        self.server.issue("APP-4", at, [("@claude", at)], labels=["ai-ready-for-review", "bug"])
+        self._run(self.poller.sync())
+        with patch("sys.stdout", new_callable=io.StringIO) as out:
+            tickets = self.poller.candidates()
+        self.assertEqual([t.identifier for t in tickets], ["APP-1"])
+        self.assertIn("Skipping APP-4 — already reviewed", out.getvalue())
+
+    def test_prompt(self):
+        ticket = linear.Ticket("id-1", "APP-1", "Fix login", "Line one\nline  two", "Todo", [
+            ("Ann", "Users can't log in"),
+            ("Bot", "Picking this up now."),
+            ("Bob", "@claude only touch\nthe auth module"),
+        ])
+        prompt, trigger, user = linear.build_prompt(ticket)
+        self.assertEqual((trigger, user), ("@claude only touch\nthe auth module", "Bob"))
+        self.assertIn("Description: Line one line two. Comments: Ann: Users can't log in "
+                      "Bob: @claude only touch the auth module. "
+                      "Instructions: @claude only touch the auth module.", prompt)
+        self.assertNotIn("Picking", prompt)
+
+        bare = ticket._replace(comments=[("Ann", "@claude")])
+        self.assertIn(f"Instructions: {linear.DEFAULT_INSTRUCTIONS}", linear.build_prompt(bare)[0])
+
+
+class TestLaunch(LinearCase):
+    def test_launches_are_concurrent_up_to_the_limit(self):
+        at = "2024-03-01T10:00:00.000Z"
+        for n in range(6):
+            self.server.issue(f"APP-{n}", at, [("@claude", at)])
+        running, peak = [0], [0]
+
+        async def launch(ticket, prompt, repo):
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.01)
+            running[0] -= 1
+            return None if ticket.identifier == "APP-5" else f"https://claude.ai/code/session_{ticket.identifier}"
+
+        (launched,) = self._run(self._poller(concurrency=2, launch=launch).poll())
+        self.assertEqual(peak[0], 2)
+        self.assertEqual(len(launched), 6)
+        self.assertIsNone(launched["APP-5"])
+        labelled = [v["id"] for kind, v in self.server.mutations if kind == "label"]
+        self.assertEqual(sorted(labelled), [f"id-APP-{n}" for n in range(5)])
+        # Taken tickets aren't launched again before Linear reports the label
+        self.assertEqual([t.identifier for t in self.poller.candidates()], ["APP-5"])
+
+    def test_a_failing_launch_does_not_stop_the_others(self):
+        at = "2024-03-01T10:00:00.000Z"
+        self.server.issue("APP-1", at, [("@claude", at)])
+        self.server.issue("APP-2", at, [("@claude", at)])
+
+        async def launch(ticket, prompt, repo):
+            if ticket.identifier == "APP-1":
+                raise OSError("tmux not found")
+            return "https://claude.ai/code/session_2"
+
+        (launched,) = self._run(self._poller(launch=launch).poll())
+        self.assertEqual(launched, {"APP-1": None, "APP-2": "https://claude.ai/code/session_2"})
+
+
+class TestWrapper(LinearCase):
+    def test_poll_sh_drives_the_poller(self):
+        at = "2024-03-01T10:00:00.000Z"
+        self.server.issue("APP-1", at, [("@claude", at)], state="completed")
+        sandbox = bench_ccnotify.make_sandbox()
+        self.addCleanup(shutil.rmtree, sandbox, ignore_errors=True)
+        env = dict(bench_ccnotify.hook_env(sandbox), CCNOTIFY=os.path.join(sandbox, "ccnotify.py"),
+                   LINEAR_API_URL=self.server.url, LINEAR_API_KEY="lin_api_test")
+        out = subprocess.run([POLL_SH], env=env, capture_output=True, text=True, check=True).stdout
+        self.assertIn("Found 0 ticket(s) (1 updated since the last poll)", out)
+        out = subprocess.run([POLL_SH], env=env, capture_output=True, text=True, check=True).stdout
+        self.assertIn("Found 0 ticket(s) (0 updated since the last poll)", out)
+
+
+if __name__ == "__main__":
+    unittest.main()
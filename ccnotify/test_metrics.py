@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Tests for ccnotify's counters, histograms and OpenMetrics export."""
+
+import os
+import subprocess
+import tempfile
+import threading
+import unittest
+import urllib.request
+from unittest.mock import patch
+
+import ccnotify
+import focus
+import metrics
+
+
+class MetricsCase(unittest.TestCase):
+    def setUp(self):
+        # Status-line caches and the spool go to a temp dir, never the source tree
+        state = patch.dict(os.environ, {"CCNOTIFY_STATE_DIR": tempfile.mkdtemp()})
+        state.start()
+        self.addCleanup(state.stop)
+        metrics._pending.clear()
+        self.addCleanup(metrics._pending.clear)
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            self.tracker = ccnotify.ClaudePromptTracker(
+                db_path=os.path.join(tempfile.mkdtemp(), "ccnotify.db")
+            )
+        self.tracker.environ = {}
+        self.addCleanup(self.tracker.close)
+        self.conn = self.tracker._connect()
+
+    def _render(self, openmetrics=True):
+        return metrics.render(self.conn, self.tracker.db_path, openmetrics)
+
+    def _sample(self, line_prefix, text=None):
+        text = text or self._render()
+        (line,) = [line for line in text.splitlines() if line.startswith(line_prefix + " ")]
+        return float(line.rsplit(" ", 1)[1])
+
+    def _handle(self, event_name, **data):
+        with patch("subprocess.run"):
+            ccnotify.handle_event(self.tracker, event_name, {"session_id": "s1", **data})
+
+
+class TestRecording(MetricsCase):
+    def test_hooks_add_to_persisted_totals(self):
+        self._handle("UserPromptSubmit", prompt="go", cwd="/work/repo-x")
+        self._handle("Stop")
+        self._handle("Stop")
+        self.assertEqual(metrics._pending, {})
+        self.assertEqual(self._sample('ccnotify_events_total{hook="Stop",outcome="handled"}'), 2)
+        self.assertEqual(self._sample('ccnotify_handler_seconds_count{hook="Stop"}'), 2)
+        self.assertEqual(self._sample('ccnotify_handler_seconds_bucket{hook="Stop",le="+Inf"}'), 2)
+        self.assertEqual(self._sample("ccnotify_prompts_total"), 1)
+
+    def test_buckets_are_cumulative(self):
+        for seconds in (0.003, 0.02, 0.02, 3.0):
+            metrics.observe("ccnotify_handler_seconds", seconds, hook="Stop")
+        metrics.flush(self.conn)
+        text = self._render()
+        buckets = {le: self._sample(f'ccnotify_handler_seconds_bucket{{hook="Stop",le="{le}"}}', text)
+                   for le in ("0.005", "0.01", "0.025", "2.5", "5.0", "+Inf")}
+        self.assertEqual(buckets, {"0.005": 1, "0.01": 1, "0.025": 3, "2.5": 3, "5.0": 4, "+Inf": 4})
+        self.assertAlmostEqual(self._sample('ccnotify_handler_seconds_sum{hook="Stop"}', text), 3.043)
+
+    def test_failed_flush_keeps_samples(self):
+        metrics.inc("ccnotify_notifications", outcome="sent")
+        self.conn.execute("DROP TABLE metric")
+        metrics.flush(self.conn)
+        self.assertEqual(len(metrics._pending), 1)
+
+    def test_notification_outcomes(self):
+        self.tracker.focus = focus.FakeFocusProvider("ME")
+        self.tracker.tty_path = None
+        with patch("subprocess.run"), patch("subprocess.Popen"), patch("time.sleep"):
+            self.tracker.send_notification("repo-x", "job#1 done")
+            self.tracker.environ = {"ITERM_SESSION_ID": "w0t0p0:ME"}
+            self.tracker.send_notification("repo-x", "job#2 done")
+        metrics.flush(self.conn)
+        text = self._render()
+        self.assertEqual(self._sample('ccnotify_notifications_total{outcome="sent"}', text), 1)
+        self.assertEqual(self._sample('ccnotify_notifications_total{outcome="skipped_focused"}', text), 1)
+        self.assertEqual(self._sample("ccnotify_focus_check_seconds_count", text), 1)
+
+    def test_focus_timeouts_are_counted(self):
+        timeout = subprocess.TimeoutExpired("osascript", 2)
+        with patch("subprocess.run", side_effect=timeout):
+            self.assertIsNone(focus.AppleScriptFocusProvider().frontmost_session())
+        metrics.flush(self.conn)
+        self.assertEqual(self._sample("ccnotify_focus_timeouts_total"), 1)
+
+
+class TestExport(MetricsCase):
+    def test_openmetrics_shape(self):
+        text = self._render()
+        self.assertTrue(text.endswith("# EOF\n"))
+        self.assertIn("# TYPE ccnotify_events counter\n", text)
+        self.assertIn("# TYPE ccnotify_handler_seconds histogram\n", text)
+        self.assertGreater(self._sample('ccnotify_db_size_bytes{file="db"}', text), 0)
+
+    def test_prometheus_textfile_names_counter_families_by_sample(self):
+        path = os.path.join(tempfile.mkdtemp(), "ccnotify.prom")
+        metrics.write_textfile(path, self._render(openmetrics=False))
+        with open(path) as f:
+            text = f.read()
+        self.assertIn("# TYPE ccnotify_events_total counter\n", text)
+        self.assertNotIn("# EOF", text)
+        self.assertEqual(os.listdir(os.path.dirname(path)), ["ccnotify.prom"])
+
+    def test_http_endpoint_negotiates_format(self):
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            # The server thread opens its own connection
+            tracker = ccnotify.ClaudePromptTracker(db_path=self.tracker.db_path)
+        server = metrics.make_server(tracker, "127.0.0.1", 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        request = urllib.request.Request(url, headers={"Accept": "application/openmetrics-text"})
+        with urllib.request.urlopen(request) as response:
+            self.assertEqual(response.headers["Content-Type"], metrics.OPENMETRICS_TYPE)
+            self.assertTrue(response.read().endswith(b"# EOF\n"))
+        with urllib.request.urlopen(url) as response:
+            self.assertEqual(response.headers["Content-Type"], metrics.PROMETHEUS_TYPE)
+
+
+if __name__ == "__main__":
+    unittest.main()
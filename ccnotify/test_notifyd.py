@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""Tests for the ccnotify daemon and the hook-side socket client."""
+
+import io
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import ccnotify
+import notifyd
+
+
+class _RecordingTracker:
+    _conn = None
+
+    def __init__(self):
+        self.handled = []
+        self.done = threading.Event()
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _recording_handlers():
+    def handle(tracker, data):
+        tracker.handled.append((data["hook_event_name"], data, dict(tracker.environ)))
+        tracker.done.set()
+    return {name: handle for name in ccnotify.EVENT_HANDLERS}
+
+
+class TestDaemonRoundTrip(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmpdir, "d.sock")
+        self.tracker = _RecordingTracker()
+        self.daemon = notifyd.NotifyDaemon(self.socket_path, tracker_factory=lambda: self.tracker)
+        self.daemon.start()
+        self.thread = threading.Thread(target=self.daemon.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.daemon.request_stop()
+        self.thread.join()
+        self.daemon.stop()
+
+    @patch.dict(os.environ, {"ITERM_SESSION_ID": "w1t0p0:MY-UUID"})
+    def test_forwarded_event_is_handled_by_daemon(self):
+        data = {"session_id": "s1", "hook_event_name": "Stop"}
+        with patch.dict(ccnotify.EVENT_HANDLERS, _recording_handlers()), \
+                patch.dict(os.environ, {"CCNOTIFY_SOCKET": self.socket_path}):
+            self.assertTrue(ccnotify._forward_to_daemon("Stop", data))
+            self.assertTrue(self.tracker.done.wait(2))
+
+        event, payload, env = self.tracker.handled[0]
+        self.assertEqual(event, "Stop")
+        self.assertEqual(payload, data)
+        self.assertEqual(env, {"ITERM_SESSION_ID": "w1t0p0:MY-UUID"})
+
+    def test_large_payload_survives_chunking(self):
+        data = {"session_id": "s1", "prompt": "x" * 200000, "cwd": "/tmp",
+                "hook_event_name": "UserPromptSubmit"}
+        with patch.dict(ccnotify.EVENT_HANDLERS, _recording_handlers()), \
+                patch.dict(os.environ, {"CCNOTIFY_SOCKET": self.socket_path}):
+            self.assertTrue(ccnotify._forward_to_daemon("UserPromptSubmit", data))
+            self.assertTrue(self.tracker.done.wait(2))
+        self.assertEqual(len(self.tracker.handled[0][1]["prompt"]), 200000)
+
+    def test_ack_waits_for_the_handler(self):
+        data = {"session_id": "s1", "hook_event_name": "Stop"}
+        with patch.dict(ccnotify.EVENT_HANDLERS, _recording_handlers()), \
+                patch.dict(os.environ, {"CCNOTIFY_SOCKET": self.socket_path}):
+            self.assertTrue(ccnotify._forward_to_daemon("Stop", data))
+            self.assertEqual(len(self.tracker.handled), 1)
+
+    def test_failed_event_is_handed_back(self):
+        def fail(tracker, data):
+            raise RuntimeError("disk full")
+
+        data = {"session_id": "s1", "hook_event_name": "Stop"}
+        with patch.dict(ccnotify.EVENT_HANDLERS, {"Stop": fail}), \
+                patch.dict(os.environ, {"CCNOTIFY_SOCKET": self.socket_path}):
+            self.assertFalse(ccnotify._forward_to_daemon("Stop", data))
+
+    def test_slow_delivery_does_not_hold_up_events(self):
+        release = threading.Event()
+
+        def enqueue(tracker, data):
+            tracker.handled.append(data["session_id"])
+            tracker.enqueued = 1
+
+        def deliver(tracker, iterm_session=None, tty_path=None):
+            release.wait(5)
+
+        with patch.dict(ccnotify.EVENT_HANDLERS, {"Stop": enqueue}), \
+                patch.dict(os.environ, {"CCNOTIFY_SOCKET": self.socket_path}), \
+                patch.object(self.daemon, "_deliver", side_effect=deliver) as mock_deliver:
+            for session_id in ("s1", "s2"):
+                data = {"session_id": session_id, "hook_event_name": "Stop"}
+                self.assertTrue(ccnotify._forward_to_daemon("Stop", data))
+            self.assertEqual(self.tracker.handled, ["s1", "s2"])
+            self.assertFalse(release.is_set())
+            release.set()
+        self.assertGreaterEqual(mock_deliver.call_count, 1)
+
+    def test_second_daemon_refuses_live_socket(self):
+        with self.assertRaises(RuntimeError):
+            notifyd.NotifyDaemon(self.socket_path, tracker_factory=_RecordingTracker).start()
+
+
+class TestAwait(unittest.TestCase):
+    def test_unstarted_request_is_cancelled(self):
+        daemon = notifyd.NotifyDaemon(os.path.join(tempfile.mkdtemp(), "d.sock"))
+        request = {"tty_fd": None, "done": threading.Event(),
+                   "claimed": False, "cancelled": False, "committed": False}
+        with patch.object(ccnotify, "DAEMON_TIMEOUT", 0.01):
+            self.assertFalse(daemon._await(request))
+        self.assertTrue(request["cancelled"])
+
+    def test_started_request_is_waited_out(self):
+        daemon = notifyd.NotifyDaemon(os.path.join(tempfile.mkdtemp(), "d.sock"))
+        request = {"tty_fd": None, "done": threading.Event(),
+                   "claimed": True, "cancelled": False, "committed": False}
+
+        def finish():
+            request["committed"] = True
+            request["done"].set()
+
+        timer = threading.Timer(0.05, finish)
+        timer.start()
+        with patch.object(ccnotify, "DAEMON_TIMEOUT", 0.01):
+            self.assertTrue(daemon._await(request))
+        timer.join()
+        self.assertFalse(request["cancelled"])
+
+
+class TestReplyTimeout(unittest.TestCase):
+    """A daemon stuck on a locked database must answer before the hook gives up on it."""
+
+    def setUp(self):
+        self.state = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.state, "ccnotify.db")
+        env = patch.dict(os.environ, {"CCNOTIFY_STATE_DIR": self.state})
+        env.start()
+        self.addCleanup(env.stop)
+        os.environ.pop("ITERM_SESSION_ID", None)
+        tracker = self._tracker()
+        tracker._connect()  # migrate before the lock is taken
+        tracker.close()
+
+        self.socket_path = os.path.join(self.state, "d.sock")
+        self.daemon = notifyd.NotifyDaemon(self.socket_path, tracker_factory=self._tracker)
+        self.daemon.start()
+        thread = threading.Thread(target=self.daemon.serve_forever, daemon=True)
+        thread.start()
+
+        def stop():
+            self.daemon.request_stop()
+            thread.join()
+            self.daemon.stop()
+        self.addCleanup(stop)
+
+    def _tracker(self):
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            return ccnotify.ClaudePromptTracker(db_path=self.db_path)
+
+    def test_locked_event_is_spooled_before_the_hook_times_out(self):
+        import sqlite3
+
+        import spool
+
+        holder = sqlite3.connect(self.db_path, isolation_level=None)
+        holder.execute("BEGIN IMMEDIATE")
+        data = {"session_id": "s1", "prompt": "go", "cwd": "/tmp",
+                "hook_event_name": "UserPromptSubmit"}
+        with patch.object(ccnotify, "DAEMON_REPLY_TIMEOUT", 1.5), \
+                patch.object(notifyd, "HANDLE_MARGIN", 1.0), \
+                patch.dict(os.environ, {"CCNOTIFY_SOCKET": self.socket_path}), \
+                patch("subprocess.run"):
+            # Before the deadline a hook would have fallen back and handled it again
+            self.assertTrue(ccnotify._forward_to_daemon("UserPromptSubmit", data))
+        self.assertTrue(spool.pending())
+        holder.rollback()
+        holder.close()
+
+        tracker = self._tracker()
+        self.addCleanup(tracker.close)
+        with patch("subprocess.run"):
+            spool.replay(tracker)
+        self.assertEqual(tracker._connect().execute(
+            "SELECT session_id, prompt FROM prompt").fetchall(), [("s1", "go")])
+
+
+class TestClientFallback(unittest.TestCase):
+    def test_forward_returns_false_without_daemon(self):
+        missing = os.path.join(tempfile.mkdtemp(), "missing.sock")
+        with patch.dict(os.environ, {"CCNOTIFY_SOCKET": missing}):
+            self.assertFalse(ccnotify._forward_to_daemon("Stop", {"session_id": "s"}))
+
+    @patch("ccnotify._spawn_deliverer")
+    @patch("ccnotify._forward_to_daemon", return_value=False)
+    @patch("ccnotify.ClaudePromptTracker")
+    def test_main_runs_in_process_when_daemon_down(self, mock_tracker_cls, mock_forward,
+                                                   mock_spawn):
+        handler = MagicMock()
+        stdin = io.StringIO('{"session_id": "s1", "hook_event_name": "Stop"}')
+        with patch.dict(ccnotify.EVENT_HANDLERS, {"Stop": handler}), \
+                patch.object(ccnotify.sys, "argv", ["ccnotify.py", "Stop"]), \
+                patch.object(ccnotify.sys, "stdin", stdin):
+            ccnotify.main()
+        handler.assert_called_once_with(mock_tracker_cls.return_value,
+                                        {"session_id": "s1", "hook_event_name": "Stop"})
+
+    @patch("ccnotify._forward_to_daemon", return_value=True)
+    @patch("ccnotify.ClaudePromptTracker")
+    def test_main_skips_tracker_when_daemon_accepts(self, mock_tracker_cls, mock_forward):
+        stdin = io.StringIO('{"session_id": "s1", "hook_event_name": "Stop"}')
+        with patch.object(ccnotify.sys, "argv", ["ccnotify.py", "Stop"]), \
+                patch.object(ccnotify.sys, "stdin", stdin):
+            ccnotify.main()
+        mock_tracker_cls.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""Tests for the ccnotify notification outbox."""
+
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import ccnotify
+import outbox
+
+
+def _make_tracker(iterm_session="w1t0p0:MY-UUID", storage=None):
+    with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+        tracker = ccnotify.ClaudePromptTracker(storage=storage or ccnotify.Storage.in_memory())
+    tracker.environ = {"ITERM_SESSION_ID": iterm_session} if iterm_session else {}
+    return tracker
+
+
+class _FlakyDeliverer(outbox.RecordingDeliverer):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def deliver(self, note, tty_path):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("terminal-notifier exploded")
+        super().deliver(note, tty_path)
+
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        # Status-line caches and the spool go to a temp dir, never the source tree
+        state = patch.dict(os.environ, {"CCNOTIFY_STATE_DIR": tempfile.mkdtemp()})
+        state.start()
+        self.addCleanup(state.stop)
+        self.tracker = _make_tracker()
+        self.conn = self.tracker._connect()
+        self.outbox = outbox.Outbox(self.conn)
+
+    def _queue(self, session_id, message):
+        self.tracker.handle_notification({
+            "session_id": session_id, "message": message, "cwd": "/work/repo-x",
+        })
+
+    def _states(self):
+        return self.conn.execute(
+            "SELECT state, attempts FROM notification_outbox ORDER BY id"
+        ).fetchall()
+
+    def test_hook_only_commits_row(self):
+        with patch.object(ccnotify.ClaudePromptTracker, "send_notification") as send:
+            self._queue("s1", "Claude needs your permission to use Bash")
+        send.assert_not_called()
+        self.assertEqual(self._states(), [("pending", 0)])
+
+    def test_drain_delivers_and_marks_rows(self):
+        self._queue("s1", "Claude needs your permission to use Bash")
+        deliverer = outbox.RecordingDeliverer()
+
+        self.assertEqual(self.outbox.drain(deliverer), 1)
+        self.assertEqual(deliverer.delivered[0].title, "repo-x")
+        self.assertEqual(deliverer.delivered[0].subtitle, "Permission Required")
+        self.assertEqual(self._states(), [("delivered", 1)])
+        self.assertEqual(self.outbox.drain(deliverer), 0)
+
+    def test_identical_pending_notifications_collapse(self):
+        self._queue("s1", "Claude needs your permission to use Bash")
+        self._queue("s1", "Claude needs your permission to use Bash")
+        self.assertEqual(len(self._states()), 1)
+
+        self.outbox.drain(outbox.RecordingDeliverer())
+        self._queue("s1", "Claude needs your permission to use Bash")
+        self.assertEqual(len(self._states()), 2)
+
+    def test_failure_schedules_retry_and_holds_later_rows(self):
+        self._queue("s1", "Claude needs your permission to use Bash")
+        self._queue("s1", "Claude needs your permission to use Edit")
+        self._queue("s2", "Claude needs your permission to use Read")
+        deliverer = _FlakyDeliverer(failures=1)
+
+        self.outbox.drain(deliverer)
+        self.assertEqual([n.session_id for n in deliverer.delivered], ["s2"])
+        self.assertEqual(self._states(), [("pending", 1), ("pending", 0), ("delivered", 1)])
+
+        # Once the backoff expires the session drains in its original order
+        self.conn.execute("UPDATE notification_outbox SET next_attempt_at = 0")
+        self.conn.commit()
+        self.outbox.drain(deliverer)
+        self.assertEqual([n.subtitle for n in deliverer.delivered[1:]],
+                         ["Permission Required", "Permission Required"])
+        self.assertEqual([n.id for n in deliverer.delivered[1:]], [1, 2])
+
+    def test_gives_up_after_max_attempts(self):
+        self._queue("s1", "Claude needs your permission to use Bash")
+        deliverer = _FlakyDeliverer(failures=outbox.MAX_ATTEMPTS)
+        for _ in range(outbox.MAX_ATTEMPTS):
+            self.conn.execute("UPDATE notification_outbox SET next_attempt_at = 0")
+            self.conn.commit()
+            self.outbox.drain(deliverer)
+        self.assertEqual(self._states(), [("failed", outbox.MAX_ATTEMPTS)])
+
+    def test_leased_rows_are_not_claimed_twice(self):
+        self._queue("s1", "Claude needs your permission to use Bash")
+        self.assertEqual(len(self.outbox.claim()), 1)
+        self.assertEqual(self.outbox.claim(), [])
+        self.assertEqual(len(self.outbox.claim(now=time.time() + outbox.LEASE_SECONDS + 1)), 1)
+
+    def test_drainer_leaves_fresh_rows_of_other_terminals(self):
+        other = _make_tracker("w2t0p0:OTHER-UUID", storage=self.tracker.storage)
+        other.handle_notification({"session_id": "s9", "message": "permission", "cwd": ""})
+        self._queue("s1", "Claude needs your permission to use Bash")
+
+        deliverer = outbox.RecordingDeliverer()
+        self.outbox.drain(deliverer, iterm_session="w1t0p0:MY-UUID", tty_path="/dev/tty")
+        self.assertEqual([n.session_id for n in deliverer.delivered], ["s1"])
+
+    def test_tty_only_passed_for_own_terminal(self):
+        self._queue("s1", "Claude needs your permission to use Bash")
+        delivered = []
+        deliverer = outbox.RecordingDeliverer()
+        deliverer.deliver = lambda note, tty_path: delivered.append(tty_path)
+        self.outbox.drain(deliverer, iterm_session="w1t0p0:OTHER", tty_path="/dev/tty")
+        self.assertEqual(delivered, [])
+        self.outbox.drain(deliverer, iterm_session="w1t0p0:MY-UUID", tty_path="/dev/tty")
+        self.assertEqual(delivered, ["/dev/tty"])
+
+    def test_hooks_spawn_no_second_drainer(self):
+        lock = outbox._try_lock(ccnotify.deliver_lock_path("w1t0p0:MY-UUID"))
+        with patch.dict(os.environ, {"ITERM_SESSION_ID": "w1t0p0:MY-UUID"}), \
+                patch("subprocess.Popen") as popen:
+            ccnotify._spawn_deliverer()
+            popen.assert_not_called()
+            self.assertEqual(self.outbox.drain_exclusive(outbox.RecordingDeliverer(),
+                                                         iterm_session="w1t0p0:MY-UUID"), 0)
+            os.close(lock)
+            ccnotify._spawn_deliverer()
+            popen.assert_called_once()
+
+    def test_drainer_takes_rows_queued_as_it_lets_go(self):
+        self._queue("s1", "Claude needs your permission to use Bash")
+        drain = self.outbox.drain
+
+        def drain_then_queue(*args, **kwargs):
+            delivered = drain(*args, **kwargs)
+            # A hook commits after the last claim and sees the lock still held
+            if not self._states()[1:]:
+                self._queue("s2", "Claude needs your permission to use Edit")
+            return delivered
+
+        deliverer = outbox.RecordingDeliverer()
+        with patch.object(self.outbox, "drain", side_effect=drain_then_queue):
+            self.assertEqual(self.outbox.drain_exclusive(deliverer,
+                                                         iterm_session="w1t0p0:MY-UUID"), 2)
+        self.assertEqual(self._states(), [("delivered", 1), ("delivered", 1)])
+
+
+class TestCoalescing(unittest.TestCase):
+    def setUp(self):
+        # Status-line caches and the spool go to a temp dir, never the source tree
+        state = patch.dict(os.environ, {"CCNOTIFY_STATE_DIR": tempfile.mkdtemp()})
+        state.start()
+        self.addCleanup(state.stop)
+        self.tracker = _make_tracker()
+        self.conn = self.tracker._connect()
+        self.outbox = outbox.Outbox(self.conn, window=60)
+
+    def _stop(self, session_id, cwd="/work/repo-x", minutes=1):
+        with patch("subprocess.run"):
+            self.tracker.handle_user_prompt_submit(
+                {"session_id": session_id, "prompt": "go", "cwd": cwd}
+            )
+        with self.conn:
+            self.conn.execute(
+                "UPDATE prompt SET created_at = datetime('now', ?) WHERE id = (SELECT MAX(id) FROM prompt)",
+                (f"-{minutes * 60} seconds",),
+            )
+        self.tracker.handle_stop({"session_id": session_id})
+
+    def _age(self, seconds):
+        with self.conn:
+            self.conn.execute("UPDATE notification_outbox SET created_at = created_at - ?", (seconds,))
+
+    def test_stops_are_held_and_merged_per_project(self):
+        self._stop("s1", minutes=3)
+        self._stop("s2", minutes=12)
+        self._stop("s3", cwd="/work/repo-y")
+        deliverer = outbox.RecordingDeliverer()
+        self.assertEqual(self.outbox.drain(deliverer), 0)
+        self.assertAlmostEqual(self.outbox.next_due(), 60, delta=1)
+
+        self._age(61)
+        self.assertEqual(self.outbox.drain(deliverer), 2)
+        merged, single = deliverer.delivered
+        self.assertEqual((merged.title, merged.subtitle),
+                         ("repo-x", "2 jobs done in repo-x, longest 12m"))
+        self.assertEqual(single.title, "repo-y")
+        self.assertTrue(single.subtitle.startswith("job#1 done"))
+
+        prompts = self.conn.execute(
+            "SELECT id FROM prompt WHERE session_id IN ('s1', 's2') ORDER BY id"
+        ).fetchall()
+        self.assertEqual(self.outbox.covered_prompts(merged.id), [p for (p,) in prompts])
+        self.assertEqual(self.outbox.covered_prompts(single.id), [])
+        self.assertIsNone(self.outbox.next_due())
+
+    def test_a_due_group_takes_its_newer_rows_too(self):
+        self._stop("s1")
+        self._age(61)
+        self._stop("s2")
+        deliverer = outbox.RecordingDeliverer()
+        self.assertEqual(self.outbox.drain(deliverer), 1)
+        self.assertEqual(deliverer.delivered[0].subtitle, "2 jobs done in repo-x, longest 1m")
+
+    def test_permission_prompts_skip_the_window(self):
+        self._stop("s1")
+        self.tracker.handle_notification({"session_id": "s1", "cwd": "/work/repo-x",
+                                          "message": "Claude needs your permission to use Bash"})
+        deliverer = outbox.RecordingDeliverer()
+        self.outbox.drain(deliverer)
+        self.assertEqual([n.subtitle for n in deliverer.delivered], ["Permission Required"])
+
+    def test_failed_summary_retries_every_row(self):
+        self._stop("s1")
+        self._stop("s2")
+        self._age(61)
+        self.outbox.drain(_FlakyDeliverer(failures=1))
+        states = self.conn.execute("SELECT state, attempts FROM notification_outbox").fetchall()
+        self.assertEqual(states, [("pending", 1), ("pending", 1)])
+
+    def test_drain_can_wait_out_the_window(self):
+        self.outbox.window = 0.05
+        self._stop("s1")
+        deliverer = outbox.RecordingDeliverer()
+        self.assertEqual(self.outbox.drain(deliverer, wait=True), 1)
+
+    def test_worktrees_group_under_their_repo(self):
+        with patch.dict(os.environ, {"CCNOTIFY_WORKTREE_BASE": "/wt"}):
+            self.assertEqual(ccnotify.notification_group("/wt/repo-x/feature-a"), "repo-x")
+            self.assertEqual(ccnotify.notification_group("/work/repo-x"), "repo-x")
+            self.assertEqual(ccnotify.notification_group("/wt"), "wt")
+            self.assertEqual(ccnotify.notification_group(""), "Claude Task")
+
+
+class TestTrackerDeliverer(unittest.TestCase):
+    def test_delivers_with_row_session_and_restores_tracker(self):
+        tracker = _make_tracker(iterm_session=None)
+        seen = {}
+
+        def send(title, subtitle, cwd=None):
+            seen.update(env=dict(tracker.environ), tty=tracker.tty_path, title=title)
+
+        tracker.send_notification = send
+        note = outbox.Notification(1, "s1", "w1t0p0:MY-UUID", "repo-x", "done", "/w", 0)
+        outbox.TrackerDeliverer(tracker).deliver(note, "/dev/fd/7")
+
+        self.assertEqual(seen, {"env": {"ITERM_SESSION_ID": "w1t0p0:MY-UUID"},
+                                "tty": "/dev/fd/7", "title": "repo-x"})
+        self.assertEqual(tracker.environ, {})
+        self.assertEqual(tracker.tty_path, "/dev/tty")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""Tests for ccnotify retention and compaction."""
+
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import ccnotify
+import retention
+
+NOW = time.mktime((2024, 6, 15, 12, 0, 0, 0, 0, -1))
+
+
+def _stamp(days_ago):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(NOW - days_ago * 86400))
+
+
+class RetentionCase(unittest.TestCase):
+    def setUp(self):
+        # Status-line caches and the spool go to a temp dir, never the source tree
+        state = patch.dict(os.environ, {"CCNOTIFY_STATE_DIR": tempfile.mkdtemp()})
+        state.start()
+        self.addCleanup(state.stop)
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            self.tracker = ccnotify.ClaudePromptTracker(storage=ccnotify.Storage.in_memory())
+        self.conn = self.tracker._connect()
+
+    def tearDown(self):
+        self.tracker.close()
+
+    def _add(self, days_ago, session_id="s1", prompt="fix the bug", cwd="/work/repo-x",
+             stopped=True):
+        with self.conn:
+            return self.conn.execute(
+                """INSERT INTO prompt (session_id, created_at, prompt, cwd, seq, stoped_at)
+                   VALUES (?, ?, ?, ?, 1, ?)""",
+                (session_id, _stamp(days_ago), prompt, cwd,
+                 _stamp(days_ago - 0.01) if stopped else None),
+            ).lastrowid
+
+    def _compact(self, **policy):
+        policy.setdefault("max_age_days", 30)
+        policy.setdefault("max_rows", 0)
+        return retention.compact(self.conn, now=NOW, **policy)
+
+    def _hot_ids(self):
+        return [r[0] for r in self.conn.execute("SELECT id FROM prompt ORDER BY id")]
+
+
+class TestCompaction(RetentionCase):
+    def test_age_policy_archives_finished_rows_only(self):
+        old = self._add(60)
+        old_open = self._add(59, stopped=False)
+        recent = self._add(1)
+
+        result = self._compact(abandon_hours=0)
+
+        self.assertEqual(result.archived, 1)
+        self.assertEqual(self._hot_ids(), [old_open, recent])
+        row = self.conn.execute(
+            "SELECT month, row_count FROM prompt_archive"
+        ).fetchone()
+        self.assertEqual(row, (_stamp(60)[:7], 1))
+        self.assertEqual([p.id for p in retention.iter_prompts(self.conn)],
+                         [old, old_open, recent])
+
+    def test_row_policy_keeps_newest_rows(self):
+        ids = [self._add(5 - i * 0.1) for i in range(5)]
+        self._compact(max_rows=2)
+        self.assertEqual(self._hot_ids(), ids[-2:])
+
+    def test_cwd_is_deduplicated_and_long_prompts_compressed(self):
+        long_prompt = "refactor the parser " * 100
+        for _ in range(3):
+            self._add(60, prompt=long_prompt)
+        self._add(61, prompt="short", cwd="/work/other")
+        self._compact()
+
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM cwd").fetchone()[0], 2)
+        table = retention.partition_table(_stamp(60)[:7])
+        stored = self.conn.execute(
+            f"SELECT prompt, length(prompt_z) FROM {table} ORDER BY id"
+        ).fetchall()
+        self.assertEqual(stored[-1], ("short", None))
+        self.assertIsNone(stored[0][0])
+        self.assertLess(stored[0][1], len(long_prompt) // 10)
+
+        prompts = list(retention.iter_prompts(self.conn))
+        self.assertEqual(prompts[0].prompt, long_prompt)
+        self.assertEqual(prompts[0].cwd, "/work/repo-x")
+        self.assertEqual(prompts[-1].cwd, "/work/other")
+
+    def test_iter_prompts_filters_and_skips_other_months(self):
+        self._add(120, session_id="a")
+        self._add(60, session_id="a")
+        self._add(60, session_id="b")
+        self._compact()
+
+        # A partition outside the window is never read, even if it is unreadable
+        self.conn.execute(f"DROP TABLE {retention.partition_table(_stamp(120)[:7])}")
+        found = list(retention.iter_prompts(self.conn, session_id="a", since=_stamp(70)))
+        self.assertEqual([p.created_at for p in found], [_stamp(60)])
+
+    def test_expired_months_are_dropped(self):
+        self._add(400)
+        self._add(60)
+        result = self._compact(keep_months=6)
+
+        self.assertEqual(result.dropped_months, [_stamp(400)[:7]])
+        months = [m for (m,) in self.conn.execute("SELECT month FROM prompt_archive")]
+        self.assertEqual(months, [_stamp(60)[:7]])
+
+    def test_stale_open_jobs_are_abandoned(self):
+        stale = self._add(2, stopped=False)
+        fresh = self._add(0.5, stopped=False)
+        result = self._compact()
+
+        self.assertEqual(result.abandoned, 1)
+        rows = self.conn.execute(
+            """SELECT p.id, p.stoped_at, e.reason
+               FROM prompt AS p LEFT JOIN prompt_end AS e ON e.prompt_id = p.id ORDER BY p.id"""
+        ).fetchall()
+        self.assertEqual(rows, [(stale, _stamp(0), "abandoned"), (fresh, None, None)])
+        self.assertEqual(self._compact().abandoned, 0)
+
+    def test_abandoning_clears_the_status_line(self):
+        import statusline
+
+        self._add(2, session_id="crashed", stopped=False)
+        self._add(2, session_id="moved-on", stopped=False)
+        statusline.save("crashed", 1, NOW - 2 * 86400)
+        statusline.save("moved-on", 2, NOW - 3600)
+        self._compact()
+        self.assertIsNone(statusline.load("crashed"))
+        self.assertEqual(statusline.load("moved-on"), (2, NOW - 3600, None))
+
+    def test_session_end_sweeps_at_most_hourly(self):
+        stale = self._add(2, session_id="crashed", stopped=False)
+        self.tracker.environ = {}
+        self.tracker.handle_session_end({"session_id": "s1"})
+        self.assertEqual(self.conn.execute(
+            "SELECT reason FROM prompt_end WHERE prompt_id = ?", (stale,)).fetchone(), ("abandoned",))
+
+        later = self._add(2, session_id="crashed-too", stopped=False)
+        self.tracker.handle_session_end({"session_id": "s1"})
+        self.assertEqual(self.conn.execute(
+            "SELECT stoped_at FROM prompt WHERE id = ?", (later,)).fetchone(), (None,))
+        with patch("time.time", return_value=time.time() + retention.SWEEP_INTERVAL):
+            self.tracker.handle_session_end({"session_id": "s1"})
+        self.assertIsNotNone(self.conn.execute(
+            "SELECT stoped_at FROM prompt WHERE id = ?", (later,)).fetchone()[0])
+
+    def test_abandoned_jobs_stay_out_of_rebuilds(self):
+        import durations
+        import rollups
+
+        self._add(3)
+        self._add(2, stopped=False)
+        self._compact()
+        rollups.rebuild(self.conn)
+        durations.rebuild(self.conn)
+        self.assertEqual(self.conn.execute("SELECT SUM(jobs) FROM rollup_daily").fetchone()[0], 1)
+        self.assertEqual(self.conn.execute(
+            "SELECT jobs FROM duration_sketch WHERE scope = 'project'").fetchone()[0], 1)
+
+    def test_dropped_months_take_their_end_reasons(self):
+        self._add(400, stopped=False)
+        self._compact(keep_months=6)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM prompt_end").fetchone()[0], 0)
+
+    def test_delivered_outbox_rows_are_pruned(self):
+        with self.conn:
+            for state, age in (("delivered", 30), ("failed", 30), ("pending", 30),
+                               ("delivered", 1)):
+                self.conn.execute(
+                    """INSERT INTO notification_outbox
+                       (session_id, dedupe_key, title, subtitle, state, created_at,
+                        next_attempt_at)
+                       VALUES ('s', ?, 't', 's', ?, ?, 0)""",
+                    (f"{state}{age}", state, NOW - age * 86400),
+                )
+        self.assertEqual(self._compact().outbox_pruned, 2)
+
+    def test_idle_session_sketches_are_pruned(self):
+        import durations
+
+        durations.record(self.conn, "old", "/work/repo-x", 60)
+        durations.record(self.conn, "new", "/work/repo-x", 60)
+        with self.conn:
+            self.conn.execute(
+                "UPDATE duration_sketch SET updated_at = CASE key WHEN 'new' THEN ? ELSE ? END",
+                (NOW - 86400, NOW - 60 * 86400),
+            )
+
+        self.assertEqual(self._compact().sketches_pruned, 1)
+        self.assertEqual(self.conn.execute(
+            "SELECT scope, key FROM duration_sketch ORDER BY scope, key").fetchall(),
+            [("project", "repo-x"), ("session", "new")])
+
+    def test_hooks_still_work_after_compaction(self):
+        self._add(60, session_id="s1")
+        self._compact()
+        self.tracker.environ = {}
+        with patch("subprocess.run"):
+            self.tracker.handle_user_prompt_submit(
+                {"session_id": "s1", "prompt": "next", "cwd": "/work/repo-x"}
+            )
+        self.tracker.handle_stop({"session_id": "s1"})
+        self.assertEqual(len(self._hot_ids()), 1)
+
+
+class TestVacuum(RetentionCase):
+    def test_new_database_uses_incremental_vacuum(self):
+        self.assertEqual(self.conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+
+    def test_opening_does_not_wait_for_a_writer(self):
+        path = os.path.join(tempfile.mkdtemp(), "ccnotify.db")
+        ccnotify.Storage(path).connect().close()
+        holder = sqlite3.connect(path, isolation_level=None)
+        holder.execute("BEGIN IMMEDIATE")
+        try:
+            with patch.object(ccnotify, "BUSY_TIMEOUT", 0.2):
+                conn = ccnotify.Storage(path).connect()
+            self.assertEqual(conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+            conn.close()
+        finally:
+            holder.rollback()
+            holder.close()
+
+    def test_compaction_frees_pages(self):
+        for i in range(300):
+            self._add(60, prompt=f"{i} " + "x" * 2000)
+        result = self._compact()
+        self.assertGreater(result.pages_freed, 0)
+        self.assertEqual(self.conn.execute("PRAGMA freelist_count").fetchone()[0], 0)
+
+    def test_legacy_database_is_converted(self):
+        legacy = os.path.join(tempfile.mkdtemp(), "legacy.db")
+        with sqlite3.connect(legacy) as conn:
+            conn.execute("CREATE TABLE t (x)")
+        conn = sqlite3.connect(legacy)
+        self.assertTrue(retention.enable_incremental_vacuum(conn))
+        self.assertEqual(conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+        self.assertFalse(retention.enable_incremental_vacuum(conn))
+        conn.close()
+
+
+class TestPolicy(unittest.TestCase):
+    def test_env_overrides(self):
+        policy = retention.policy_from_env({"CCNOTIFY_RETAIN_DAYS": "7",
+                                            "CCNOTIFY_RETAIN_MONTHS": "12"})
+        self.assertEqual(policy, {"max_age_days": 7.0, "max_rows": retention.MAX_ROWS,
+                                  "keep_months": 12, "abandon_hours": retention.ABANDON_HOURS})
+
+    def test_partition_names_are_validated(self):
+        self.assertEqual(retention.partition_table("2024-03"), "prompt_archive_202403")
+        with self.assertRaises(ValueError):
+            retention.partition_table("2024-03; DROP TABLE prompt")
+
+
+if __name__ == "__main__":
+    unittest.main()
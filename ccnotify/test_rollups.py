@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Tests for ccnotify usage rollups."""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import ccnotify
+import retention
+import rollups
+
+
+class RollupCase(unittest.TestCase):
+    def setUp(self):
+        # Status-line caches and the spool go to a temp dir, never the source tree
+        state = patch.dict(os.environ, {"CCNOTIFY_STATE_DIR": tempfile.mkdtemp()})
+        state.start()
+        self.addCleanup(state.stop)
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            self.tracker = ccnotify.ClaudePromptTracker(storage=ccnotify.Storage.in_memory())
+        self.tracker.environ = {}
+        self.conn = self.tracker._connect()
+
+    def tearDown(self):
+        self.tracker.close()
+
+    def _prompt(self, session_id, cwd="/work/repo-x", ago=None):
+        with patch("subprocess.run"):
+            self.tracker.handle_user_prompt_submit(
+                {"session_id": session_id, "prompt": "go", "cwd": cwd}
+            )
+        if ago is not None:
+            # Backdate the new job so durations are measurable
+            with self.conn:
+                self.conn.execute(
+                    """UPDATE prompt SET created_at = datetime('now', ?)
+                       WHERE id = (SELECT MAX(id) FROM prompt)""",
+                    (f"-{ago} seconds",),
+                )
+
+    def _wait(self, session_id, ago):
+        self.tracker.handle_notification(
+            {"session_id": session_id, "message": "Claude is waiting for your input"}
+        )
+        with self.conn:
+            self.conn.execute(
+                """UPDATE prompt SET lastWaitUserAt = datetime('now', ?)
+                   WHERE id = (SELECT MAX(id) FROM prompt WHERE session_id = ?)""",
+                (f"-{ago} seconds", session_id),
+            )
+
+    def _snapshot(self):
+        return (
+            self.conn.execute("SELECT * FROM rollup_daily ORDER BY project, day").fetchall(),
+            self.conn.execute("SELECT * FROM rollup_session ORDER BY session_id").fetchall(),
+        )
+
+
+class TestIncrementalRollups(RollupCase):
+    def test_stop_counts_job_and_agent_time(self):
+        self._prompt("s1", ago=120)
+        self.tracker.handle_stop({"session_id": "s1"})
+
+        (row,) = rollups.query(self.conn, by="project")
+        self.assertEqual(row["project"], "repo-x")
+        self.assertEqual(row["jobs"], 1)
+        self.assertAlmostEqual(row["agent_seconds"], 120, delta=2)
+        self.assertEqual(row["waits"], 0)
+
+    def test_wait_is_booked_when_the_user_answers(self):
+        self._prompt("s1", ago=300)
+        self.tracker.handle_stop({"session_id": "s1"})
+        self._wait("s1", ago=90)
+        self.assertEqual(rollups.query(self.conn)[0]["waits"], 0)
+
+        self._prompt("s1")
+        (row,) = rollups.query(self.conn, by="session")
+        self.assertEqual(row["waits"], 1)
+        self.assertAlmostEqual(row["wait_seconds"], 90, delta=2)
+        self.assertEqual(row["jobs"], 1)
+
+    def test_filters_and_groupings(self):
+        for session_id, cwd in (("a", "/work/repo-x"), ("b", "/work/repo-y"),
+                                ("c", "/work/repo-y")):
+            self._prompt(session_id, cwd=cwd, ago=60)
+            self.tracker.handle_stop({"session_id": session_id})
+
+        projects = rollups.query(self.conn, by="project")
+        self.assertEqual({p["project"]: p["jobs"] for p in projects},
+                         {"repo-x": 1, "repo-y": 2})
+        (day,) = rollups.query(self.conn, by="day")
+        self.assertEqual(day["jobs"], 3)
+        sessions = rollups.query(self.conn, by="session", project="repo-y")
+        self.assertEqual(sorted(s["session_id"] for s in sessions), ["b", "c"])
+
+    def test_worktrees_count_as_their_repo(self):
+        base = tempfile.mkdtemp()
+        for session_id, cwd in (("a", os.path.join(base, "repo-x", "main")),
+                                ("b", os.path.join(base, "repo-x", "feature")),
+                                ("c", "/work/repo-x")):
+            with patch.dict(os.environ, {"CCNOTIFY_WORKTREE_BASE": base}):
+                self._prompt(session_id, cwd=cwd, ago=60)
+                self.tracker.handle_stop({"session_id": session_id})
+                self._wait(session_id, ago=30)
+                self._prompt(session_id, cwd=cwd)
+
+        (row,) = rollups.query(self.conn, by="project")
+        self.assertEqual((row["project"], row["jobs"], row["waits"]), ("repo-x", 3, 3))
+        incremental = self._snapshot()
+        with patch.dict(os.environ, {"CCNOTIFY_WORKTREE_BASE": base}):
+            rollups.rebuild(self.conn)
+        self.assertEqual(self._snapshot(), incremental)
+
+    def test_stats_never_reads_prompt(self):
+        self._prompt("s1", ago=10)
+        self.tracker.handle_stop({"session_id": "s1"})
+        statements = []
+        self.conn.set_trace_callback(statements.append)
+        for by in ("project", "day", "session"):
+            rollups.query(self.conn, by=by, days=0)
+        self.conn.set_trace_callback(None)
+        self.assertFalse([s for s in statements if "prompt" in s])
+
+
+class TestRebuild(RollupCase):
+    def test_rebuild_matches_incremental(self):
+        self._prompt("s1", ago=600)
+        self.tracker.handle_stop({"session_id": "s1"})
+        self._wait("s1", ago=120)
+        self._prompt("s1")
+        self.tracker.handle_stop({"session_id": "s1"})
+        self._prompt("s2", cwd="/work/repo-y", ago=50)
+        self.tracker.handle_stop({"session_id": "s2"})
+        self._prompt("s2", cwd="/work/repo-y")  # still running
+        incremental = self._snapshot()
+
+        self.assertEqual(rollups.rebuild(self.conn), 3)
+        self.assertEqual(self._snapshot(), incremental)
+
+    def test_rebuild_includes_archived_rows(self):
+        self._prompt("s1", ago=90 * 86400)
+        self.tracker.handle_stop({"session_id": "s1"})
+        with self.conn:
+            self.conn.execute("UPDATE prompt SET stoped_at = datetime(created_at, '+60 seconds')")
+        retention.compact(self.conn, max_age_days=30, max_rows=0)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM prompt").fetchone()[0], 0)
+
+        rollups.rebuild(self.conn)
+        (row,) = rollups.query(self.conn, days=0)
+        self.assertEqual((row["jobs"], row["agent_seconds"]), (1, 60))
+
+
+class TestFormatting(unittest.TestCase):
+    def test_format_seconds(self):
+        self.assertEqual(rollups.format_seconds(42), "42s")
+        self.assertEqual(rollups.format_seconds(600), "10m")
+        self.assertEqual(rollups.format_seconds(3 * 3600 + 5 * 60), "3h05m")
+        self.assertEqual(rollups.format_seconds(None), "0s")
+
+
+if __name__ == "__main__":
+    unittest.main()
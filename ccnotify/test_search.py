@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Tests for ccnotify full-text prompt search."""
+
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import ccnotify
+import retention
+import search
+
+
+def _utc(local_day, hour=12):
+    """created_at string for noon (or `hour`) local time on local_day."""
+    local = time.mktime(time.strptime(f"{local_day} {hour}", "%Y-%m-%d %H"))
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(local))
+
+
+class SearchCase(unittest.TestCase):
+    def setUp(self):
+        # Status-line caches and the spool go to a temp dir, never the source tree
+        state = patch.dict(os.environ, {"CCNOTIFY_STATE_DIR": tempfile.mkdtemp()})
+        state.start()
+        self.addCleanup(state.stop)
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            self.tracker = ccnotify.ClaudePromptTracker(storage=ccnotify.Storage.in_memory())
+        self.tracker.environ = {}
+        self.conn = self.tracker._connect()
+
+    def tearDown(self):
+        self.tracker.close()
+
+    def _add(self, session_id, prompt, day="2024-03-10", hour=12, cwd="/work/toocan-app"):
+        with self.conn:
+            self.conn.execute(
+                """INSERT INTO prompt (session_id, created_at, prompt, cwd, seq, stoped_at)
+                   VALUES (?, ?, ?, ?, 1, ?)""",
+                (session_id, _utc(day, hour), prompt, cwd, _utc(day, hour)),
+            )
+
+    def _search(self, **filters):
+        return search.search(self.conn, **filters)
+
+
+class TestSearch(SearchCase):
+    def test_prompts_are_indexed_on_insert(self):
+        with patch("subprocess.run"):
+            self.tracker.handle_user_prompt_submit(
+                {"session_id": "s1", "prompt": "Fix the auth redirect bug", "cwd": "/work/app"}
+            )
+        (result,) = self._search(keyword="redirect")
+        self.assertEqual(result["session"], "s1")
+
+    def test_result_shape_matches_search_history(self):
+        self._add("s1", "fix the auth redirect bug when logging in", hour=9)
+        self._add("s1", "now the auth tests", hour=10)
+        (result,) = self._search(keyword="auth")
+        self.assertEqual(result, {
+            "session": "s1",
+            "project": "toocan-app",
+            "project_full": "/work/toocan-app",
+            "cwd": "/work/toocan-app",
+            "time": "09:00",
+            "date": "2024-03-10",
+            "first_msg": "fix the auth redirect bug when logging in",
+            "count": 2,
+        })
+
+    def test_keyword_is_ranked_and_prefix_matched(self):
+        self._add("weak", "deploy the thing and a lot of other unrelated words here today")
+        self._add("strong", "deploy deploy deployment")
+        self._add("none", "unrelated")
+        results = self._search(keyword="deploy")
+        self.assertEqual([r["session"] for r in results], ["strong", "weak"])
+        self.assertEqual(self._search(keyword="auth!!"), [])
+        self.assertEqual(self._search(keyword="!!"), [])
+
+    def test_date_and_project_filters(self):
+        self._add("a", "deploy", day="2024-03-09")
+        self._add("b", "deploy", day="2024-03-10", cwd="/work/infra")
+        self._add("c", "deploy", day="2024-03-11")
+        self._add("d", "deploy", day="2024-03-12")
+
+        dated = self._search(keyword="deploy", start="2024-03-10", end="2024-03-11")
+        self.assertEqual(sorted(r["session"] for r in dated), ["b", "c"])
+        by_project = self._search(start="2024-03-01", project="TOOCAN")
+        self.assertEqual([r["session"] for r in by_project], ["a", "c", "d"])
+        self.assertEqual(self._search(project="nomatch"), [])
+
+    def test_filters_use_indexes(self):
+        self._add("a", "deploy")
+        plans = []
+        for filters in ({"start": "2024-03-10", "end": "2024-03-10"}, {"project": "toocan"}):
+            sql_seen = []
+            self.conn.set_trace_callback(sql_seen.append)
+            search.search(self.conn, **filters)
+            self.conn.set_trace_callback(None)
+            query = next(s for s in sql_seen if "FROM prompt AS p" in s)
+            plans.append(" ".join(r[3] for r in self.conn.execute(f"EXPLAIN QUERY PLAN {query}")))
+        self.assertIn("idx_prompt_created", plans[0])
+        self.assertIn("idx_prompt_cwd", plans[1])
+
+    def test_archived_prompts_stay_searchable(self):
+        long_prompt = "investigate the websocket reconnection storm " * 20
+        self._add("old", long_prompt, day="2023-01-05")
+        self._add("new", "websocket ping", day=time.strftime("%Y-%m-%d"))
+        retention.compact(self.conn, max_age_days=30, max_rows=0)
+
+        results = self._search(keyword="websocket", sort="time")
+        self.assertEqual([r["session"] for r in results], ["old", "new"])
+        self.assertEqual(results[0]["first_msg"], long_prompt[:80])
+        self.assertEqual(results[0]["project"], "toocan-app")
+        only_old = self._search(keyword="websocket", end="2023-12-31", project="toocan")
+        self.assertEqual([r["session"] for r in only_old], ["old"])
+
+    def test_dropping_archived_months_removes_them_from_the_index(self):
+        self._add("old", "websocket", day="2020-01-05")
+        retention.compact(self.conn, max_age_days=30, max_rows=0, keep_months=1)
+        rows = self.conn.execute(
+            "SELECT rowid FROM prompt_fts WHERE prompt_fts MATCH 'websocket'"
+        ).fetchall()
+        self.assertEqual(rows, [])
+
+    def test_reindex_covers_archives(self):
+        self._add("old", "websocket", day="2023-01-05")
+        self._add("new", "websocket", day=time.strftime("%Y-%m-%d"))
+        retention.compact(self.conn, max_age_days=30, max_rows=0)
+        self.assertEqual(search.reindex(self.conn), 2)
+        self.assertEqual(len(self._search(keyword="websocket")), 2)
+
+
+class TestHelpers(unittest.TestCase):
+    def test_fts_query_quotes_words(self):
+        self.assertEqual(search.fts_query('auth "bug" OR'), '"auth"* "bug"* "OR"*')
+
+    def test_utc_bounds_cover_whole_local_days(self):
+        since, until = search.utc_bounds("2024-03-10", "2024-03-10")
+        self.assertEqual(since, _utc("2024-03-10", 0))
+        self.assertEqual(until, _utc("2024-03-11", 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
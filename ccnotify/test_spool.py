@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Tests for lock retries and the ccnotify event spool."""
+
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import ccnotify
+import spool
+
+
+class SpoolCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        patcher = patch.object(ccnotify, "SCRIPT_DIR", self.dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            self.tracker = ccnotify.ClaudePromptTracker(db_path=os.path.join(self.dir, "ccnotify.db"))
+        self.tracker.environ = {"ITERM_SESSION_ID": "w1t0p0:MY-UUID", "HOME": "/home/me"}
+        self.conn = self.tracker._connect()
+        self.addCleanup(self.tracker.close)
+
+    def _handle(self, event_name, **data):
+        with patch("subprocess.run"):
+            ccnotify.handle_event(self.tracker, event_name, {"session_id": "s1", **data})
+
+    def _prompt(self, text):
+        self._handle("UserPromptSubmit", prompt=text, cwd="/work/repo-x")
+
+    def _jobs(self):
+        return self.tracker._connect().execute(
+            "SELECT prompt, stoped_at IS NOT NULL FROM prompt ORDER BY id"
+        ).fetchall()
+
+    def _locked(self):
+        """Hold the write lock from another connection; hooks give up almost at once."""
+        other = sqlite3.connect(self.tracker.db_path, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        self.addCleanup(other.close)
+        self.tracker.close()
+        for name, value in (("BUSY_TIMEOUT", 0.01), ("WRITE_BACKOFF", 0)):
+            patcher = patch.object(ccnotify, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return other
+
+
+class TestRetry(SpoolCase):
+    def test_lock_errors_are_retried(self):
+        calls = []
+
+        def flaky(tracker, data):
+            calls.append(data)
+            if len(calls) < ccnotify.WRITE_ATTEMPTS:
+                raise sqlite3.OperationalError("database is locked")
+
+        with patch.dict(ccnotify.EVENT_HANDLERS, {"Stop": flaky}), patch("time.sleep"):
+            attempts = ccnotify.dispatch(self.tracker, "Stop", {"session_id": "s1"})
+        self.assertEqual(attempts, ccnotify.WRITE_ATTEMPTS)
+
+    def test_other_errors_are_not_retried(self):
+        def broken(tracker, data):
+            raise sqlite3.OperationalError("no such table: prompt")
+
+        with patch.dict(ccnotify.EVENT_HANDLERS, {"Stop": broken}):
+            with self.assertRaises(sqlite3.OperationalError):
+                ccnotify.handle_event(self.tracker, "Stop", {"session_id": "s1"})
+        self.assertEqual(spool.pending(), [])
+
+    def test_writes_take_the_lock_up_front(self):
+        statements = []
+        self.conn.set_trace_callback(statements.append)
+        self._prompt("go")
+        self.conn.set_trace_callback(None)
+        self.assertEqual(statements[0], "BEGIN IMMEDIATE")
+
+
+class TestSpool(SpoolCase):
+    def test_locked_event_is_spooled_then_replayed_in_order(self):
+        self._prompt("first")
+        other = self._locked()
+        self._handle("Stop")
+        (path,) = spool.pending()
+        self.assertTrue(os.path.basename(path).endswith(".json"))
+
+        other.execute("COMMIT")
+        self._prompt("second")
+        self.assertEqual(spool.pending(), [])
+        # The spooled Stop closed the first job before the second prompt was recorded
+        self.assertEqual(self._jobs(), [("first", 1), ("second", 0)])
+
+    def test_new_events_queue_behind_the_spool(self):
+        self._prompt("first")
+        other = self._locked()
+        self._handle("Stop")
+        self._prompt("second")
+        self.assertEqual(len(spool.pending()), 2)
+
+        other.execute("COMMIT")
+        with patch("subprocess.run"):
+            self.assertEqual(spool.replay(self.tracker), 2)
+        self.assertEqual(self._jobs(), [("first", 1), ("second", 0)])
+
+    def test_replay_keeps_the_time_the_hook_fired(self):
+        self._prompt("first")
+        with self.conn:
+            self.conn.execute("UPDATE prompt SET created_at = datetime('now', '-300 seconds')")
+        spooled = spool.save("Stop", {"session_id": "s1"}, {})
+        with open(spooled) as f:
+            event = json.load(f)
+        event["spooled_at"] -= 240
+        with open(spooled, "w") as f:
+            json.dump(event, f)
+
+        # Replayed four minutes late, the job still took one minute
+        self.assertEqual(spool.replay(self.tracker), 1)
+        seconds, subtitle = self.conn.execute(
+            "SELECT seconds, subtitle FROM notification_outbox").fetchone()
+        self.assertAlmostEqual(seconds, 60, delta=2)
+        self.assertTrue(subtitle.startswith("job#1 done, duration: 1m"), subtitle)
+        self.assertIsNone(self.tracker.event_at)
+
+    def test_spool_keeps_only_forwarded_environment(self):
+        self._locked()
+        self._prompt("first")
+        with open(spool.pending()[0]) as f:
+            event = json.load(f)
+        self.assertEqual(event["env"], {"ITERM_SESSION_ID": "w1t0p0:MY-UUID"})
+        self.assertEqual(event["data"]["prompt"], "first")
+
+    def test_unreadable_files_are_quarantined(self):
+        spool.save("Stop", {"session_id": "s1"}, {})
+        with open(spool.pending()[0], "w") as f:
+            f.write("{torn")
+        self.assertEqual(spool.replay(self.tracker), 0)
+        self.assertEqual(spool.pending(), [])
+        (name,) = [n for n in os.listdir(ccnotify.spool_dir()) if n.endswith(".failed")]
+        self.assertTrue(name)
+
+
+if __name__ == "__main__":
+    unittest.main()
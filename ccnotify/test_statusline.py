@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Tests for the status line command and its per-session job cache."""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import ccnotify
+import statusline
+from test_ccnotify import _import_times
+
+# The jq/awk pipeline settings.json ran before `ccnotify.py statusline`
+OLD_COMMAND = r'''input=$(cat); cwd=$(echo "$input" | jq -r '.workspace.current_dir'); short_path=$(echo "$cwd" | awk -F/ '{n=NF; if(n<=3) print $0; else print "..." "/" $(n-2) "/" $(n-1) "/" $n}'); rem=$(echo "$input" | jq -r '.context_window.remaining_percentage // empty'); if [ -n "$rem" ]; then if [ "$rem" -lt 25 ]; then color='\033[38;5;196m'; elif [ "$rem" -lt 50 ]; then color='\033[38;5;214m'; else color='\033[38;5;242m'; fi; ctx=" ${color}${rem}%\033[0m"; else ctx=''; fi; printf '\033[1;38;5;039m√\033[0m \033[1;38;2;247;127;84m%s\033[0m%b' "$short_path" "$ctx"'''
+
+
+class StatusCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        patcher = patch.object(ccnotify, "SCRIPT_DIR", self.dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TestRender(StatusCase):
+    @unittest.skipUnless(shutil.which("jq") and shutil.which("awk"), "needs jq and awk")
+    def test_matches_the_old_pipeline(self):
+        cases = [
+            {"workspace": {"current_dir": "/Users/tom/qz/toocan-app/web"},
+             "context_window": {"remaining_percentage": 80}},
+            {"workspace": {"current_dir": "/Users/tom/app"}, "context_window": {"remaining_percentage": 40}},
+            {"workspace": {"current_dir": "/tmp"}, "context_window": {"remaining_percentage": 12}},
+            {"workspace": {"current_dir": "/a/b/c"}},
+        ]
+        for status in cases:
+            old = subprocess.run(["bash", "-c", OLD_COMMAND], input=json.dumps(status),
+                                 capture_output=True, text=True, check=True).stdout
+            self.assertEqual(statusline.render(status), old, status)
+
+    def test_job(self):
+        status = {"workspace": {"current_dir": "/w/app"}}
+        running = statusline.render(status, (3, 1000.0, None), now=1125.0)
+        self.assertTrue(running.endswith(f" {statusline.DIM}job#3 2m{statusline.RESET}"), repr(running))
+        done = statusline.render(status, (3, 1000.0, 1042.0), now=5000.0)
+        self.assertTrue(done.endswith(f" {statusline.DIM}job#3 done 42s{statusline.RESET}"), repr(done))
+
+
+class TestHooksKeepTheCache(StatusCase):
+    def test_prompt_and_stop(self):
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            tracker = ccnotify.ClaudePromptTracker()
+        tracker.environ = {}
+        self.addCleanup(tracker.close)
+        self.assertIsNone(statusline.load("s1"))
+
+        with patch("subprocess.run"):
+            tracker.handle_user_prompt_submit({"session_id": "s1", "prompt": "go", "cwd": "/w"})
+        seq, started, stopped = statusline.load("s1")
+        self.assertEqual((seq, stopped), (1, None))
+        self.assertAlmostEqual(started, time.time(), delta=2)
+
+        with tracker._write() as conn:
+            conn.execute("UPDATE prompt SET created_at = datetime('now', '-90 seconds')")
+        tracker.handle_stop({"session_id": "s1"})
+        seq, started, stopped = statusline.load("s1")
+        self.assertEqual(seq, 1)
+        self.assertAlmostEqual(stopped - started, 90, delta=1)
+
+    def test_unreadable_cache_is_ignored(self):
+        os.makedirs(os.path.join(self.dir, "status"))
+        with open(statusline.cache_path("s1"), "w") as f:
+            f.write("garbage")
+        self.assertIsNone(statusline.load("s1"))
+
+
+class TestCommand(unittest.TestCase):
+    def setUp(self):
+        # The cache lives next to the scripts, as it does in ~/.claude/ccnotify
+        self.sandbox = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.sandbox, ignore_errors=True)
+        for name in ("ccnotify.py", "statusline.py"):
+            shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), name), self.sandbox)
+        with patch.object(ccnotify, "SCRIPT_DIR", self.sandbox):
+            statusline.save("s1", 4, time.time() - 30)
+        self.stdin = json.dumps({"session_id": "s1", "workspace": {"current_dir": "/w/app"}})
+
+    def test_refresh_never_opens_the_database(self):
+        for args in (["statusline.py"], ["ccnotify.py", "statusline"]):
+            out = subprocess.run([sys.executable, *args], input=self.stdin, cwd=self.sandbox,
+                                 capture_output=True, text=True, check=True).stdout
+            self.assertRegex(out, r"job#4 (29|30|31)s")
+        self.assertFalse(os.path.exists(os.path.join(self.sandbox, "ccnotify.db")))
+
+    def test_imports_only_json(self):
+        baseline = set(_import_times(["-c", "import json"]))
+        times = _import_times([os.path.join(self.sandbox, "statusline.py")], stdin=self.stdin)
+        self.assertEqual(set(times) - baseline, {"ccnotify"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+"""Smoke test for the concurrent-writer stress harness."""
+
+import unittest
+
+import stress_ccnotify
+
+
+class TestStress(unittest.TestCase):
+    def test_small_run_loses_nothing(self):
+        report = stress_ccnotify.stress(writers=2, rounds=1)
+        self.assertEqual(report["hooks"], 6)
+        self.assertEqual(report["failed_hooks"], 0)
+        self.assertEqual(report["lost_events"], 0)
+        self.assertGreater(report["throughput_per_s"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Tests for the open-jobs dashboard."""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import ccnotify
+import durations
+import top
+import worktrees
+
+
+class TopCase(unittest.TestCase):
+    def setUp(self):
+        # Status-line caches and the spool go to a temp dir, never the source tree
+        state = patch.dict(os.environ, {"CCNOTIFY_STATE_DIR": tempfile.mkdtemp()})
+        state.start()
+        self.addCleanup(state.stop)
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            self.tracker = ccnotify.ClaudePromptTracker(storage=ccnotify.Storage.in_memory())
+        self.tracker.environ = {}
+        self.addCleanup(self.tracker.close)
+        self.conn = self.tracker._connect()
+
+    def _prompt(self, session_id, text, cwd="/work/repo-x"):
+        with patch("subprocess.run"):
+            self.tracker.handle_user_prompt_submit({"session_id": session_id, "prompt": text, "cwd": cwd})
+
+    def _stop(self, session_id):
+        self.tracker.handle_stop({"session_id": session_id})
+
+    def _open(self, dashboard):
+        return {job.session_id: (job.seq, job.prompt, job.waiting_since is not None)
+                for job in dashboard.poll()}
+
+
+class TestDashboard(TopCase):
+    def test_tracks_prompts_stops_and_waits(self):
+        self._prompt("s1", "first")
+        self._stop("s1")
+        self._prompt("s2", "build it")
+        dashboard = top.Dashboard(self.conn)
+        self.assertEqual(self._open(dashboard), {"s2": (1, "build it", False)})
+
+        self._prompt("s1", "second")
+        self.tracker.handle_notification({"session_id": "s2", "message": "Claude is waiting for your input"})
+        self.assertEqual(self._open(dashboard), {"s1": (2, "second", False), "s2": (1, "build it", True)})
+
+        self._stop("s2")
+        self.assertEqual(self._open(dashboard), {"s1": (2, "second", False)})
+
+    def test_ticks_never_rescan_prompt(self):
+        for i in range(5):
+            self._prompt(f"s{i}", "go")
+        dashboard = top.Dashboard(self.conn)
+        statements = []
+        self.conn.set_trace_callback(statements.append)
+        try:
+            dashboard.poll()
+        finally:
+            self.conn.set_trace_callback(None)
+        plans = []
+        for sql in statements:
+            plans.extend(detail for *_, detail in self.conn.execute("EXPLAIN QUERY PLAN " + sql))
+        self.assertTrue(plans)
+        self.assertFalse([plan for plan in plans if plan.startswith("SCAN prompt")], plans)
+
+    def test_archived_jobs_drop_out(self):
+        self._prompt("s1", "go")
+        dashboard = top.Dashboard(self.conn)
+        with self.conn:
+            self.conn.execute("DELETE FROM prompt")
+        self.assertEqual(dashboard.poll(), [])
+
+
+class TestRender(TopCase):
+    def test_columns(self):
+        registry = worktrees.Registry(self.conn, os.path.join(tempfile.mkdtemp(), "registry.json"))
+        registry.register("repo-x", "feature/auth", "feature-auth", "/wt/repo-x/feature-auth",
+                          "/src/repo-x", [8100])
+        self._prompt("s1", "add\nOAuth", cwd="/wt/repo-x/feature-auth/api")
+        self._prompt("s2", "other")
+        with self.conn:
+            self.conn.execute("UPDATE prompt SET created_at = '2024-03-10 09:00:00'")
+            self.conn.execute("UPDATE prompt SET lastWaitUserAt = '2024-03-10 09:02:00' WHERE session_id = 's2'")
+        dashboard = top.Dashboard(self.conn)
+        now = top._epoch("2024-03-10 09:05:30")
+        lines = top.render(dashboard.poll(), dashboard.worktrees(), now=now, width=200).splitlines()
+        self.assertTrue(lines[0].startswith("2 open job(s)"))
+        waiting, running = lines[3].split(), lines[4].split()
+        self.assertEqual(waiting, ["repo-x", "-", "#1", "5m", "3m", "other"])
+        self.assertEqual(running, ["api", "feature/auth", "#1", "5m", "add", "OAuth"])
+
+    def test_eta_from_the_project_sketch(self):
+        sketch = durations.Sketch()
+        for seconds in range(60, 660, 20):
+            sketch.add(seconds)
+        with self.conn:
+            durations._save(self.conn, "project", "repo-x", sketch)
+        self._prompt("s1", "go")
+        self._prompt("s2", "wait")
+        with self.conn:
+            self.conn.execute("UPDATE prompt SET created_at = '2024-03-10 09:00:00'")
+            self.conn.execute("UPDATE prompt SET lastWaitUserAt = '2024-03-10 09:01:00' WHERE session_id = 's2'")
+        dashboard = top.Dashboard(self.conn)
+        jobs = dashboard.poll()
+        lines = top.render(jobs, [], now=top._epoch("2024-03-10 09:06:40"), width=200,
+                           sketches=dashboard.sketches(jobs)).splitlines()
+        self.assertEqual(lines[3].split(), ["repo-x", "-", "#1", "6m", "5m", "wait"])
+        self.assertEqual(lines[4].split(), ["repo-x", "-", "#1", "6m", "~1m", "go"])
+
+    def test_worktrees_from_the_registry_shard(self):
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            shard = ccnotify.ClaudePromptTracker(storage=ccnotify.Storage.in_memory())
+        self.addCleanup(shard.close)
+        registry = worktrees.Registry(shard._connect(), os.path.join(tempfile.mkdtemp(), "registry.json"))
+        registry.register("repo-x", "feature/auth", "feature-auth", "/wt/repo-x/feature-auth",
+                          "/src/repo-x", [8100])
+        self.assertEqual(top.Dashboard(self.conn).worktrees(), [])
+        self.assertEqual(top.Dashboard(self.conn, shard._connect()).worktrees(),
+                         [("/wt/repo-x/feature-auth", "feature/auth")])
+
+
+if __name__ == "__main__":
+    unittest.main()
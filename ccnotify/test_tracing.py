@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Tests for opt-in span tracing and the profile report."""
+
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import ccnotify
+import focus
+import tracing
+
+
+class TracingCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        for name, value in (("SCRIPT_DIR", self.dir), ("TRACING", True)):
+            patcher = patch.object(ccnotify, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            self.tracker = ccnotify.ClaudePromptTracker()
+        self.tracker.environ = {}
+        self.tracker.tty_path = None
+        self.addCleanup(self.tracker.close)
+        self.conn = self.tracker._connect()
+
+    def _spans(self):
+        return self.conn.execute(
+            "SELECT span_id, parent_id, name FROM trace_span ORDER BY trace_id, span_id"
+        ).fetchall()
+
+
+class TestSpans(TracingCase):
+    def test_off_is_a_shared_no_op(self):
+        with patch.object(ccnotify, "TRACING", False):
+            self.assertIs(ccnotify.span("db"), ccnotify._NO_SPAN)
+            with patch("subprocess.run"):
+                ccnotify.handle_event(self.tracker, "Stop", {"session_id": "s1"})
+        self.assertEqual(self._spans(), [])
+
+    def test_invocation_is_saved_as_a_tree(self):
+        with patch("subprocess.run"), ccnotify.span("hook:UserPromptSubmit"):
+            with ccnotify.span("handle"):
+                ccnotify.handle_event(self.tracker, "UserPromptSubmit",
+                                      {"session_id": "s1", "prompt": "go", "cwd": "/w"})
+        self.assertEqual(self._spans(), [(1, None, "hook:UserPromptSubmit"), (2, 1, "handle"),
+                                         (3, 2, "db")])
+        (duration_us, start_us), = self.conn.execute(
+            "SELECT duration_us, start_us FROM trace_span WHERE name = 'db'").fetchall()
+        self.assertGreater(duration_us, 0)
+        self.assertGreaterEqual(start_us, 0)
+
+    def test_notification_stages(self):
+        self.tracker.focus = focus.FakeFocusProvider("ME")
+        self.tracker.environ = {"ITERM_SESSION_ID": "w0t0p0:ME"}
+        with patch("subprocess.Popen"), patch("time.sleep"), ccnotify.span("deliver"):
+            self.tracker.send_notification("repo-x", "job#1 done")
+        self.assertEqual([name for _, _, name in self._spans()],
+                         ["deliver", "focus_check", "afplay", "flash_bg"])
+
+    def test_errors_are_recorded(self):
+        with self.assertRaises(KeyError), ccnotify.span("hook:Stop"):
+            raise KeyError("boom")
+        self.assertEqual(self.conn.execute("SELECT attrs FROM trace_span").fetchone(),
+                         ('{"error": "KeyError"}',))
+
+
+def _trace(root_us, children):
+    spans = [(1, None, "hook:Stop", 1700000000.0, root_us, None)]
+    for i, (name, us) in enumerate(children, start=2):
+        spans.append((i, 1, name, 1700000000.0, us, None))
+    return spans
+
+
+class TestProfile(TracingCase):
+    def test_fold_computes_self_time(self):
+        tree = tracing.fold({
+            "a": _trace(1000, [("db", 300), ("afplay", 600)]),
+            "b": _trace(500, [("db", 400)]),
+        })
+        self.assertEqual(tree[("hook:Stop",)], [2, 1500, 200])
+        self.assertEqual(tree[("hook:Stop", "db")], [2, 700, 700])
+        self.assertEqual(tree[("hook:Stop", "afplay")], [1, 600, 600])
+
+    def test_slowest_lists_the_longest_stages(self):
+        (root, children), = tracing.slowest({
+            "a": _trace(1000, [("db", 300), ("afplay", 600)]),
+            "b": _trace(500, [("db", 400)]),
+        }, limit=1)
+        self.assertEqual(root[4], 1000)
+        self.assertEqual([child[2] for child in children], ["afplay", "db"])
+
+    def test_report_and_folded_output(self):
+        for _ in range(2):
+            with ccnotify.span("hook:Stop"), ccnotify.span("db"):
+                pass
+        with patch("sys.stdout", new_callable=io.StringIO) as out:
+            tracing.main(["--hook", "hook:Stop"])
+        self.assertIn("hook:Stop", out.getvalue())
+        self.assertRegex(out.getvalue(), r" 2    db  █")
+        self.assertIn("Slowest of 2 invocation(s)", out.getvalue())
+
+        with patch("sys.stdout", new_callable=io.StringIO) as out:
+            tracing.main(["--folded"])
+        self.assertEqual([line.split(" ")[0] for line in out.getvalue().splitlines()],
+                         ["hook:Stop", "hook:Stop;db"])
+
+        with patch("sys.stderr", new_callable=io.StringIO):
+            tracing.main(["--clear"])
+        self.assertEqual(self._spans(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Tests for the ccnotify transcript index."""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import ccnotify
+import search
+import transcripts
+
+
+def _user(text, at="2024-03-10T12:00:00.000Z", cwd="/work/toocan-app", **extra):
+    return {"type": "user", "timestamp": at, "cwd": cwd,
+            "message": {"role": "user", "content": text}, **extra}
+
+
+def _assistant(blocks, at="2024-03-10T12:00:05.000Z"):
+    return {"type": "assistant", "timestamp": at, "message": {"role": "assistant", "content": blocks}}
+
+
+class TranscriptCase(unittest.TestCase):
+    def setUp(self):
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            self.tracker = ccnotify.ClaudePromptTracker(
+                db_path=os.path.join(tempfile.mkdtemp(), "ccnotify.db")
+            )
+        self.tracker.environ = {}
+        self.conn = self.tracker._connect()
+        self.root = tempfile.mkdtemp()
+        self.indexer = transcripts.TranscriptIndexer(self.conn, self.root)
+
+    def tearDown(self):
+        self.tracker.close()
+
+    def _path(self, session_id, project="-work-toocan-app"):
+        os.makedirs(os.path.join(self.root, project), exist_ok=True)
+        return os.path.join(self.root, project, f"{session_id}.jsonl")
+
+    def _append(self, session_id, *entries, raw=""):
+        with open(self._path(session_id), "a") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in entries)
+            f.write(raw)
+
+    def _sessions(self, **filters):
+        return [r["session"] for r in transcripts.deep_search(self.conn, **filters)]
+
+
+class TestIndexer(TranscriptCase):
+    def test_session_metadata(self):
+        self._append("s1",
+                     {"type": "summary", "summary": "x"},
+                     _user("<command-name>/clear</command-name>", isMeta=True),
+                     _user("Fix the auth redirect"),
+                     _assistant([{"type": "text", "text": "On it"}], at="2024-03-10T12:30:00Z"))
+        self.indexer.update()
+        (result,) = transcripts.deep_search(self.conn, keyword="redirect")
+        self.assertEqual(result["first_msg"], "Fix the auth redirect")
+        self.assertEqual(result["cwd"], "/work/toocan-app")
+        self.assertEqual(result["project"], "toocan-app")
+        self.assertEqual(result["source"], "deep")
+        row = self.conn.execute(
+            "SELECT first_at, last_at, lines FROM transcript_session WHERE session_id = 's1'"
+        ).fetchone()
+        self.assertEqual(row, ("2024-03-10 12:00:00", "2024-03-10 12:30:00", 4))
+
+    def test_only_appended_lines_are_read(self):
+        self._append("s1", _user("first websocket question"))
+        self.assertEqual(self.indexer.update(), (1, 1))
+        self.assertEqual(self.indexer.update(), (0, 0))
+
+        self._append("s1", _assistant([{"type": "tool_use", "name": "Grep",
+                                         "input": {"pattern": "reconnect"}}]))
+        self.assertEqual(self.indexer.update(), (1, 1))
+        self.assertEqual(self._sessions(keyword="reconnect"), ["s1"])
+        self.assertEqual(self._sessions(keyword="websocket"), ["s1"])
+
+    def test_partial_line_waits_for_its_newline(self):
+        line = json.dumps(_user("halfway there"))
+        self._append("s1", _user("start"), raw=line[:20])
+        self.assertEqual(self.indexer.update(), (1, 1))
+        self.assertEqual(self._sessions(keyword="halfway"), [])
+
+        self._append("s1", raw=line[20:] + "\n")
+        self.assertEqual(self.indexer.update(), (1, 1))
+        self.assertEqual(self._sessions(keyword="halfway"), ["s1"])
+
+    def test_truncated_file_is_reindexed(self):
+        self._append("s1", _user("alpha"), _user("beta"))
+        self.indexer.update()
+        os.truncate(self._path("s1"), 0)
+        self._append("s1", _user("gamma"))
+        self.indexer.update()
+        self.assertEqual(self._sessions(keyword="alpha"), [])
+        self.assertEqual(self._sessions(keyword="gamma"), ["s1"])
+
+    def test_tool_results_are_not_indexed(self):
+        self._append("s1", _user([{"type": "tool_result", "content": "secretword"}]))
+        self.indexer.update()
+        self.assertEqual(self._sessions(keyword="secretword"), [])
+
+    def test_rebuild(self):
+        self._append("s1", _user("alpha"))
+        self.indexer.update()
+        self.assertEqual(self.indexer.rebuild(), (1, 1))
+        self.assertEqual(self._sessions(keyword="alpha"), ["s1"])
+
+
+class TestDeepSearch(TranscriptCase):
+    def test_returns_every_matching_session(self):
+        for i in range(25):
+            self._append(f"s{i:02d}", _user("deploy", at=f"2024-03-10T12:{i:02d}:00Z"))
+        self.indexer.update()
+        self.assertEqual(self._sessions(keyword="deploy"), [f"s{i:02d}" for i in range(25)])
+
+    def test_filters(self):
+        self._append("a", _user("deploy", at="2024-03-09T12:00:00Z"))
+        self._append("b", _user("deploy", at="2024-03-11T12:00:00Z", cwd="/work/infra"))
+        self._append("c", _user("deploy", at="2024-03-11T12:00:00Z"))
+        self.indexer.update()
+        self.assertEqual(self._sessions(keyword="deploy", start="2024-03-11"), ["b", "c"])
+        self.assertEqual(self._sessions(keyword="deploy", project="TOOCAN"), ["a", "c"])
+        self.assertEqual(self._sessions(keyword="!!"), [])
+
+    def test_words_in_different_chunks(self):
+        with patch.object(transcripts, "CHUNK_CHARS", 10):
+            self._append("s1", _user("websocket reconnect"), _user("flaky deploy"))
+            self._append("s2", _user("websocket"))
+            self.indexer.update()
+        self.assertGreater(self.conn.execute(
+            "SELECT COUNT(*) FROM transcript_chunk WHERE session_id = 's1'").fetchone()[0], 1)
+        self.assertEqual(self._sessions(keyword="websocket deploy"), ["s1"])
+        self.assertEqual(self._sessions(keyword="websocket missing"), [])
+
+    def test_merge_with_prompt_search(self):
+        self._append("s1", _user("deploy", at="2024-03-10T12:00:00Z"))
+        self._append("s2", _user("deploy", at="2024-03-10T11:00:00Z"))
+        self.indexer.update()
+        deep = transcripts.deep_search(self.conn, keyword="deploy")
+        prompt_hits = [dict(deep[1], source=None)]
+        merged = search.merge_deep(prompt_hits, deep, "time")
+        self.assertEqual([(r["session"], r["source"]) for r in merged],
+                         [("s2", "deep"), ("s1", None)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Tests for the worktree registry and port allocator."""
+
+import json
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import bench_ccnotify
+import ccnotify
+import worktrees
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       "skills", "worktree-manager", "scripts")
+
+
+class RegistryCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.dir, "ccnotify.db")
+        self.path = os.path.join(self.dir, "worktree-registry.json")
+        self.busy = set()
+        self.registry = self._registry()
+
+    def _registry(self, start=8100, end=8109):
+        with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+            tracker = ccnotify.ClaudePromptTracker(db_path=self.db_path)
+        self.addCleanup(tracker.close)
+        return worktrees.Registry(tracker._connect(), self.path, start, end,
+                                  probe=lambda port: port not in self.busy)
+
+    def _json(self):
+        with open(self.path) as f:
+            return json.load(f)
+
+
+class TestFreePorts(unittest.TestCase):
+    def test_lowest_first(self):
+        self.assertEqual(list(worktrees.free_ports(8100, 8106, [8101, 8104, 8105, 8200])),
+                         [8100, 8102, 8103, 8106])
+
+    def test_empty_pool(self):
+        self.assertEqual(list(worktrees.free_ports(8100, 8101, [8100, 8101])), [])
+
+
+class TestAllocate(RegistryCase):
+    def test_allocates_lowest_free_and_writes_json(self):
+        self.assertEqual(self.registry.allocate(2), [8100, 8101])
+        self.assertEqual(self.registry.allocate(2), [8102, 8103])
+        self.assertEqual(self._json()["portPool"], {"start": 8100, "end": 8109,
+                                                    "allocated": [8100, 8101, 8102, 8103]})
+
+    def test_ports_in_use_are_skipped(self):
+        self.busy = {8100, 8102}
+        self.assertEqual(self.registry.allocate(2), [8101, 8103])
+
+    def test_exhausted_pool_allocates_nothing(self):
+        self.registry.allocate(8)
+        with self.assertRaises(worktrees.PoolExhausted):
+            self.registry.allocate(3)
+        self.assertEqual(len(self._json()["portPool"]["allocated"]), 8)
+
+    def test_concurrent_allocations_never_overlap(self):
+        results = []
+
+        def allocate():
+            with patch.object(ccnotify.ClaudePromptTracker, "_setup_logging"):
+                tracker = ccnotify.ClaudePromptTracker(db_path=self.db_path)
+            try:
+                registry = worktrees.Registry(tracker._connect(), self.path, 8100, 8199,
+                                              probe=lambda port: True)
+                results.extend(registry.allocate(2))
+            finally:
+                tracker.close()
+
+        threads = [threading.Thread(target=allocate) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), list(range(8100, 8116)))
+
+    def test_real_bind_probe(self):
+        with socket.socket() as listener:
+            listener.bind(("127.0.0.1", 0))
+            listener.listen(1)
+            port = listener.getsockname()[1]
+            self.assertFalse(worktrees.port_free(port))
+        self.assertTrue(worktrees.port_free(port))
+
+
+class TestRegister(RegistryCase):
+    def test_register_and_replace(self):
+        ports = self.registry.allocate(2)
+        self.assertIsNone(self.registry.register("app", "feature/auth", "feature-auth",
+                                                 "/wt/app/feature-auth", "/src/app", ports, "OAuth"))
+        (entry,) = self._json()["worktrees"]
+        self.assertEqual({k: entry[k] for k in ("project", "branch", "ports", "task", "status",
+                                                "prNumber")},
+                         {"project": "app", "branch": "feature/auth", "ports": [8100, 8101],
+                          "task": "OAuth", "status": "active", "prNumber": None})
+
+        new_ports = self.registry.allocate(2)
+        released = self.registry.register("app", "feature/auth", "feature-auth",
+                                          "/wt/app/feature-auth", "/src/app", new_ports)
+        self.assertEqual(released, [8100, 8101])
+        data = self._json()
+        self.assertEqual([w["ports"] for w in data["worktrees"]], [[8102, 8103]])
+        self.assertEqual(data["portPool"]["allocated"], [8102, 8103])
+
+    def test_external_json_edits_are_imported(self):
+        ports = self.registry.allocate(2)
+        self.registry.register("app", "fix", "fix", "/wt/app/fix", "/src/app", ports)
+        # What cleanup.sh does with jq: drop the entry and free its ports
+        data = self._json()
+        data["worktrees"] = []
+        data["portPool"]["allocated"] = []
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(self.path + ".tmp", self.path)
+
+        self.assertEqual(self.registry.allocate(1), [8100])
+        self.assertEqual(self._json()["worktrees"], [])
+
+    def test_release(self):
+        self.registry.allocate(3)
+        self.assertEqual(self.registry.release([8101, 8150]), [8101])
+        self.assertEqual(self.registry.allocate(1), [8101])
+
+
+class TestWrappers(unittest.TestCase):
+    def test_shell_scripts_drive_the_registry(self):
+        sandbox = bench_ccnotify.make_sandbox()
+        self.addCleanup(shutil.rmtree, sandbox, ignore_errors=True)
+        registry = os.path.join(sandbox, "worktree-registry.json")
+        env = dict(bench_ccnotify.hook_env(sandbox), CCNOTIFY=os.path.join(sandbox, "ccnotify.py"),
+                   WORKTREE_REGISTRY=registry)
+
+        def run(script, *args):
+            return subprocess.run([os.path.join(SCRIPTS, script), *args], env=env,
+                                  capture_output=True, text=True, check=True).stdout
+
+        ports = run("allocate-ports.sh", "2").split()
+        self.assertEqual(len(ports), 2)
+        out = run("register.sh", "app", "feature/x", "feature-x", "~/wt/app/feature-x", "/src/app",
+                  ",".join(ports), "Do the thing")
+        self.assertIn("Registered worktree", out)
+        self.assertEqual(run("release-ports.sh", *ports).strip(), f"Released ports: {' '.join(ports)}")
+        with open(registry) as f:
+            data = json.load(f)
+        self.assertEqual(data["portPool"]["allocated"], [])
+        self.assertEqual(data["worktrees"][0]["worktreePath"], os.path.join(env["HOME"], "wt/app/feature-x"))
+
+    def test_project_shards_share_one_registry(self):
+        sandbox = bench_ccnotify.make_sandbox()
+        self.addCleanup(shutil.rmtree, sandbox, ignore_errors=True)
+        env = dict(bench_ccnotify.hook_env(sandbox), CCNOTIFY=os.path.join(sandbox, "ccnotify.py"),
+                   CCNOTIFY_DB=os.path.join(sandbox, "{project}.db"),
+                   WORKTREE_REGISTRY=os.path.join(sandbox, "worktree-registry.json"))
+        ports = []
+        for repo in ("repo-a", "repo-b"):
+            os.makedirs(os.path.join(sandbox, repo))
+            ports += subprocess.run([os.path.join(SCRIPTS, "allocate-ports.sh"), "1"], env=env,
+                                    cwd=os.path.join(sandbox, repo), capture_output=True,
+                                    text=True, check=True).stdout.split()
+        self.assertEqual(len(set(ports)), 2)
+        self.assertTrue(os.path.exists(os.path.join(sandbox, f"{worktrees.REGISTRY_SHARD}.db")))
+        self.assertFalse(os.path.exists(os.path.join(sandbox, "repo-a.db")))
+
+
+if __name__ == "__main__":
+    unittest.main()
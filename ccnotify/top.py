@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Live dashboard of every session with an open job.
+
+One row per session whose latest job hasn't stopped: project, the worktree it
+runs in (from the worktree-manager registry), job number, elapsed time, how
+long the agent has been waiting on you, and an estimate of the time left from
+the project's duration sketch (see durations.py). It refreshes every second without
+rescanning prompt. The open jobs are read once from the partial index on
+stoped_at IS NULL. After that, each tick reads only rows past the last-seen id
+and re-reads the tracked jobs by primary key.
+
+Usage: ccnotify.py top [--interval SECONDS] [--once]
+"""
+
+import argparse
+import calendar
+import shutil
+import sys
+import time
+from typing import NamedTuple
+
+import ccnotify
+import durations
+import rollups
+import worktrees
+
+_COLUMNS = "id, session_id, seq, created_at, cwd, prompt, stoped_at, lastWaitUserAt"
+
+
+class Job(NamedTuple):
+    id: int
+    session_id: str
+    seq: int
+    created_at: str
+    cwd: str
+    prompt: str
+    waiting_since: str = None
+
+
+def _epoch(at):
+    return calendar.timegm(time.strptime(at, "%Y-%m-%d %H:%M:%S"))
+
+
+class Dashboard:
+    """Open jobs by session, kept current from a rowid cursor."""
+
+    def __init__(self, conn, registry=None):
+        self.conn = conn
+        # The worktree registry's connection: its own shard under a per-project CCNOTIFY_DB
+        self.registry = registry or conn
+        self.jobs = {}
+        self.cursor = conn.execute("SELECT COALESCE(MAX(id), 0) FROM prompt").fetchone()[0]
+        for row in conn.execute(
+            f"SELECT {_COLUMNS} FROM prompt WHERE stoped_at IS NULL ORDER BY created_at, id"
+        ):
+            self._apply(row)
+
+    def _apply(self, row):
+        row_id, session_id, seq, created_at, cwd, prompt, stoped_at, waiting_since = row
+        current = self.jobs.get(session_id)
+        if stoped_at is None:
+            if current is None or (created_at, row_id) >= (current.created_at, current.id):
+                self.jobs[session_id] = Job(row_id, session_id, seq or 1, created_at, cwd or "",
+                                            prompt or "", waiting_since)
+        elif current is not None and current.id == row_id:
+            del self.jobs[session_id]
+
+    def poll(self):
+        """Pick up new prompts and changes to the tracked ones; returns the open jobs."""
+        for row in self.conn.execute(
+            f"SELECT {_COLUMNS} FROM prompt WHERE id > ? ORDER BY id", (self.cursor,)
+        ):
+            self.cursor = row[0]
+            self._apply(row)
+
+        tracked = {job.id: job for job in self.jobs.values()}
+        if tracked:
+            seen = set()
+            for row_id, stoped_at, waiting_since in self.conn.execute(
+                f"""SELECT id, stoped_at, lastWaitUserAt FROM prompt
+                    WHERE id IN ({", ".join("?" * len(tracked))})""",
+                list(tracked),
+            ):
+                seen.add(row_id)
+                job = tracked[row_id]
+                if stoped_at is not None:
+                    del self.jobs[job.session_id]
+                elif waiting_since != job.waiting_since:
+                    self.jobs[job.session_id] = job._replace(waiting_since=waiting_since)
+            # Rows that vanished were archived or deleted
+            for row_id in tracked.keys() - seen:
+                self.jobs.pop(tracked[row_id].session_id, None)
+        return list(self.jobs.values())
+
+    def worktrees(self):
+        """[(worktree_path, branch)] from the worktree-manager registry, longest path first."""
+        rows = self.registry.execute(
+            "SELECT worktree_path, branch FROM worktree WHERE worktree_path IS NOT NULL"
+        ).fetchall()
+        return sorted(rows, key=lambda row: -len(row[0]))
+
+    def sketches(self, jobs):
+        """{project: duration Sketch} for the projects with an open job."""
+        groups = sorted({ccnotify.notification_group(job.cwd) for job in jobs})
+        if not groups:
+            return {}
+        return {key: durations.Sketch.decode(blob) for key, blob in self.conn.execute(
+            f"""SELECT key, sketch FROM duration_sketch
+                WHERE scope = 'project' AND key IN ({", ".join("?" * len(groups))})""",
+            groups,
+        )}
+
+
+def _worktree(cwd, worktrees):
+    for path, branch in worktrees:
+        if cwd == path or cwd.startswith(path.rstrip("/") + "/"):
+            return branch
+    return "-"
+
+
+def render(jobs, worktrees, now=None, width=100, sketches=None):
+    """The dashboard as text: sessions waiting on you first, then the longest running."""
+    now = time.time() if now is None else now
+    sketches = sketches or {}
+
+    def order(job):
+        return (job.waiting_since is None, job.created_at)
+
+    lines = [f"{len(jobs)} open job(s)  {time.strftime('%H:%M:%S', time.localtime(now))}", ""]
+    header = (f"{'PROJECT':<18} {'WORKTREE':<22} {'JOB':>5} {'ELAPSED':>8} {'WAITING':>8} "
+              f"{'ETA':>7}  PROMPT")
+    lines.append(header[:width])
+    for job in sorted(jobs, key=order):
+        seconds = max(0, now - _epoch(job.created_at))
+        group = ccnotify.notification_group(job.cwd)
+        waiting = (rollups.format_seconds(max(0, now - _epoch(job.waiting_since)))
+                   if job.waiting_since else "")
+        # A job waiting on you has no time left to estimate
+        left = None if job.waiting_since or group not in sketches else sketches[group].remaining(seconds)
+        eta = "" if left is None else "~" + rollups.format_seconds(left)
+        prompt = " ".join(job.prompt.split())
+        line = (f"{group[:18]:<18} {_worktree(job.cwd, worktrees)[:22]:<22} {'#' + str(job.seq):>5} "
+                f"{rollups.format_seconds(seconds):>8} {waiting:>8} {eta:>7}  {prompt}")
+        lines.append(line[:width])
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ccnotify.py top",
+                                     description="Live view of sessions with an open job.")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between refreshes")
+    parser.add_argument("--once", action="store_true", help="print one snapshot and exit")
+    args = parser.parse_args(argv)
+
+    tracker = ccnotify.ClaudePromptTracker()
+    storage = ccnotify.Storage.from_env(project=worktrees.REGISTRY_SHARD)
+    registry = (tracker if storage.target == tracker.storage.target
+                else ccnotify.ClaudePromptTracker(storage=storage))
+    try:
+        dashboard = Dashboard(tracker._connect(), registry._connect())
+        while True:
+            width = shutil.get_terminal_size().columns
+            jobs = dashboard.poll()
+            screen = render(jobs, dashboard.worktrees(), width=width, sketches=dashboard.sketches(jobs))
+            if args.once:
+                sys.stdout.write(screen)
+                return
+            # Home the cursor and clear, so each frame replaces the last
+            sys.stdout.write("\033[H\033[2J" + screen)
+            sys.stdout.flush()
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        tracker.close()
+        registry.close()
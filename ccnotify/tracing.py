@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Opt-in tracing of where a ccnotify hook spends its time.
+
+With CCNOTIFY_TRACE=1 in the hook's environment, ccnotify.span() times each
+stage of main() and the handlers (reading input, forwarding to the daemon,
+database transactions, the focus check, afplay, the tty flash,
+terminal-notifier) as nested spans on the monotonic clock. When the outermost
+span of an invocation ends, its spans are written to the trace_span table in
+one transaction. Without the variable, ccnotify.span() returns a shared no-op
+and this module is never imported.
+
+`profile` folds the spans into a call tree (count, mean, share of total time
+and self time per stage) and lists the slowest invocations. --folded prints
+"a;b;c <microseconds>" lines for flamegraph.pl or speedscope instead.
+
+Usage: ccnotify.py profile [--since 24h] [--hook NAME] [--slowest N] [--folded] [--clear]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import ccnotify
+
+BAR_WIDTH = 30
+
+# Open spans of the trace in progress, innermost last. One trace at a time per
+# process: hooks handle one event, the daemon one request on its worker thread.
+_stack = []
+_finished = []
+
+
+class Span:
+    __slots__ = ("name", "attrs", "trace_id", "span_id", "parent_id", "started_at",
+                 "start_ns", "duration_ns")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        if _stack:
+            root = _stack[0]
+            self.trace_id = root.trace_id
+            self.parent_id = _stack[-1].span_id
+            self.span_id = len(_finished) + len(_stack) + 1
+        else:
+            self.trace_id = os.urandom(8).hex()
+            self.parent_id = None
+            self.span_id = 1
+        # Only the root's wall-clock time is kept; offsets come from the monotonic clock
+        self.started_at = time.time()
+        self.start_ns = time.perf_counter_ns()
+        _stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_ns = time.perf_counter_ns() - self.start_ns
+        _stack.pop()
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        _finished.append(self)
+        if not _stack:
+            spans = list(_finished)
+            _finished.clear()
+            _save(spans)
+        return False
+
+
+def span(name, **attrs):
+    return Span(name, attrs)
+
+
+def _save(spans):
+    root = spans[-1]
+    rows = [
+        (s.trace_id, s.span_id, s.parent_id, s.name,
+         root.started_at + (s.start_ns - root.start_ns) / 1e9,
+         (s.start_ns - root.start_ns) // 1000, s.duration_ns // 1000,
+         json.dumps(s.attrs) if s.attrs else None)
+        for s in spans
+    ]
+    tracker = ccnotify.ClaudePromptTracker()
+    try:
+        conn = tracker._connect()
+        with conn:
+            conn.executemany(
+                """INSERT INTO trace_span (trace_id, span_id, parent_id, name, started_at,
+                                           start_us, duration_us, attrs)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                rows,
+            )
+    except Exception as e:
+        ccnotify.log.warning("trace_save_failed", error=str(e))
+    finally:
+        tracker.close()
+
+
+def load(conn, since=None, hook=None):
+    """{trace_id: [(span_id, parent_id, name, started_at, duration_us, attrs), ...]}"""
+    where, params = ["r.parent_id IS NULL"], []
+    if since is not None:
+        where.append("r.started_at >= ?")
+        params.append(since)
+    if hook:
+        where.append("r.name = ?")
+        params.append(hook)
+    traces = {}
+    for trace_id, *row in conn.execute(
+        f"""SELECT s.trace_id, s.span_id, s.parent_id, s.name, s.started_at, s.duration_us, s.attrs
+            FROM trace_span AS r JOIN trace_span AS s ON s.trace_id = r.trace_id
+            WHERE {" AND ".join(where)}
+            ORDER BY s.trace_id, s.span_id""",
+        params,
+    ):
+        traces.setdefault(trace_id, []).append(tuple(row))
+    return traces
+
+
+def fold(traces):
+    """{path tuple: [calls, total_us, self_us]} over every span of every trace."""
+    tree = {}
+    for spans in traces.values():
+        paths, child_us = {}, {}
+        for span_id, parent_id, name, _, duration_us, _ in spans:
+            paths[span_id] = paths.get(parent_id, ()) + (name,)
+            child_us[parent_id] = child_us.get(parent_id, 0) + duration_us
+        for span_id, _, _, _, duration_us, _ in spans:
+            node = tree.setdefault(paths[span_id], [0, 0, 0])
+            node[0] += 1
+            node[1] += duration_us
+            node[2] += max(0, duration_us - child_us.get(span_id, 0))
+    return tree
+
+
+def slowest(traces, limit):
+    """The `limit` longest invocations: (root span, its children longest first)."""
+    roots = []
+    for spans in traces.values():
+        root = next(s for s in spans if s[1] is None)
+        children = sorted((s for s in spans if s[1] == root[0]), key=lambda s: -s[4])
+        roots.append((root, children))
+    roots.sort(key=lambda entry: -entry[0][4])
+    return roots[:limit]
+
+
+def _ms(us):
+    return f"{us / 1000:.1f}ms"
+
+
+def print_tree(tree, out=None):
+    out = out or sys.stdout
+    roots_total = sum(total for path, (_, total, _) in tree.items() if len(path) == 1) or 1
+    out.write(f"{'share':>6} {'self':>6} {'mean':>9} {'calls':>6}  span\n")
+
+    def walk(prefix):
+        children = [path for path in tree if len(path) == len(prefix) + 1 and path[:-1] == prefix]
+        for path in sorted(children, key=lambda p: -tree[p][1]):
+            calls, total, own = tree[path]
+            bar = "█" * max(1, round(BAR_WIDTH * total / roots_total))
+            out.write(f"{total / roots_total:>6.1%} {own / roots_total:>6.1%} "
+                      f"{_ms(total / calls):>9} {calls:>6}  {'  ' * len(prefix)}{path[-1]}  {bar}\n")
+            walk(path)
+
+    walk(())
+
+
+def main(argv=None):
+    import eventlog
+
+    parser = argparse.ArgumentParser(prog="ccnotify.py profile",
+                                     description="Summarize spans recorded with CCNOTIFY_TRACE=1.")
+    parser.add_argument("--since", type=eventlog.parse_time, help="ISO time or age such as 24h")
+    parser.add_argument("--hook", help="only invocations whose outermost span has this name, "
+                                       "e.g. hook:Stop")
+    parser.add_argument("--slowest", type=int, default=10, help="invocations to list (default: 10)")
+    parser.add_argument("--folded", action="store_true", help="print folded stacks for flamegraph.pl")
+    parser.add_argument("--clear", action="store_true", help="delete every recorded span")
+    args = parser.parse_args(argv)
+
+    tracker = ccnotify.ClaudePromptTracker()
+    try:
+        conn = tracker._connect()
+        if args.clear:
+            with conn:
+                deleted = conn.execute("DELETE FROM trace_span").rowcount
+            print(f"Deleted {deleted} span(s)", file=sys.stderr)
+            return
+        traces = load(conn, args.since, args.hook)
+    finally:
+        tracker.close()
+
+    if not traces:
+        print("No spans recorded; run the hooks with CCNOTIFY_TRACE=1", file=sys.stderr)
+        return
+    tree = fold(traces)
+    if args.folded:
+        for path, (_, _, own) in sorted(tree.items()):
+            sys.stdout.write(f"{';'.join(path)} {own}\n")
+        return
+
+    print_tree(tree)
+    print(f"\nSlowest of {len(traces)} invocation(s):")
+    for root, children in slowest(traces, args.slowest):
+        at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(root[3]))
+        stages = ", ".join(f"{name} {_ms(duration)}" for _, _, name, _, duration, _ in children[:4])
+        print(f"  {at}  {root[2]:<20} {_ms(root[4]):>9}  {stages}")
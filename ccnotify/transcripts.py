@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Incremental index of Claude Code transcripts (~/.claude/projects/*/*.jsonl).
+
+Every file's inode, size, mtime and last fully-read byte offset are kept in
+transcript_file, so a run only reads lines appended since the previous one and
+files that haven't changed cost a single stat. Per session it records the cwd,
+first user message and first/last timestamps, and the message text goes into
+the contentless transcript_fts index in chunks. Deep search is then an index
+lookup instead of a grep over every transcript; every word has to appear
+somewhere in a session's transcript, not in the same chunk.
+
+Usage: ccnotify.py transcripts [--keyword TERMS] [--start DATE] [--end DATE]
+                               [--project REGEX] [--rebuild] [--dir PATH]
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+import ccnotify
+import search
+
+# Indexed text is split into chunks of about this many characters
+CHUNK_CHARS = 64 * 1024
+READ_SIZE = 1024 * 1024
+FIRST_MSG_CHARS = 200
+
+
+def projects_dir():
+    return os.environ.get("CCNOTIFY_PROJECTS_DIR") or os.path.expanduser("~/.claude/projects")
+
+
+def _utc(timestamp):
+    """'2026-02-13T09:15:02.123Z' -> '2026-02-13 09:15:02', the format prompt.created_at uses."""
+    return f"{timestamp[:10]} {timestamp[11:19]}" if timestamp else None
+
+
+def _message_text(entry):
+    """Searchable text of a user or assistant entry: typed text and tool inputs.
+
+    Tool results are skipped; they are mostly file contents and command output
+    that would dominate the index without helping to find a conversation.
+    """
+    content = (entry.get("message") or {}).get("content")
+    if isinstance(content, str):
+        return content
+    parts = []
+    for block in content or ():
+        if not isinstance(block, dict):
+            continue
+        kind = block.get("type")
+        if kind == "text":
+            parts.append(block.get("text") or "")
+        elif kind == "tool_use":
+            parts.append(json.dumps(block.get("input") or {}, ensure_ascii=False))
+    return "\n".join(parts)
+
+
+def _first_user_text(entry):
+    if entry.get("type") != "user" or entry.get("isMeta"):
+        return None
+    content = (entry.get("message") or {}).get("content")
+    if isinstance(content, str):
+        return content
+    for block in content or ():
+        if isinstance(block, dict) and block.get("type") == "text":
+            return block.get("text")
+    return None
+
+
+def _complete_lines(f, offset):
+    """Yield (line, end_offset) for every newline-terminated line after `offset`.
+
+    A trailing line without its newline is still being written; it is left for
+    the next run, which is why the stored offset only advances past full lines.
+    """
+    f.seek(offset)
+    pending = b""
+    position = offset
+    while True:
+        block = f.read(READ_SIZE)
+        if not block:
+            return
+        lines = (pending + block).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            position += len(line) + 1
+            yield line, position
+
+
+class TranscriptIndexer:
+    def __init__(self, conn, root=None):
+        self.conn = conn
+        self.root = root or projects_dir()
+
+    def update(self):
+        """Index whatever changed since the last run; returns (files read, lines indexed)."""
+        known = {
+            row[0]: row[1:] for row in
+            self.conn.execute("SELECT path, inode, size, mtime_ns, offset FROM transcript_file")
+        }
+        files = lines = 0
+        for path in sorted(glob.glob(os.path.join(glob.escape(self.root), "*", "*.jsonl"))):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            state = known.get(path)
+            if state and state[:3] == (st.st_ino, st.st_size, st.st_mtime_ns):
+                continue
+            offset = 0
+            if state and state[0] == st.st_ino and st.st_size >= state[3]:
+                offset = state[3]
+            lines += self._ingest(path, st, offset, rewritten=state is not None and offset == 0)
+            files += 1
+        return files, lines
+
+    def _ingest(self, path, st, offset, rewritten):
+        session_id = os.path.splitext(os.path.basename(path))[0]
+        project_dir = os.path.basename(os.path.dirname(path))
+        session = {"cwd": None, "first_msg": None, "first_at": None, "last_at": None}
+        texts, chunk_start, chunk_size, count = [], offset, 0, 0
+        end = offset
+
+        with self.conn:
+            if rewritten:
+                # The file was replaced or truncated: forget its chunks and start over.
+                # Their postings stay in the contentless index but no longer join to anything.
+                self.conn.execute("DELETE FROM transcript_chunk WHERE path = ?", (path,))
+                self.conn.execute("DELETE FROM transcript_session WHERE session_id = ?",
+                                  (session_id,))
+            with open(path, "rb") as f:
+                for line, end in _complete_lines(f, offset):
+                    count += 1
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if not isinstance(entry, dict):
+                        continue
+                    self._note_session(session, entry)
+                    if entry.get("type") in ("user", "assistant"):
+                        text = _message_text(entry)
+                        if text:
+                            texts.append(text)
+                            chunk_size += len(text)
+                    if chunk_size >= CHUNK_CHARS:
+                        self._add_chunk(session_id, path, chunk_start, end, texts)
+                        texts, chunk_start, chunk_size = [], end, 0
+            if texts:
+                self._add_chunk(session_id, path, chunk_start, end, texts)
+
+            self.conn.execute(
+                """INSERT INTO transcript_session
+                       (session_id, project_dir, cwd, first_msg, first_at, last_at, lines)
+                   VALUES (:session_id, :project_dir, :cwd, :first_msg, :first_at, :last_at, :lines)
+                   ON CONFLICT (session_id) DO UPDATE SET
+                       cwd = COALESCE(cwd, excluded.cwd),
+                       first_msg = COALESCE(first_msg, excluded.first_msg),
+                       first_at = COALESCE(MIN(first_at, excluded.first_at), first_at,
+                                           excluded.first_at),
+                       last_at = COALESCE(MAX(last_at, excluded.last_at), last_at,
+                                          excluded.last_at),
+                       lines = lines + excluded.lines""",
+                {"session_id": session_id, "project_dir": project_dir, "lines": count, **session},
+            )
+            self.conn.execute(
+                """INSERT INTO transcript_file (path, session_id, inode, size, mtime_ns, offset)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (path) DO UPDATE SET inode = excluded.inode,
+                       size = excluded.size, mtime_ns = excluded.mtime_ns,
+                       offset = excluded.offset""",
+                # A half-written last line means the stat no longer matches what was read
+                (path, session_id, st.st_ino, st.st_size if end == st.st_size else -1,
+                 st.st_mtime_ns, end),
+            )
+        return count
+
+    @staticmethod
+    def _note_session(session, entry):
+        if session["cwd"] is None and entry.get("cwd"):
+            session["cwd"] = entry["cwd"]
+        if session["first_msg"] is None:
+            text = _first_user_text(entry)
+            if text:
+                session["first_msg"] = text[:FIRST_MSG_CHARS]
+        at = _utc(entry.get("timestamp"))
+        if at:
+            if session["first_at"] is None or at < session["first_at"]:
+                session["first_at"] = at
+            if session["last_at"] is None or at > session["last_at"]:
+                session["last_at"] = at
+
+    def _add_chunk(self, session_id, path, start, end, texts):
+        chunk_id = self.conn.execute(
+            """INSERT INTO transcript_chunk (session_id, path, start_offset, end_offset)
+               VALUES (?, ?, ?, ?) RETURNING id""",
+            (session_id, path, start, end),
+        ).fetchone()[0]
+        self.conn.execute("INSERT INTO transcript_fts (rowid, text) VALUES (?, ?)",
+                          (chunk_id, "\n".join(texts)))
+
+    def rebuild(self):
+        """Drop the whole index and read every transcript from the start."""
+        with self.conn:
+            self.conn.execute("INSERT INTO transcript_fts (transcript_fts) VALUES ('delete-all')")
+            for table in ("transcript_chunk", "transcript_session", "transcript_file"):
+                self.conn.execute(f"DELETE FROM {table}")
+        return self.update()
+
+
+def deep_search(conn, keyword=None, start=None, end=None, project=None):
+    """Sessions whose transcripts match, newest activity last, in search.py's result shape."""
+    since, until = search.utc_bounds(start, end)
+    clauses, params = [], []
+    if keyword is not None:
+        # A transcript is indexed as separate chunks, so each word is matched on its own
+        # and the sessions intersected: the words may fall in different chunks
+        words = [search.fts_query(word) for word in re.findall(r"\w+", keyword)]
+        if not words:
+            return []
+        matches = " INTERSECT ".join(
+            """SELECT c.session_id FROM transcript_fts AS f JOIN transcript_chunk AS c ON c.id = f.rowid
+               WHERE transcript_fts MATCH ?""" for _ in words
+        )
+        clauses.append(f"s.session_id IN ({matches})")
+        params.extend(words)
+    if since:
+        clauses.append("s.last_at >= ?")
+        params.append(since)
+    if until:
+        clauses.append("s.first_at < ?")
+        params.append(until)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    regex = re.compile(project, re.IGNORECASE) if project else None
+    results = []
+    for session_id, cwd, first_msg, last_at in conn.execute(
+        f"""SELECT s.session_id, s.cwd, s.first_msg, s.last_at FROM transcript_session AS s
+            {where} ORDER BY s.last_at""",
+        params,
+    ):
+        if regex and not regex.search(cwd or ""):
+            continue
+        if last_at:
+            results.append(search.session_result(session_id, cwd, last_at, first_msg, 1,
+                                                 source="deep"))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ccnotify.py transcripts",
+                                     description="Update and search the transcript index.")
+    parser.add_argument("--keyword", help="words that must all appear (prefix match)")
+    parser.add_argument("--start", help="first local date, YYYY-MM-DD (inclusive)")
+    parser.add_argument("--end", help="last local date, YYYY-MM-DD (inclusive)")
+    parser.add_argument("--project", help="case-insensitive regex on the working directory")
+    parser.add_argument("--rebuild", action="store_true", help="re-read every transcript")
+    parser.add_argument("--dir", default=projects_dir(), help="default: %(default)s")
+    args = parser.parse_args(argv)
+
+    tracker = ccnotify.ClaudePromptTracker()
+    try:
+        conn = tracker._connect()
+        indexer = TranscriptIndexer(conn, args.dir)
+        started = time.perf_counter()
+        files, lines = indexer.rebuild() if args.rebuild else indexer.update()
+        ccnotify.log.info("transcripts_indexed", files=files, lines=lines,
+                          seconds=round(time.perf_counter() - started, 3))
+        if not (args.keyword or args.start or args.end or args.project):
+            print(f"Indexed {lines} line(s) from {files} changed file(s)", file=sys.stderr)
+            return
+        results = deep_search(conn, args.keyword, args.start, args.end, args.project)
+    finally:
+        tracker.close()
+
+    try:
+        for result in results:
+            sys.stdout.write(json.dumps(result) + "\n")
+    except BrokenPipeError:
+        pass
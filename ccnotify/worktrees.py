@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Worktree registry and port allocator for the worktree-manager skill.
+
+The registry lives in ccnotify.db (worktree and worktree_port), and every
+allocate, release and register is one BEGIN IMMEDIATE transaction, so worktrees
+created in parallel can't be handed the same port. Each allocation reads the
+allocated ports once and scans the pool for the lowest free ones. A port is
+only handed out once binding it in-process succeeds, which catches servers
+started outside the registry.
+
+Ports belong to the machine, not to a repo, so with a per-project CCNOTIFY_DB
+the registry still lives in one database: the {project} shard "_worktrees".
+
+~/.claude/worktree-registry.json stays the view the other skill scripts read
+(status.sh, sync.sh, cleanup.sh). It is rewritten atomically after every
+change, and edits those scripts make to it are imported before the next one.
+
+allocate-ports.sh, release-ports.sh and register.sh are thin wrappers around:
+
+Usage: ccnotify.py worktree [--config PATH] [--registry PATH] allocate [COUNT]
+       ccnotify.py worktree [...] release PORT [PORT ...]
+       ccnotify.py worktree [...] register PROJECT BRANCH SLUG PATH REPO PORTS [TASK]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import socket
+import sys
+import time
+
+import ccnotify
+
+PORT_START = 8100
+PORT_END = 8199
+DEFAULT_CONFIG = os.path.expanduser("~/.claude/skills/worktree-manager/config.json")
+# {project} shard of a per-project CCNOTIFY_DB that holds the registry for every repo
+REGISTRY_SHARD = "_worktrees"
+
+# Registry fields, in the order register.sh wrote them: JSON key -> column
+FIELDS = {
+    "id": "id",
+    "project": "project",
+    "repoPath": "repo_path",
+    "branch": "branch",
+    "branchSlug": "branch_slug",
+    "worktreePath": "worktree_path",
+    "ports": "ports",
+    "createdAt": "created_at",
+    "validatedAt": "validated_at",
+    "agentLaunchedAt": "agent_launched_at",
+    "task": "task",
+    "prNumber": "pr_number",
+    "status": "status",
+}
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+def free_ports(start, end, taken):
+    """Ports in [start, end] not in `taken`, lowest first."""
+    taken = set(taken)
+    return (port for port in range(start, end + 1) if port not in taken)
+
+
+def port_free(port):
+    """True when nothing listens on the port, found by binding it ourselves."""
+    import errno
+
+    probes = [(socket.AF_INET, "0.0.0.0"), (socket.AF_INET, "127.0.0.1")]
+    if socket.has_ipv6:
+        probes.append((socket.AF_INET6, "::1"))
+    for family, host in probes:
+        try:
+            with socket.socket(family, socket.SOCK_STREAM) as sock:
+                sock.bind((host, port))
+        except OSError as e:
+            if e.errno == errno.EADDRINUSE:
+                return False
+            # Anything else (no IPv6 loopback, say) says nothing about the port
+    return True
+
+
+def load_config(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class Registry:
+    def __init__(self, conn, path, start=PORT_START, end=PORT_END, probe=port_free):
+        self.conn = conn
+        self.path = path
+        self.start = start
+        self.end = end
+        self.probe = probe
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """BEGIN IMMEDIATE on self.conn, picking up edits other scripts made to the JSON file
+        first and rewriting it before the commit."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._import()
+            yield self.conn
+            self._export()
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return f"{st.st_mtime_ns}:{st.st_size}:{st.st_ino}"
+
+    def _import(self):
+        """Replace the tables with the JSON file if something else changed it since our export."""
+        stat = self._stat()
+        row = self.conn.execute("SELECT stat FROM worktree_export WHERE path = ?", (self.path,)).fetchone()
+        if stat is None or (row and row[0] == stat):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            ccnotify.log.warning("worktree_registry_unreadable", path=self.path, error=str(e))
+            return
+        now = time.time()
+        self.conn.execute("DELETE FROM worktree")
+        self.conn.execute("DELETE FROM worktree_port")
+        for entry in data.get("worktrees") or []:
+            self._insert(entry)
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO worktree_port (port, allocated_at) VALUES (?, ?)",
+            [(int(port), now) for port in (data.get("portPool") or {}).get("allocated") or []],
+        )
+        ccnotify.log.info("worktree_registry_imported", path=self.path)
+
+    def _insert(self, entry):
+        import uuid
+
+        entry = dict(entry)
+        entry["id"] = entry.get("id") or str(uuid.uuid4())
+        entry["ports"] = ",".join(str(port) for port in entry.get("ports") or [])
+        entry.setdefault("status", "active")
+        self.conn.execute(
+            f"""INSERT OR REPLACE INTO worktree ({", ".join(FIELDS.values())})
+                VALUES ({", ".join("?" * len(FIELDS))})""",
+            [entry.get(key) for key in FIELDS],
+        )
+
+    def snapshot(self):
+        """The registry in worktree-registry.json's shape."""
+        worktrees = []
+        for row in self.conn.execute(
+            f"SELECT {', '.join(FIELDS.values())} FROM worktree ORDER BY rowid"
+        ):
+            entry = dict(zip(FIELDS, row))
+            entry["ports"] = [int(port) for port in entry["ports"].split(",") if port]
+            worktrees.append(entry)
+        allocated = [port for (port,) in self.conn.execute("SELECT port FROM worktree_port ORDER BY port")]
+        return {"worktrees": worktrees,
+                "portPool": {"start": self.start, "end": self.end, "allocated": allocated}}
+
+    def _export(self):
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        os.replace(tmp, self.path)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO worktree_export (path, stat) VALUES (?, ?)", (self.path, self._stat())
+        )
+
+    def allocate(self, count):
+        """Allocate `count` ports, lowest first; raises PoolExhausted without allocating any."""
+        with self._transaction() as conn:
+            taken = [port for (port,) in conn.execute("SELECT port FROM worktree_port")]
+            free = free_ports(self.start, self.end, taken)
+            ports = []
+            while len(ports) < count:
+                port = next(free, None)
+                if port is None:
+                    raise PoolExhausted(
+                        f"Could not find {count} available ports in range {self.start}-{self.end}"
+                        + (f" (found only: {' '.join(map(str, ports))})" if ports else "")
+                    )
+                if self.probe(port):
+                    ports.append(port)
+            conn.executemany("INSERT INTO worktree_port (port, allocated_at) VALUES (?, ?)",
+                             [(port, time.time()) for port in ports])
+        return ports
+
+    def release(self, ports):
+        """Return ports to the pool; returns those that were allocated."""
+        with self._transaction() as conn:
+            released = [port for port in ports if conn.execute(
+                "DELETE FROM worktree_port WHERE port = ?", (port,)).rowcount]
+        return released
+
+    def register(self, project, branch, branch_slug, worktree_path, repo_path, ports, task=None):
+        """Add a worktree, replacing (and releasing the ports of) an earlier one for the branch.
+
+        Returns the ports released from the entry it replaced, or None if it is new.
+        """
+        with self._transaction() as conn:
+            old = conn.execute("SELECT ports FROM worktree WHERE project = ? AND branch = ?",
+                               (project, branch)).fetchone()
+            released = None
+            if old:
+                released = [int(port) for port in old[0].split(",") if port]
+                conn.executemany("DELETE FROM worktree_port WHERE port = ?", [(p,) for p in released])
+                conn.execute("DELETE FROM worktree WHERE project = ? AND branch = ?", (project, branch))
+            self._insert({
+                "project": project,
+                "repoPath": repo_path,
+                "branch": branch,
+                "branchSlug": branch_slug,
+                "worktreePath": worktree_path,
+                "ports": ports,
+                "createdAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "task": task or None,
+                "status": "active",
+            })
+            conn.executemany("INSERT OR IGNORE INTO worktree_port (port, allocated_at) VALUES (?, ?)",
+                             [(port, time.time()) for port in ports])
+        return released
+
+
+def _ports(value):
+    return [int(port) for port in value.replace(",", " ").split()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ccnotify.py worktree",
+                                     description="Worktree registry and port allocator.")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="worktree-manager config.json")
+    parser.add_argument("--registry", help="JSON registry (default: registryPath from the config)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    allocate = commands.add_parser("allocate", help="allocate ports; prints them space-separated")
+    allocate.add_argument("count", nargs="?", type=int, default=2)
+    release = commands.add_parser("release", help="return ports to the pool")
+    release.add_argument("ports", nargs="+")
+    register = commands.add_parser("register", help="record a worktree")
+    for name in ("project", "branch", "branch_slug", "worktree_path", "repo_path", "ports"):
+        register.add_argument(name)
+    register.add_argument("task", nargs="?", default="")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    pool = config.get("portPool") or {}
+    path = os.path.expanduser(args.registry or os.environ.get("WORKTREE_REGISTRY")
+                              or config.get("registryPath") or "~/.claude/worktree-registry.json")
+
+    tracker = ccnotify.ClaudePromptTracker(storage=ccnotify.Storage.from_env(project=REGISTRY_SHARD))
+    try:
+        registry = Registry(tracker._connect(), path, pool.get("start", PORT_START),
+                            pool.get("end", PORT_END))
+        if args.command == "allocate":
+            if args.count < 1:
+                parser.error("count must be a positive integer")
+            try:
+                print(" ".join(map(str, registry.allocate(args.count))))
+            except PoolExhausted as e:
+                print(f"Error: {e}", file=sys.stderr)
+                sys.exit(1)
+        elif args.command == "release":
+            valid = []
+            for port in args.ports:
+                if port.isdigit():
+                    valid.append(int(port))
+                else:
+                    print(f"Warning: Invalid port number: {port}", file=sys.stderr)
+            released = registry.release(valid)
+            ccnotify.log.info("ports_released", ports=released)
+            print(f"Released ports: {' '.join(map(str, valid))}" if valid else "No ports released")
+        else:
+            ports = _ports(args.ports)
+            worktree_path = os.path.expanduser(args.worktree_path)
+            released = registry.register(args.project, args.branch, args.branch_slug, worktree_path,
+                                         os.path.expanduser(args.repo_path), ports, args.task)
+            if released is not None:
+                print("Warning: Worktree already registered, updating...")
+                if released:
+                    print(f"   Released old ports: {' '.join(map(str, released))}")
+            print("✅ Registered worktree:")
+            print(f"   Project: {args.project}")
+            print(f"   Branch: {args.branch}")
+            print(f"   Path: {worktree_path}")
+            print(f"   Ports: {args.ports}")
+            if args.task:
+                print(f"   Task: {args.task}")
+    finally:
+        tracker.close()
@@ -7,7 +7,7 @@ SCRIPT_POLLER_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 if [ -f "$SCRIPT_POLLER_DIR/.env" ]; then
     source "$SCRIPT_POLLER_DIR/.env"
 fi
-LINEAR_API_URL="https://api.linear.app/graphql"
+LINEAR_API_URL="${LINEAR_API_URL:-https://api.linear.app/graphql}"
 
 # Label names (applied/removed via MCP)
 AI_LABEL_IN_PROGRESS="ai-in-progress"
@@ -19,6 +19,9 @@ DEFAULT_REPO="$HOME/qz/toocan-app"
 # Worktree base directory (only used in --local mode)
 WORKTREE_DIR="$HOME/worktrees-claude"
 
+# Tickets launched at once by poll.sh
+LINEAR_CONCURRENCY=4
+
 # Timeout for claude worker (in seconds) — 30 minutes
 WORKER_TIMEOUT=1800
 
@@ -4,6 +4,7 @@
 
 HISTORY_FILE="$HOME/.claude/history.jsonl"
 PROJECTS_DIR="$HOME/.claude/projects"
+CCNOTIFY="$HOME/.claude/ccnotify/ccnotify.py"
 TZ_OFFSET=$(date +%z | awk '{h=substr($0,1,3)+0; m=substr($0,4,2)+0; print (h*3600)+(m*60)}')
 
 START=""
@@ -40,9 +41,20 @@ get_cwd() {
   jq -r 'select(.cwd) | .cwd' "$transcript_file" 2>/dev/null | head -1
 }
 
-# Primary search: history.jsonl
+# Primary search: history.jsonl. ccnotify bisects the file for the date range
+# instead of running every line through jq
 run_history_search() {
   local results
+  if [[ -f "$CCNOTIFY" ]]; then
+    local args=()
+    [[ -n "$START" && -n "$END" ]] && args+=(--start "$START" --end "$END")
+    [[ -n "$KEYWORD" ]] && args+=(--keyword "$KEYWORD")
+    [[ -n "$PROJECT" ]] && args+=(--project "$PROJECT")
+    if results=$(python3 "$CCNOTIFY" history --file "$HISTORY_FILE" "${args[@]}" 2>/dev/null); then
+      echo "$results"
+      return
+    fi
+  fi
   if [[ -n "$KEYWORD" ]]; then
     results=$(grep -i "$KEYWORD" "$HISTORY_FILE" | jq -s --argjson tz "$TZ_OFFSET" "
       [.[] | $FILTER] | group_by(.sessionId) | map({
@@ -71,9 +83,14 @@ run_history_search() {
   echo "$results"
 }
 
-# Deep search: grep transcript files for keyword
+# Deep search: look the keyword up in ccnotify's transcript index (updated on the
+# way), or grep transcript files for it when ccnotify isn't installed
 run_deep_search() {
   local keyword="$1"
+  if [[ -f "$CCNOTIFY" ]] && python3 "$CCNOTIFY" transcripts --keyword "$keyword" 2>/dev/null; then
+    return
+  fi
+
   local files
   files=$(grep -rli "$keyword" "$PROJECTS_DIR"/*/*.jsonl 2>/dev/null | head -10)
 
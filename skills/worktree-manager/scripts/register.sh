@@ -34,92 +34,9 @@ if [ -z "$PROJECT" ] || [ -z "$BRANCH" ] || [ -z "$BRANCH_SLUG" ] || [ -z "$WORK
     exit 1
 fi
 
-REGISTRY="${HOME}/.claude/worktree-registry.json"
+SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
+CCNOTIFY="${CCNOTIFY:-$HOME/.claude/ccnotify/ccnotify.py}"
 
-# Check jq is available
-if ! command -v jq &> /dev/null; then
-    echo "Error: jq is required. Install with: brew install jq"
-    exit 1
-fi
-
-# Expand ~ in paths
-WORKTREE_PATH="${WORKTREE_PATH/#\~/$HOME}"
-REPO_PATH="${REPO_PATH/#\~/$HOME}"
-
-# Initialize registry if it doesn't exist
-if [ ! -f "$REGISTRY" ]; then
-    mkdir -p "$(dirname "$REGISTRY")"
-    cat > "$REGISTRY" << 'EOF'
-{
-  "worktrees": [],
-  "portPool": {
-    "start": 8100,
-    "end": 8199,
-    "allocated": []
-  }
-}
-EOF
-fi
-
-# Check if already registered - release old ports before updating
-if jq -e ".worktrees[] | select(.project == \"$PROJECT\" and .branch == \"$BRANCH\")" "$REGISTRY" > /dev/null 2>&1; then
-    echo "Warning: Worktree already registered, updating..."
-
-    # Get old ports to release them
-    OLD_PORTS=$(jq -r ".worktrees[] | select(.project == \"$PROJECT\" and .branch == \"$BRANCH\") | .ports[]" "$REGISTRY" 2>/dev/null || echo "")
-
-    TMP=$(mktemp)
-    # Remove old entry
-    jq "del(.worktrees[] | select(.project == \"$PROJECT\" and .branch == \"$BRANCH\"))" "$REGISTRY" > "$TMP"
-
-    # Release old ports from pool
-    if [ -n "$OLD_PORTS" ]; then
-        for OLD_PORT in $OLD_PORTS; do
-            jq ".portPool.allocated = (.portPool.allocated | map(select(. != $OLD_PORT)))" "$TMP" > "${TMP}.2" && mv "${TMP}.2" "$TMP"
-        done
-        echo "   Released old ports: $OLD_PORTS"
-    fi
-
-    mv "$TMP" "$REGISTRY"
-fi
-
-# Parse ports into JSON array
-PORTS_JSON=$(echo "$PORTS" | tr ',' '\n' | jq -R 'tonumber' | jq -s .)
-
-# Format task
-if [ -n "$TASK" ]; then
-    TASK_JSON="\"$TASK\""
-else
-    TASK_JSON="null"
-fi
-
-# Generate UUID
-UUID=$(uuidgen 2>/dev/null || cat /proc/sys/kernel/random/uuid 2>/dev/null || echo "wt-$(date +%s)-$$")
-
-# Add entry
-TIMESTAMP=$(date -u +"%Y-%m-%dT%H:%M:%SZ")
-TMP=$(mktemp)
-jq ".worktrees += [{
-    \"id\": \"$UUID\",
-    \"project\": \"$PROJECT\",
-    \"repoPath\": \"$REPO_PATH\",
-    \"branch\": \"$BRANCH\",
-    \"branchSlug\": \"$BRANCH_SLUG\",
-    \"worktreePath\": \"$WORKTREE_PATH\",
-    \"ports\": $PORTS_JSON,
-    \"createdAt\": \"$TIMESTAMP\",
-    \"validatedAt\": null,
-    \"agentLaunchedAt\": null,
-    \"task\": $TASK_JSON,
-    \"prNumber\": null,
-    \"status\": \"active\"
-}]" "$REGISTRY" > "$TMP" && mv "$TMP" "$REGISTRY"
-
-echo "✅ Registered worktree:"
-echo "   Project: $PROJECT"
-echo "   Branch: $BRANCH"
-echo "   Path: $WORKTREE_PATH"
-echo "   Ports: $PORTS"
-if [ -n "$TASK" ]; then
-    echo "   Task: $TASK"
-fi
+# Re-registering a branch replaces its entry and releases its old ports
+exec python3 "$CCNOTIFY" worktree --config "$SCRIPT_DIR/../config.json" \
+    register "$PROJECT" "$BRANCH" "$BRANCH_SLUG" "$WORKTREE_PATH" "$REPO_PATH" "$PORTS" "$TASK"